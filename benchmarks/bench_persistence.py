@@ -0,0 +1,91 @@
+"""Per-message persistence cost: the old whole-file JSON saves vs the SQLite write-behind stores.
+
+Every message used to call save_levels() and save_activity(), which rewrote
+levels.json and activity_log.json in full. Now a message updates one row in
+memory and marks it dirty, and the Persistence cog writes the dirty rows in
+one transaction every FLUSH_INTERVAL_SECONDS.
+
+    python benchmarks/bench_persistence.py [users ...]
+
+Runs in a scratch directory, so no bot data is touched.
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="floofbot-bench-"))
+
+from cogs.activity import ActivityCounter, day_number, encode_activity, decode_activity
+from cogs.persistence import persistence
+
+GUILD_ID = "1"
+
+# Timestamps each user has in the legacy activity log
+LEGACY_TIMESTAMPS = 5
+
+# Messages between two flushes of the write-behind stores
+MESSAGES_PER_FLUSH = 2000
+
+def legacy_cost(users, messages):
+    """Seconds per message for the old path: update the dicts, then rewrite both files."""
+    now = time.time()
+    levels_data = {GUILD_ID: {str(user): {"xp": user % 250, "level": user % 40} for user in range(users)}}
+    activity_data = {GUILD_ID: {str(user): [now - i * 3600 for i in range(LEGACY_TIMESTAMPS)] for user in range(users)}}
+
+    def save_levels():
+        with open('levels.json', 'w') as f:
+            json.dump(levels_data, f, indent=4)
+
+    def save_activity():
+        with open('activity_log.json', 'w') as f:
+            json.dump(activity_data, f, indent=4)
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        user_id = str(random.randrange(users))
+        levels_data[GUILD_ID][user_id]["xp"] += 10
+        save_levels()
+        activity_data[GUILD_ID][user_id].append(time.time())
+        save_activity()
+    return (time.perf_counter() - start) / messages
+
+def store_cost(users, messages):
+    """Seconds per message for the stores: mark the rows dirty, flushing every MESSAGES_PER_FLUSH messages."""
+    today = day_number()
+    levels = persistence.register(f'bench_levels_{users}', depth=2)
+    activity = persistence.register(f'bench_activity_{users}', depth=2, encode=encode_activity, decode=decode_activity)
+    levels.data[GUILD_ID] = {str(user): {"xp": user % 250, "level": user % 40} for user in range(users)}
+    activity.data[GUILD_ID] = {str(user): ActivityCounter(today) for user in range(users)}
+    levels.mark_dirty()
+    activity.mark_dirty()
+    persistence.flush_now()  # Initial import, not part of the measurement
+
+    start = time.perf_counter()
+    for message in range(1, messages + 1):
+        user_id = str(random.randrange(users))
+        levels.data[GUILD_ID][user_id]["xp"] += 10
+        levels.mark_dirty(GUILD_ID, user_id)
+        activity.data[GUILD_ID][user_id].record(today)
+        activity.mark_dirty(GUILD_ID, user_id)
+        if message % MESSAGES_PER_FLUSH == 0:
+            persistence.flush_now()
+    persistence.flush_now()
+    return (time.perf_counter() - start) / messages
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"{'users':>10} {'json rewrite':>14} {'sqlite rows':>14} {'speedup':>10}")
+    for users in sizes:
+        # A full rewrite of a million users takes seconds, so sample fewer messages as the files grow
+        legacy = legacy_cost(users, max(2, 200_000 // users))
+        stored = store_cost(users, 20_000)
+        print(f"{users:>10,} {legacy * 1000:>11.2f} ms {stored * 1e6:>11.1f} us {legacy / stored:>9,.0f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Tickets startup cost: the old purge-and-repost panel setup vs re-attaching the saved panel.
+
+The old setup_ticket_channel read the channel's whole history, purged it and
+posted a new panel on every boot. Now the panel's message ID is stored, and
+a boot makes a single fetch_message call unless the panel is gone.
+
+Discord is simulated: every REST call adds REST_LATENCY seconds to a virtual
+clock, history is read 100 messages per request, and purge deletes recent
+messages in bulk and older ones one at a time, the way py-cord does.
+
+    python benchmarks/bench_ticket_startup.py [messages ...]
+
+Runs in a scratch directory.
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="floofbot-bench-"))
+
+import discord
+from cogs.tickets import Tickets, TicketPanelView, TICKET_CHANNEL_ID
+
+# Round trip of one REST request, in seconds
+REST_LATENCY = 0.15
+
+# Messages per history page and per bulk delete
+PAGE_SIZE = 100
+
+# Share of the channel's messages older than 14 days, which can't be bulk deleted
+OLD_MESSAGE_SHARE = 0.5
+
+class Channel:
+    """Ticket channel that counts REST requests instead of making them."""
+
+    id = TICKET_CHANNEL_ID
+    name = "tickets"
+
+    def __init__(self, messages):
+        self.messages = list(range(1, messages + 1))
+        self.requests = 0
+
+    def request(self, count=1):
+        self.requests += count
+
+    async def history(self, limit=None):
+        for start in range(0, len(self.messages), PAGE_SIZE):
+            self.request()
+            for message_id in self.messages[start:start + PAGE_SIZE]:
+                yield SimpleNamespace(id=message_id)
+
+    async def purge(self, limit=None):
+        messages = [message async for message in self.history(limit=limit)]
+        old = int(len(messages) * OLD_MESSAGE_SHARE)
+        self.request(old + -(-(len(messages) - old) // PAGE_SIZE))
+        self.messages = []
+
+    async def fetch_message(self, message_id):
+        self.request()
+        if message_id not in self.messages:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        return SimpleNamespace(id=message_id)
+
+    async def send(self, embed=None, view=None):
+        self.request()
+        message_id = max(self.messages, default=0) + 1
+        self.messages.append(message_id)
+        return SimpleNamespace(id=message_id)
+
+async def legacy_setup(channel):
+    """setup_ticket_channel before the panel was persisted, without its logging."""
+    messages = [message async for message in channel.history(limit=None)]
+    if messages:
+        await channel.purge(limit=None)
+    await channel.send(embed=None, view=TicketPanelView())
+
+def run(messages, setup):
+    channel = Channel(messages)
+    with contextlib.redirect_stdout(io.StringIO()):  # The cog's progress messages
+        asyncio.run(setup(channel))
+    return channel.requests
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1, 100, 1_000]
+    with contextlib.redirect_stdout(io.StringIO()):
+        cog = Tickets(SimpleNamespace(get_channel=lambda channel_id: current.channel))
+    current = SimpleNamespace(channel=None)
+
+    async def reattach(channel):
+        # The panel posted on the previous boot is the newest message in the channel
+        cog.panel_store.data[str(channel.id)] = channel.messages[-1]
+        current.channel = channel
+        await cog.setup_ticket_channel()
+
+    async def repost(channel):
+        cog.panel_store.data[str(channel.id)] = -1  # Deleted by someone
+        current.channel = channel
+        await cog.setup_ticket_channel()
+
+    print(f"{'messages':>10} {'before':>18} {'after':>18} {'panel deleted':>18}")
+    for messages in sizes:
+        results = [run(messages, setup) for setup in (legacy_setup, reattach, repost)]
+        print(f"{messages:>10,} " + " ".join(f"{requests:>5} req {requests * REST_LATENCY:>7.2f} s" for requests in results))
+
+if __name__ == '__main__':
+    main()
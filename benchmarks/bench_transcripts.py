@@ -0,0 +1,134 @@
+"""Ticket transcript cost: the old collect-then-concatenate writer vs the streaming one.
+
+The old Tickets.create_transcript collected the whole channel history into a
+list, then built the HTML with += and three mention regexes per message.
+write_transcript renders messages as the history yields them and writes them
+in batches on a worker thread, so both time and peak memory should be lower.
+
+    python benchmarks/bench_transcripts.py [messages ...]
+
+Messages are generated as the history is read, so the peak memory reported is
+the writer's own. Runs in a scratch directory.
+"""
+
+import asyncio
+import html
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="floofbot-bench-"))
+
+from cogs.transcripts import write_transcript
+
+USERS = [SimpleNamespace(id=1000 + i, name=f"user{i}") for i in range(20)]
+CHANNEL = SimpleNamespace(id=42, name="general")
+ROLE = SimpleNamespace(id=7, name="STAFF")
+
+class Guild:
+    def get_member(self, user_id):
+        return USERS[user_id - 1000] if 1000 <= user_id < 1000 + len(USERS) else None
+
+    def get_channel(self, channel_id):
+        return CHANNEL if channel_id == CHANNEL.id else None
+
+    def get_role(self, role_id):
+        return ROLE if role_id == ROLE.id else None
+
+class Bot:
+    def get_user(self, user_id):
+        return Guild().get_member(user_id)
+
+    def get_channel(self, channel_id):
+        return Guild().get_channel(channel_id)
+
+class Channel:
+    def __init__(self, messages):
+        self.name = "ticket-bench"
+        self.guild = Guild()
+        self.messages = messages
+
+    async def history(self, limit=None, oldest_first=True):
+        start = datetime(2025, 1, 1)
+        for i in range(self.messages):
+            author = USERS[i % len(USERS)]
+            yield SimpleNamespace(
+                author=author,
+                guild=self.guild,
+                created_at=start + timedelta(seconds=i),
+                content=f"Message {i} from <@{author.id}> about <#{CHANNEL.id}>, cc <@&{ROLE.id}>. " + "Some ticket text & details. " * 4,
+                embeds=[],
+                attachments=[],
+            )
+
+async def legacy_transcript(bot, channel, path, user_id, reason, created_at):
+    """Tickets.create_transcript before the streaming writer, minus the unchanged bits."""
+    messages = []
+    async for message in channel.history(limit=None, oldest_first=True):
+        messages.append(message)
+
+    html_content = f"""
+        <!DOCTYPE html>
+        <html>
+        <body>
+            <h1>Ticket Transcript</h1>
+            <p><strong>Channel:</strong> {channel.name}</p>
+            <p><strong>User ID:</strong> {user_id}</p>
+            <p><strong>Reason:</strong> {reason}</p>
+            <p><strong>Created:</strong> {created_at}</p>
+            <hr>
+        """
+
+    for message in messages:
+        content = html.escape(message.content)
+        content = re.sub(r'<@!?(\d+)>', lambda m: f'@{bot.get_user(int(m.group(1))).name}', content)
+        content = re.sub(r'<#(\d+)>', lambda m: f'#{bot.get_channel(int(m.group(1))).name}', content)
+        content = re.sub(r'<@&(\d+)>', lambda m: f'@{message.guild.get_role(int(m.group(1))).name}', content)
+
+        html_content += f"""
+            <div class="message">
+                <div class="user">{message.author.name}</div>
+                <div class="timestamp">{message.created_at.strftime('%Y-%m-%d %H:%M:%S')}</div>
+                <div class="content">{content}</div>
+            """
+        html_content += '</div>'
+
+    html_content += """
+        </body>
+        </html>
+        """
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+def measure(writer, messages):
+    """(seconds, peak traced bytes) for one transcript."""
+    args = (Bot(), Channel(messages), "transcript.html", "1000", "Benchmark", "2025-01-01T00:00:00")
+    start = time.perf_counter()
+    asyncio.run(writer(*args))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    asyncio.run(writer(*args))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000]
+    print(f"{'messages':>10} {'old time':>10} {'new time':>10} {'old peak':>11} {'new peak':>11}")
+    for messages in sizes:
+        old_time, old_peak = measure(legacy_transcript, messages)
+        new_time, new_peak = measure(write_transcript, messages)
+        print(f"{messages:>10,} {old_time * 1000:>7.0f} ms {new_time * 1000:>7.0f} ms "
+              f"{old_peak / 1024 ** 2:>8.1f} MB {new_peak / 1024 ** 2:>8.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -4,95 +4,224 @@
 
 import discord
 from discord.ext import commands, tasks
-import json
-import os
 import time
+from array import array
+from functools import partial
+from cogs.persistence import persistence
+from cogs.ranking import RankIndex
+from cogs.ingest import message_stream
+from cogs.rest import rest_scheduler, COSMETIC
 
 # File to store activity logs
 ACTIVITY_LOG_FILE = 'activity_log.json'
 
+# Number of daily buckets kept per user
+WINDOW_DAYS = 30
+
+# Windows /activity can rank by, in days
+ACTIVITY_WINDOWS = (1, 7, 30)
+
+def day_number(timestamp=None):
+    """Days since the epoch (UTC) for a timestamp, defaulting to now."""
+    return int((time.time() if timestamp is None else timestamp) // 86400)
+
+class ActivityCounter:
+    """Ring of per-day message counts for one user, covering the last WINDOW_DAYS days."""
+
+    __slots__ = ('last_day', 'counts')
+
+    def __init__(self, last_day, counts=None):
+        self.last_day = last_day  # Day of the newest bucket in the ring
+        self.counts = array('I', counts if counts is not None else [0] * WINDOW_DAYS)
+
+    def advance(self, today):
+        """Rotate the ring forward to today, clearing the buckets of days that fell out."""
+        gap = today - self.last_day
+        if gap <= 0:
+            return
+        for day in range(self.last_day + 1, self.last_day + 1 + min(gap, WINDOW_DAYS)):
+            self.counts[day % WINDOW_DAYS] = 0
+        self.last_day = today
+
+    def record(self, today, amount=1):
+        self.advance(today)
+        self.counts[today % WINDOW_DAYS] += amount
+
+    def total(self, today, days=WINDOW_DAYS):
+        """Messages sent in the last `days` days, counting today."""
+        first_day = max(today - days + 1, self.last_day - WINDOW_DAYS + 1)
+        return sum(self.counts[day % WINDOW_DAYS] for day in range(first_day, min(today, self.last_day) + 1))
+
+    def count_on(self, day):
+        """Messages sent on a single day, if that day is still in the ring."""
+        if self.last_day - WINDOW_DAYS < day <= self.last_day:
+            return self.counts[day % WINDOW_DAYS]
+        return 0
+
+    def expired(self, today):
+        return today - self.last_day >= WINDOW_DAYS
+
+    def to_json(self):
+        return {"day": self.last_day, "counts": self.counts.tolist()}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["day"], data["counts"])
+
+    @classmethod
+    def from_timestamps(cls, timestamps, today):
+        """Build a counter from the legacy list-of-timestamps format."""
+        counter = cls(today)
+        for ts in timestamps:
+            day = day_number(ts)
+            if 0 <= today - day < WINDOW_DAYS:
+                counter.counts[day % WINDOW_DAYS] += 1
+        return counter
+
+class ActivityWindows:
+    """Rolling message counts and rankings for each activity window of one guild.
+
+    Counts are bumped as messages arrive; when the day changes only the users
+    who were active on the day leaving a window have their counts reduced.
+    """
+
+    def __init__(self, guild_activity, today):
+        self.guild_activity = guild_activity
+        self.rebuild(today)
+
+    def rebuild(self, today):
+        self.today = today
+        self.rankings = {}  # Window length in days -> RankIndex of (count,)
+        for days in ACTIVITY_WINDOWS:
+            totals = ((user_id, counter.total(today, days)) for user_id, counter in self.guild_activity.items())
+            self.rankings[days] = RankIndex((user_id, (total,)) for user_id, total in totals if total)
+        self.active_users = {}  # Day -> users who sent messages that day
+        for user_id, counter in self.guild_activity.items():
+            for day in range(today - WINDOW_DAYS + 1, today + 1):
+                if counter.count_on(day):
+                    self.active_users.setdefault(day, set()).add(user_id)
+
+    def roll(self, today):
+        """Expire the days that have left each window since the last call."""
+        if today <= self.today:
+            return
+        if today - self.today >= WINDOW_DAYS:
+            self.rebuild(today)
+            return
+        # Counters only advance after a roll, so the buckets being expired are still intact
+        for day in range(self.today + 1, today + 1):
+            for days, ranking in self.rankings.items():
+                expired_day = day - days
+                for user_id in self.active_users.get(expired_day, ()):
+                    counter = self.guild_activity.get(user_id)
+                    amount = counter.count_on(expired_day) if counter else 0
+                    remaining = ranking.scores.get(user_id, (0,))[0] - amount
+                    if remaining > 0:
+                        ranking.update(user_id, (remaining,))
+                    else:
+                        ranking.discard(user_id)
+            self.active_users.pop(day - WINDOW_DAYS, None)
+        self.today = today
+
+    def forget(self, user_id):
+        """Drop a user whose activity has been deleted from every ranking."""
+        for ranking in self.rankings.values():
+            ranking.discard(user_id)
+        for users in self.active_users.values():
+            users.discard(user_id)
+
+    def record(self, user_id, counter, today):
+        self.roll(today)
+        counter.record(today)
+        for ranking in self.rankings.values():
+            ranking.update(user_id, (ranking.scores.get(user_id, (0,))[0] + 1,))
+        self.active_users.setdefault(today, set()).add(user_id)
+
+def encode_activity(value):
+    if isinstance(value, ActivityCounter):
+        return value.to_json()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def decode_activity(value):
+    # Rows imported from the old activity_log.json are raw timestamp lists
+    if isinstance(value, list):
+        return ActivityCounter.from_timestamps(value, day_number())
+    return ActivityCounter.from_json(value)
+
 # Load or initialize activity data
-if os.path.exists(ACTIVITY_LOG_FILE):
-    with open(ACTIVITY_LOG_FILE, 'r') as f:
-        activity_data = json.load(f)
-else:
-    activity_data = {}
+activity_store = persistence.register('activity', depth=2, legacy_file=ACTIVITY_LOG_FILE, encode=encode_activity, decode=decode_activity)
+activity_data = activity_store.data
 
-# Function to save activity data
-def save_activity():
-    with open(ACTIVITY_LOG_FILE, 'w') as f:
-        json.dump(activity_data, f, indent=4)
+# Function to save a user's activity (written back by the persistence service)
+def save_activity(guild_id, user_id):
+    activity_store.mark_dirty(guild_id, user_id)
 
 class Activity(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.windows = {}  # Guild ID -> ActivityWindows
+        message_stream.subscribe(self.ingest_batch)
+        activity_store.subscribe(self.windows.clear)
         self.cleanup_activity.start()  # Start the cleanup task
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.author.bot:
-            return
+    def cog_unload(self):
+        message_stream.unsubscribe(self.ingest_batch)
+        activity_store.unsubscribe(self.windows.clear)
+        self.cleanup_activity.cancel()
 
-        guild_id = str(message.guild.id)
-        user_id = str(message.author.id)
+    def get_windows(self, guild_id, today):
+        """Get the guild's rolling activity windows, building them on first use."""
+        if guild_id not in self.windows:
+            self.windows[guild_id] = ActivityWindows(activity_data.setdefault(guild_id, {}), today)
+        windows = self.windows[guild_id]
+        windows.roll(today)
+        return windows
 
-        # Initialize guild data if it doesn't exist
-        if guild_id not in activity_data:
-            activity_data[guild_id] = {}
+    async def ingest_batch(self, events):
+        """Log a batch of messages from the ingest stream."""
+        today = day_number()
+        for event in events:
+            guild_id = event.guild_id
+            user_id = event.user_id
 
-        # Initialize user data if it doesn't exist
-        if user_id not in activity_data[guild_id]:
-            activity_data[guild_id][user_id] = []
+            # Initialize guild data if it doesn't exist
+            if guild_id not in activity_data:
+                activity_data[guild_id] = {}
 
-        # Log the message with a timestamp
-        activity_data[guild_id][user_id].append(time.time())
+            # Initialize user data if it doesn't exist
+            windows = self.get_windows(guild_id, today)
+            if user_id not in activity_data[guild_id]:
+                activity_data[guild_id][user_id] = ActivityCounter(today)
 
-        # Save activity data
-        save_activity()
+            # Count the message in today's bucket and in every window ranking
+            windows.record(user_id, activity_data[guild_id][user_id], today)
+
+            # Save activity data
+            save_activity(guild_id, user_id)
 
     @commands.slash_command()
-    async def activity(self, ctx: discord.ApplicationContext):
-        """Check the activity of users in the last 30 days."""
+    async def activity(self, ctx: discord.ApplicationContext, days: discord.Option(int, "Window to rank by", choices=list(ACTIVITY_WINDOWS), default=WINDOW_DAYS)):
+        """Check the activity of users in the last 1, 7 or 30 days."""
         guild_id = str(ctx.guild.id)
         if guild_id not in activity_data or not activity_data[guild_id]:
             await ctx.respond("No activity logged yet.")
             return
 
-        # Calculate the time threshold for 30 days ago
-        time_threshold = time.time() - (30 * 86400)  # 30 days in seconds
-
-        # Count messages in the last 30 days
-        activity_count = {}
-        for user_id, timestamps in activity_data[guild_id].items():
-            # Filter timestamps to only include those within the last 30 days
-            recent_messages = [ts for ts in timestamps if ts > time_threshold]
-            activity_count[user_id] = len(recent_messages)
-
-        # Sort users by activity count
-        sorted_activity = sorted(activity_count.items(), key=lambda x: x[1], reverse=True)
-
-        # Assign ranks
-        ranked_activity = []
-        current_rank = 1
-        previous_count = None
-
-        for index, (user_id, count) in enumerate(sorted_activity):
-            if count != previous_count:
-                current_rank = index + 1  # Update rank only if the count changes
-            ranked_activity.append((user_id, current_rank, count))  # Store user_id, rank, and count
-            previous_count = count  # Update previous_count for the next iteration
+        ranking = self.get_windows(guild_id, day_number()).rankings[days]
+        if not ranking:
+            await ctx.respond(f"No activity logged in the last {days} days.")
+            return
 
         # Pagination logic
         page_size = 10
-        total_pages = (len(ranked_activity) + page_size - 1) // page_size  # Calculate total pages
+        total_pages = (len(ranking) + page_size - 1) // page_size  # Calculate total pages
         current_page = 0
+        title = "Most Active Users Today" if days == 1 else f"Most Active Users in the Last {days} Days"
 
         # Function to create and send the embed for the current page
         async def send_activity_page(page):
-            embed = discord.Embed(title="Most Active Users in the Last 30 Days", color=discord.Color.blue())
-            start_index = page * page_size
-            end_index = start_index + page_size
-            for index, (user_id, rank, count) in enumerate(ranked_activity[start_index:end_index], start=start_index + 1):
+            embed = discord.Embed(title=title, color=discord.Color.blue())
+            for user_id, rank, (count,) in ranking.page(page, page_size):
                 user = ctx.guild.get_member(int(user_id))
                 nickname = user.display_name if user else "Unknown User"
                 embed.add_field(name=f"{rank}. {nickname}", value=f"{count} messages", inline=False)
@@ -117,13 +246,13 @@ class Activity(commands.Cog):
                 reaction, user = await self.bot.wait_for("reaction_add", timeout=60.0, check=check)
                 if str(reaction.emoji) == "◀️" and current_page > 0:
                     current_page -= 1
-                    await message.edit(embed=await send_activity_page(current_page))
+                    rest_scheduler.schedule(partial(message.edit, embed=await send_activity_page(current_page)), "message_edit", message.channel.id, key=("edit", message.id), lane=COSMETIC)
                 elif str(reaction.emoji) == "▶️" and current_page < total_pages - 1:
                     current_page += 1
-                    await message.edit(embed=await send_activity_page(current_page))
+                    rest_scheduler.schedule(partial(message.edit, embed=await send_activity_page(current_page)), "message_edit", message.channel.id, key=("edit", message.id), lane=COSMETIC)
 
                 # Remove the user's reaction
-                await message.remove_reaction(reaction, user)
+                rest_scheduler.schedule(partial(message.remove_reaction, reaction, user), "reactions", message.channel.id, lane=COSMETIC)
 
             except Exception as e:
                 print(f"Error during reaction handling: {e}")
@@ -131,24 +260,19 @@ class Activity(commands.Cog):
 
     @tasks.loop(hours=2)  # Run every 2 hours
     async def cleanup_activity(self):
-        """Cleanup activity logs older than 30 days and remove users with no activity."""
+        """Remove users with no activity in the last 30 days."""
+        today = day_number()
         for guild_id in list(activity_data.keys()):
-            time_threshold = time.time() - (30 * 86400)  # 30 days in seconds
+            # Old days drop out of each ring lazily, so only fully expired users need work here
+            users_to_remove = [user_id for user_id, counter in activity_data[guild_id].items() if counter.expired(today)]
 
-            # Remove old timestamps and users with no messages left
-            users_to_remove = []
-            for user_id in list(activity_data[guild_id].keys()):
-                # Filter timestamps to only include those within the last 30 days
-                activity_data[guild_id][user_id] = [ts for ts in activity_data[guild_id][user_id] if ts > time_threshold]
-                if not activity_data[guild_id][user_id]:  # If no messages left, mark user for removal
-                    users_to_remove.append(user_id)
-
-            # Remove users with no activity
+            # Remove users with no activity, and from the rankings that were counting them
+            windows = self.windows.get(guild_id)
             for user_id in users_to_remove:
                 del activity_data[guild_id][user_id]
-
-            # Save cleaned activity data
-            save_activity()
+                save_activity(guild_id, user_id)
+                if windows:
+                    windows.forget(user_id)
 
     @cleanup_activity.before_loop
     async def before_cleanup_activity(self):
@@ -0,0 +1,189 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from cogs.hashing import file_sha256
+from cogs.persistence import persistence
+
+# Where cached tracks are kept
+AUDIO_CACHE_DIR = "audio-cache"
+
+# Most disk space the cache may use; 0 turns the cache off
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Plays before a track is downloaded into the cache
+CACHE_AFTER_PLAYS = 3
+
+# Tracks downloaded at once
+CACHE_DOWNLOADS = 1
+
+# Longest a single download may take, in seconds
+DOWNLOAD_TIMEOUT = 600
+
+# Play counts of tracks that aren't cached are dropped after this many days without a play
+PLAY_COUNT_RETENTION_DAYS = 30
+
+# Most uncached tracks whose play counts are kept; the least recently played go first
+MAX_PLAY_COUNTS = 10000
+
+def ffmpeg_headers(stream):
+    """FFmpeg input options sending the HTTP headers yt-dlp says a stream URL needs."""
+    headers = stream.get('http_headers')
+    if not headers:
+        return []
+    return ["-headers", "".join(f"{name}: {value}\r\n" for name, value in headers.items())]
+
+class AudioCache:
+    """On-disk Opus copies of frequently played tracks, evicted least recently used first.
+
+    Files are named after the video ID and the SHA-256 of their contents. Play
+    counts and the file index live in the 'audio_cache' store, so the cache
+    survives restarts.
+    """
+
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.store = persistence.register('audio_cache')
+        self.entries = self.store.data  # Video ID -> {"plays", "last_played", "file", "hash", "size", "last_used"}
+        # Cached video IDs, least recently used first
+        self.lru = OrderedDict(
+            (video_id, entry["size"])
+            for video_id, entry in sorted(self.entries.items(), key=lambda item: item[1].get("last_used", 0))
+            if entry.get("file")
+        )
+        self.total_bytes = sum(self.lru.values())
+        self.downloads = set()  # Video IDs being downloaded
+        self.download_slots = asyncio.Semaphore(CACHE_DOWNLOADS)
+        self.hits = 0
+        self.misses = 0
+        self.downloaded = 0
+        self.download_failures = 0
+        self.evictions = 0
+        self.pruned = 0
+        if self.max_bytes:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def __contains__(self, video_id):
+        entry = self.entries.get(video_id)
+        return bool(entry and entry.get("file"))
+
+    def lookup(self, video_id):
+        """Path of the cached copy of a track, or None."""
+        if not self.enabled:
+            return None
+        entry = self.entries.get(video_id)
+        if not entry or not entry.get("file"):
+            self.misses += 1
+            return None
+        path = os.path.join(self.directory, entry["file"])
+        if not os.path.exists(path):
+            # Deleted from under us; forget it and let it be downloaded again
+            self.forget(video_id)
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry["last_used"] = time.time()
+        self.lru.move_to_end(video_id)
+        self.store.mark_dirty(video_id)
+        return path
+
+    def record_play(self, video_id):
+        """Count a play and return True once the track has earned a place in the cache."""
+        entry = self.entries.setdefault(video_id, {"plays": 0, "file": None})
+        entry["plays"] += 1
+        entry["last_played"] = time.time()
+        self.store.mark_dirty(video_id)
+        return (
+            self.enabled
+            and not entry["file"]
+            and entry["plays"] >= CACHE_AFTER_PLAYS
+            and video_id not in self.downloads
+        )
+
+    async def populate(self, video_id, stream):
+        """Download a track as Opus into the cache, copying the audio if it already is Opus."""
+        codec = ["-c:a", "copy"] if stream['acodec'] == 'opus' else ["-c:a", "libopus", "-b:a", "128k"]
+        self.downloads.add(video_id)
+        partial = os.path.join(self.directory, f"{video_id}.part")
+        try:
+            async with self.download_slots:
+                process = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-loglevel", "error", "-y",
+                    "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5",
+                    *ffmpeg_headers(stream), "-i", stream['url'], "-vn", *codec, "-f", "opus", partial,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                try:
+                    _, stderr = await asyncio.wait_for(process.communicate(), DOWNLOAD_TIMEOUT)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+                    raise
+                if process.returncode != 0:
+                    raise RuntimeError(stderr.decode(errors='replace').strip() or f"ffmpeg exited with {process.returncode}")
+
+            digest = await asyncio.get_running_loop().run_in_executor(None, file_sha256, partial)
+            filename = f"{video_id}.{digest[:16]}.opus"
+            os.replace(partial, os.path.join(self.directory, filename))
+            self.add(video_id, filename, digest, os.path.getsize(os.path.join(self.directory, filename)))
+            self.downloaded += 1
+        except Exception as e:
+            self.download_failures += 1
+            print(f"Error caching audio for {video_id}: {e}")
+            if os.path.exists(partial):
+                os.remove(partial)
+        finally:
+            self.downloads.discard(video_id)
+
+    def add(self, video_id, filename, digest, size):
+        entry = self.entries.setdefault(video_id, {"plays": 0})
+        entry.update({"file": filename, "hash": digest, "size": size, "last_used": time.time()})
+        self.store.mark_dirty(video_id)
+        self.lru[video_id] = size
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and len(self.lru) > 1:
+            oldest = next(iter(self.lru))
+            self.forget(oldest)
+            self.evictions += 1
+
+    def prune(self, now=None):
+        """Drop the play counts of uncached tracks that haven't been played lately. Returns how many were dropped."""
+        cutoff = (now or time.time()) - PLAY_COUNT_RETENTION_DAYS * 86400
+        uncached = sorted(
+            (entry.get("last_played", 0), video_id)
+            for video_id, entry in self.entries.items()
+            if not entry.get("file") and video_id not in self.downloads
+        )
+        excess = len(uncached) - MAX_PLAY_COUNTS
+        dropped = [video_id for i, (last_played, video_id) in enumerate(uncached) if i < excess or last_played < cutoff]
+        for video_id in dropped:
+            del self.entries[video_id]
+            self.store.mark_dirty(video_id)
+        self.pruned += len(dropped)
+        return len(dropped)
+
+    def forget(self, video_id):
+        """Delete a track's cached file, keeping its play count."""
+        entry = self.entries.get(video_id)
+        if not entry or not entry.get("file"):
+            return
+        path = os.path.join(self.directory, entry["file"])
+        if os.path.exists(path):
+            os.remove(path)
+        self.total_bytes -= self.lru.pop(video_id, 0)
+        entry.update({"file": None, "hash": None, "size": 0})
+        self.store.mark_dirty(video_id)
+
+# Shared cache of every guild's popular tracks
+audio_cache = AudioCache()
@@ -1,34 +1,113 @@
 import discord
 from discord.ext import commands, tasks
-import json
-import os
-from datetime import datetime
+from datetime import datetime, date, time
 import asyncio
+import calendar
+import heapq
 import pytz
+from cogs.persistence import persistence
 
 # File to store birthday data
 BIRTHDAY_FILE = 'birthdays.json'
 
-# Load or initialize birthday data
-if os.path.exists(BIRTHDAY_FILE):
-    with open(BIRTHDAY_FILE, 'r') as f:
-        birthday_data = json.load(f)
-else:
-    birthday_data = {}
+# Channel birthdays are announced in
+BIRTHDAY_CHANNEL_ID = 1361514241865158687
+
+# Time zone used for birthdays set without one
+DEFAULT_TIMEZONE = 'America/New_York'
 
-# Function to save birthday data
-def save_birthdays():
-    with open(BIRTHDAY_FILE, 'w') as f:
-        json.dump(birthday_data, f, indent=4)
+# Most missed days announced after the bot has been offline
+MAX_CATCH_UP_DAYS = 7
+
+# Load or initialize birthday data
+birthday_store = persistence.register('birthdays', legacy_file=BIRTHDAY_FILE)
+birthday_data = birthday_store.data
+
+# When the scheduler last ran, so a restart can catch up on missed birthdays
+birthday_state_store = persistence.register('birthday_state')
+birthday_state = birthday_state_store.data
+
+# Function to save a user's birthday (written back by the persistence service)
+def save_birthdays(user_id):
+    birthday_store.mark_dirty(user_id)
+
+def parse_birthday(value):
+    """(month, day, time zone name) of a stored birthday.
+
+    Birthdays are stored as {"date": "MM-DD", "timezone": name}; older entries
+    are plain "2023-MM-DD" strings in the default time zone. Raises ValueError
+    for a day the month doesn't have, which older versions accepted.
+    """
+    if isinstance(value, str):
+        month, day, timezone_name = int(value[5:7]), int(value[8:10]), DEFAULT_TIMEZONE
+    else:
+        month, day = value["date"].split('-')
+        month, day, timezone_name = int(month), int(day), value.get("timezone", DEFAULT_TIMEZONE)
+    # 2024 is a leap year, so Feb 29 is allowed
+    if not 1 <= month <= 12 or not 1 <= day <= calendar.monthrange(2024, month)[1]:
+        raise ValueError(f"Invalid birthday {value!r}")
+    return month, day, timezone_name
+
+def local_midnight(timezone, day):
+    """The instant a day starts in a time zone, even when DST skips or repeats midnight."""
+    midnight = datetime.combine(day, time(0))
+    try:
+        return timezone.localize(midnight, is_dst=None)
+    except pytz.AmbiguousTimeError:
+        return timezone.localize(midnight, is_dst=True)  # The first of the two midnights
+    except pytz.NonExistentTimeError:
+        # Clocks jumped over midnight, so the day starts at the end of the gap
+        return timezone.normalize(timezone.localize(midnight, is_dst=False))
+
+def next_fire(month, day, timezone_name, after):
+    """UTC timestamp of the first local midnight of the birthday strictly after `after`."""
+    timezone = pytz.timezone(timezone_name)
+    year = datetime.fromtimestamp(after, timezone).year
+    for year in range(year - 1, year + 2):
+        # Leap day birthdays are celebrated on Feb 28 in other years
+        celebrated = date(year, 2, 28) if (month, day) == (2, 29) and not calendar.isleap(year) else date(year, month, day)
+        fire = local_midnight(timezone, celebrated).timestamp()
+        if fire > after:
+            return fire
+    raise ValueError(f"No birthday occurrence after {after}")
 
 class Birthday(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, now=None, sleep=asyncio.sleep):
         self.bot = bot
+        # The clock is injectable so the scheduler can be driven by a simulated one
+        self.now = now or (lambda: datetime.now(pytz.utc))
+        self.sleep = sleep
+        self.heap = None  # (UTC fire timestamp, user ID, version), built on first run
+        self.versions = {}  # User ID -> version of their live heap entry
+        self.wakeup = asyncio.Event()
+        birthday_store.subscribe(self.rebuild_heap)
         self.check_birthdays.start()  # Start the birthday check task
 
+    def cog_unload(self):
+        self.check_birthdays.cancel()
+        birthday_store.unsubscribe(self.rebuild_heap)
+
+    def rebuild_heap(self):
+        """Reschedule everyone after the birthday data has been replaced."""
+        if self.heap is not None:
+            # New entries get new versions, so anything left from the old heap is skipped
+            self.build_heap(self.now().timestamp())
+            self.wakeup.set()
+
+    def schedule(self, user_id, after):
+        """Push the user's next birthday after `after` onto the heap, replacing any older entry."""
+        month, day, timezone_name = parse_birthday(birthday_data[user_id])
+        version = self.versions.get(user_id, 0) + 1
+        self.versions[user_id] = version
+        heapq.heappush(self.heap, (next_fire(month, day, timezone_name, after), user_id, version))
+
     @commands.slash_command()
-    async def set_birthday(self, ctx):
+    async def set_birthday(self, ctx, timezone: discord.Option(str, "Your time zone, e.g. Europe/Berlin", required=False, default=DEFAULT_TIMEZONE, autocomplete=discord.utils.basic_autocomplete(pytz.common_timezones))):
         """Set your birthday using a dropdown for month and input for day."""
+        if timezone not in pytz.all_timezones_set:
+            await ctx.respond(f"Unknown time zone {timezone}. Try one like Europe/Berlin or America/Chicago.", ephemeral=True)
+            return
+
         # Create month options
         month_options = [discord.SelectOption(label=month, value=str(index + 1)) for index, month in enumerate([
             "January", "February", "March", "April", "May", "June",
@@ -63,13 +142,14 @@ class Birthday(commands.Cog):
             day_message = await self.bot.wait_for("message", check=check_day, timeout=60.0)
             day = day_message.content.strip()
 
-            # Validate the day input
-            if not day.isdigit() or not (1 <= int(day) <= 31):
-                await ctx.author.send("Please enter a valid day between 1 and 31.")
+            # Validate the day input (2024 is a leap year, so Feb 29 is allowed)
+            days_in_month = calendar.monthrange(2024, month)[1]
+            if not day.isdigit() or not (1 <= int(day) <= days_in_month):
+                await ctx.author.send(f"Please enter a valid day between 1 and {days_in_month}.")
                 return
 
-            # Format the birthday as YYYY-MM-DD
-            birthday = f"2023-{month:02}-{int(day):02}"  # Using a fixed year for simplicity
+            # Format the birthday as MM-DD
+            birthday = f"{month:02}-{int(day):02}"
 
             # Extract month name for the DM response
             month_name = ["January", "February", "March", "April", "May", "June",
@@ -77,11 +157,16 @@ class Birthday(commands.Cog):
             formatted_birthday = f"{month_name} {int(day)}"
 
             user_id = str(ctx.author.id)
-            birthday_data[user_id] = birthday
-            save_birthdays()
+            birthday_data[user_id] = {"date": birthday, "timezone": timezone}
+            save_birthdays(user_id)
+
+            # Queue the next announcement and wake the scheduler in case it is the earliest
+            if self.heap is not None:
+                self.schedule(user_id, self.now().timestamp())
+                self.wakeup.set()
 
             # Send the confirmation message in a DM
-            await ctx.author.send(f"Your birthday has been set to {formatted_birthday}!")
+            await ctx.author.send(f"Your birthday has been set to {formatted_birthday} ({timezone})!")
 
         except Exception as e:
             # Handle the error gracefully
@@ -90,23 +175,57 @@ class Birthday(commands.Cog):
             else:
                 await ctx.author.send("You took too long to respond or an error occurred.")
 
-    @tasks.loop(hours=24)  # Check every 24 hours
+    @tasks.loop(seconds=0)
     async def check_birthdays(self):
-        # Get the current time in EST
-        est = pytz.timezone('America/New_York')
-        now = datetime.now(est)
-
-        # Check if it's 12 AM
-        if now.hour == 0 and now.minute == 0:
-            today = now.strftime("%Y-%m-%d")
-            for user_id, birthday in birthday_data.items():
-                if birthday == today:
-                    user = self.bot.get_user(int(user_id))
-                    if user:
-                        channel = self.bot.get_channel(1361514241865158687)
-                        await channel.send(f"🎉 Happy Birthday {user.mention}! 🎉")
-        else:
-            await asyncio.sleep(60)
+        now = self.now().timestamp()
+        if self.heap is None:
+            self.build_heap(now)
+
+        # Announce everything that is due, pushing each user's next birthday back on
+        while self.heap and self.heap[0][0] <= now:
+            fire, user_id, version = heapq.heappop(self.heap)
+            if self.versions.get(user_id) != version or user_id not in birthday_data:
+                continue  # Superseded by a newer entry
+            # An exception here would stop the loop for good, so log it and carry on
+            try:
+                await self.announce(user_id, belated=now - fire >= 86400)
+            except Exception as e:
+                print(f"Error announcing birthday for {user_id}: {e}")
+            self.schedule(user_id, fire)
+
+        birthday_state["last_checked"] = now
+        birthday_state_store.mark_dirty("last_checked")
+
+        # Sleep until the earliest birthday, or until set_birthday adds an earlier one
+        self.wakeup.clear()
+        sleeper = asyncio.create_task(self.sleep(self.heap[0][0] - now if self.heap else 86400))
+        waker = asyncio.create_task(self.wakeup.wait())
+        await asyncio.wait({sleeper, waker}, return_when=asyncio.FIRST_COMPLETED)
+        sleeper.cancel()
+        waker.cancel()
+
+    def build_heap(self, now):
+        last_checked = birthday_state.get("last_checked")
+        if last_checked is None:
+            last_checked = now - 86400  # First run: announce birthdays that started today
+        after = max(last_checked, now - MAX_CATCH_UP_DAYS * 86400)
+
+        self.heap = []
+        for user_id in birthday_data:
+            # A bad row would stop the loop for everyone, so skip it and say so
+            try:
+                self.schedule(user_id, after)
+            except (KeyError, ValueError) as e:
+                print(f"Skipping birthday for {user_id}: {e}")
+
+    async def announce(self, user_id, belated=False):
+        user = self.bot.get_user(int(user_id))
+        channel = self.bot.get_channel(BIRTHDAY_CHANNEL_ID)
+        if user and channel:
+            if belated:
+                await channel.send(f"🎉 Happy belated Birthday {user.mention}! 🎉")
+            else:
+                await channel.send(f"🎉 Happy Birthday {user.mention}! 🎉")
 
     @check_birthdays.before_loop
     async def before_check_birthdays(self):
@@ -1,7 +1,9 @@
 import discord
 from discord.ext import commands
-import json
 from datetime import datetime
+from functools import partial
+from cogs.persistence import persistence
+from cogs.rest import rest_scheduler, MODERATION
 
 # Configuration
 APPLICATION_CHANNEL_ID = 1361715508805898482
@@ -73,7 +75,7 @@ class ApplicationModal(discord.ui.Modal):
                 "status": "pending",
                 "timestamp": datetime.now().isoformat()
             }
-            cog.save_applications()
+            cog.save_applications(str(interaction.user.id))
 
         await interaction.response.send_message("Your application has been submitted!", ephemeral=True)
 
@@ -127,23 +129,23 @@ class ApplicationModerationView(discord.ui.View):
         cog.applications[str(self.applicant_id)]["status"] = action
         cog.applications[str(self.applicant_id)]["moderator"] = interaction.user.id
         cog.applications[str(self.applicant_id)]["reason"] = reason
-        cog.save_applications()
+        cog.save_applications(str(self.applicant_id))
 
         # Handle the action
         if action == "accepted":
             furry_role = interaction.guild.get_role(FURRY_ROLE_ID)
             if furry_role:
-                await applicant.add_roles(furry_role)
+                await rest_scheduler.submit(partial(applicant.add_roles, furry_role), "member_roles", interaction.guild.id, lane=MODERATION)
                 await interaction.followup.send(f"Application accepted! Added {furry_role.name} role to {applicant.mention}")
                 try:
                     await applicant.send("Your application has been accepted! Welcome to the server!")
                 except:
                     pass
         elif action == "kicked":
-            await applicant.kick(reason=reason)
+            await rest_scheduler.submit(partial(applicant.kick, reason=reason), "moderation", interaction.guild.id, lane=MODERATION)
             await interaction.followup.send(f"Kicked {applicant.mention}\nReason: {reason}")
         elif action == "banned":
-            await applicant.ban(reason=reason)
+            await rest_scheduler.submit(partial(applicant.ban, reason=reason), "moderation", interaction.guild.id, lane=MODERATION)
             await interaction.followup.send(f"Banned {applicant.mention}\nReason: {reason}")
         else:
             await interaction.followup.send(f"Application {action}!")
@@ -170,16 +172,11 @@ class CrowdControl(commands.Cog):
         self.load_applications()
 
     def load_applications(self):
-        try:
-            with open('applications.json', 'r') as f:
-                self.applications = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.applications = {}
-            self.save_applications()
-
-    def save_applications(self):
-        with open('applications.json', 'w') as f:
-            json.dump(self.applications, f, indent=4)
+        self.application_store = persistence.register('applications', legacy_file='applications.json')
+        self.applications = self.application_store.data
+
+    def save_applications(self, user_id):
+        self.application_store.mark_dirty(user_id)
 
     @commands.slash_command()
     async def apply(self, ctx):
@@ -0,0 +1,57 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# SQLite database holding every cog's persistent data
+DATABASE_FILE = 'floofbot.db'
+
+class Database:
+    """Embedded SQLite database whose queries run on a dedicated worker thread."""
+
+    def __init__(self, path=DATABASE_FILE):
+        self.path = path
+        # One worker keeps statements ordered; the lock lets shutdown code use the
+        # connection directly after the executor has already been torn down.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    def execute_sync(self, sql, params=()):
+        with self.lock:
+            with self.connection:
+                return self.connection.execute(sql, params).fetchall()
+
+    def executescript_sync(self, script):
+        with self.lock:
+            self.connection.executescript(script)
+
+    def transaction_sync(self, statements):
+        """Run (sql, rows) pairs through executemany inside a single transaction."""
+        with self.lock:
+            with self.connection:
+                for sql, rows in statements:
+                    self.connection.executemany(sql, rows)
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def execute(self, sql, params=()):
+        return await self.run(self.execute_sync, sql, params)
+
+    async def transaction(self, statements):
+        await self.run(self.transaction_sync, statements)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            self.connection.close()
+
+# Shared database every cog uses
+database = Database()
@@ -0,0 +1,213 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import yt_dlp
+
+# yt-dlp calls running at once across every guild
+EXTRACT_WORKERS = 4
+
+# yt-dlp calls one guild may have running or queued at once
+GUILD_EXTRACT_LIMIT = 2
+
+# Seconds before an extraction is given up on
+EXTRACT_TIMEOUT = 30.0
+
+# Results kept per cache, and how long they stay valid
+SEARCH_CACHE_SIZE = 256
+SEARCH_TTL = 6 * 60 * 60
+STREAM_CACHE_SIZE = 512
+STREAM_TTL = 60 * 60  # For stream URLs that don't say when they expire
+
+# Stream URLs are dropped this many seconds before the expiry they carry
+STREAM_EXPIRY_MARGIN = 5 * 60
+
+# Expiry timestamp in a stream URL, either as a query parameter or a path segment
+EXPIRE_PATTERN = re.compile(r'[?&/]expire[=/](\d+)')
+
+# Fields kept from a stream lookup; the rest of yt-dlp's info (format lists etc.) is large
+STREAM_FIELDS = ('id', 'title', 'duration', 'url', 'ext', 'acodec', 'http_headers')
+
+class TTLCache:
+    """Least-recently-used cache whose entries also expire at a given time."""
+
+    def __init__(self, maxsize, ttl, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # Key -> (expires_at, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self.entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expires_at=None):
+        self.entries[key] = (expires_at if expires_at is not None else self.clock() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key):
+        """Whether key has a live entry, without counting as a lookup."""
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] > self.clock()
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+def stream_expiry(url, now):
+    """When a stream URL stops working, going by the expire= timestamp it carries."""
+    match = EXPIRE_PATTERN.search(url or "")
+    if not match:
+        return now + STREAM_TTL
+    return int(match.group(1)) - STREAM_EXPIRY_MARGIN
+
+class Extractor:
+    """Runs yt-dlp in a bounded thread pool so extraction never blocks the event loop.
+
+    yt-dlp spends its time waiting on the network, so threads are enough. A call
+    that times out or is cancelled while still queued never starts; one that is
+    already running finishes in the background and its result is dropped.
+    """
+
+    def __init__(self, workers=EXTRACT_WORKERS, guild_limit=GUILD_EXTRACT_LIMIT):
+        self.workers = workers
+        self.guild_limit = guild_limit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yt-dlp")
+        self.guild_slots = {}  # Guild ID -> Semaphore
+        self.lock = threading.Lock()
+        self.pending = 0  # Calls that have not finished, including those waiting for a slot
+        self.active = 0  # Calls running on a worker thread
+        self.max_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.searches = TTLCache(SEARCH_CACHE_SIZE, SEARCH_TTL)
+        self.streams = TTLCache(STREAM_CACHE_SIZE, STREAM_TTL)
+        self.in_flight = {}  # Cache key -> task already fetching it
+
+    def slots(self, guild_id):
+        if guild_id not in self.guild_slots:
+            self.guild_slots[guild_id] = asyncio.Semaphore(self.guild_limit)
+        return self.guild_slots[guild_id]
+
+    def run(self, query, options):
+        with self.lock:
+            self.active += 1
+        try:
+            with yt_dlp.YoutubeDL(options) as ydl:
+                return ydl.extract_info(query, download=False)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    async def extract(self, guild_id, query, options, timeout=EXTRACT_TIMEOUT):
+        """Extract info for a URL, video ID or search query without downloading it."""
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        start = time.perf_counter()
+        try:
+            async with self.slots(guild_id):
+                future = asyncio.wrap_future(self.executor.submit(self.run, query, options))
+                info = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.completed += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        return info
+
+    async def cached(self, cache, key, fetch):
+        """Return the cached value for key, or fetch it once however many callers are waiting."""
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if key not in self.in_flight:
+            self.in_flight[key] = asyncio.ensure_future(fetch())
+            self.in_flight[key].add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shielded so one caller timing out doesn't cancel the lookup for the others
+        return await asyncio.shield(self.in_flight[key])
+
+    async def search(self, guild_id, query, options, limit=5):
+        """Up to `limit` search results as dicts with id, title and duration."""
+        key = ("search", limit, " ".join(query.lower().split()))
+
+        async def fetch():
+            info = await self.extract(guild_id, f"ytsearch{limit}:{query}", options)
+            results = [
+                {"id": entry["id"], "title": entry["title"], "duration": entry.get("duration")}
+                for entry in info.get("entries") or [] if entry
+            ]
+            self.searches.set(key, results)
+            return results
+
+        return await self.cached(self.searches, key, fetch)
+
+    async def stream_info(self, guild_id, video_id, options):
+        """Title, duration and a playable stream URL for a video, reused until the URL expires."""
+        key = ("stream", video_id)
+
+        async def fetch():
+            info = await self.extract(guild_id, video_id, options)
+            stream = {field: info.get(field) for field in STREAM_FIELDS}
+            expires_at = stream_expiry(stream["url"], self.streams.clock())
+            if expires_at > self.streams.clock():
+                self.streams.set(key, stream, expires_at)
+            return stream
+
+        return await self.cached(self.streams, key, fetch)
+
+    def has_stream(self, video_id):
+        return ("stream", video_id) in self.streams
+
+    def forget_stream(self, video_id):
+        self.streams.discard(("stream", video_id))
+
+    def queued(self):
+        """Calls waiting for a guild slot or a free worker."""
+        return max(self.pending - self.active, 0)
+
+# Shared extraction pool for every guild's music player
+extractor = Extractor()
@@ -0,0 +1,16 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import hashlib
+
+# Bytes read per chunk while hashing a file
+HASH_CHUNK_SIZE = 1 << 20
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in chunks so large files aren't loaded whole."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,158 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import discord
+from discord.ext import commands
+import aiohttp
+import asyncio
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Connections kept open in the shared pool, in total and per host
+HTTP_CONNECTIONS = 20
+HTTP_CONNECTIONS_PER_HOST = 5
+
+# Requests in flight at once through the shared client
+HTTP_CONCURRENCY = 8
+
+# Seconds before a request is given up on: whole request, connecting, and between reads
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=120, connect=10, sock_read=30)
+
+# Attempts per request, and the base of the exponential backoff between them in seconds
+HTTP_ATTEMPTS = 3
+HTTP_BACKOFF = 0.5
+
+# Longest Retry-After we wait out, in seconds; a request asked to wait longer fails instead
+HTTP_MAX_RETRY_AFTER = 30
+
+# Bytes read from a response body at a time when streaming it somewhere
+CHUNK_SIZE = 64 * 1024
+
+class HttpError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after  # Seconds the server asked us to wait, if it said
+
+def should_retry(status):
+    return status == 429 or status >= 500
+
+def retry_after(response):
+    """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class HttpClient:
+    """One pooled aiohttp session shared by every cog, with a concurrency limit and retries."""
+
+    def __init__(self):
+        self.session = None
+        self.slots = asyncio.Semaphore(HTTP_CONCURRENCY)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes_downloaded = 0
+        self.in_flight = 0
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=HTTP_CONNECTIONS, limit_per_host=HTTP_CONNECTIONS_PER_HOST)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=HTTP_TIMEOUT)
+        return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    async def request(self, method, url, handle, make_data=None, **kwargs):
+        """Send a request and pass the response to `async def handle(response)`, retrying on failure.
+
+        Connection errors, timeouts, 429s and 5xx responses are retried with
+        exponential backoff, or after the delay a Retry-After header asks for,
+        so `handle` must cope with being called again. A
+        request body that can only be read once is built by `make_data()`,
+        which is called before every attempt.
+        """
+        for attempt in range(1, HTTP_ATTEMPTS + 1):
+            self.requests += 1
+            if make_data:
+                kwargs['data'] = make_data()
+            try:
+                async with self.slots:
+                    self.in_flight += 1
+                    try:
+                        async with self.get_session().request(method, url, **kwargs) as response:
+                            if response.status >= 400:
+                                raise HttpError(response.status, (await response.text())[:200], retry_after(response))
+                            return await handle(response)
+                    finally:
+                        self.in_flight -= 1
+            except (aiohttp.ClientError, asyncio.TimeoutError, HttpError) as e:
+                wait = getattr(e, 'retry_after', None)
+                if (attempt == HTTP_ATTEMPTS
+                        or (isinstance(e, HttpError) and not should_retry(e.status))
+                        or (wait is not None and wait > HTTP_MAX_RETRY_AFTER)):
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                if wait is None:
+                    wait = HTTP_BACKOFF * 2 ** (attempt - 1) * (1 + random.random())
+                await asyncio.sleep(wait)
+
+    async def download(self, url, file, **kwargs):
+        """Stream a response body into a file object. Returns the number of bytes written."""
+        async def handle(response):
+            # Start over if this is a retry
+            file.seek(0)
+            file.truncate()
+            size = 0
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                file.write(chunk)
+                size += len(chunk)
+            self.bytes_downloaded += size
+            return size
+
+        return await self.request('GET', url, handle, **kwargs)
+
+    async def post_json(self, url, make_data, **kwargs):
+        """POST the body built by `make_data()` and decode the JSON reply."""
+        async def handle(response):
+            return await response.json(content_type=None)
+
+        return await self.request('POST', url, handle, make_data=make_data, **kwargs)
+
+# Shared client for every cog's outgoing HTTP requests
+http = HttpClient()
+
+class Http(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    def cog_unload(self):
+        asyncio.ensure_future(http.close())
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def http_stats(self, ctx):
+        """Show shared HTTP client statistics."""
+        embed = discord.Embed(title="HTTP Stats", color=discord.Color.blue())
+        embed.add_field(name="Requests", value=str(http.requests), inline=True)
+        embed.add_field(name="Retries", value=str(http.retries), inline=True)
+        embed.add_field(name="Failures", value=str(http.failures), inline=True)
+        embed.add_field(name="In Flight", value=f"{http.in_flight}/{HTTP_CONCURRENCY}", inline=True)
+        embed.add_field(name="Downloaded", value=f"{http.bytes_downloaded / 1024 ** 2:.1f} MB", inline=True)
+        await ctx.respond(embed=embed, ephemeral=True)
+
+def setup(bot):
+    bot.add_cog(Http(bot))
@@ -0,0 +1,177 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import aiohttp
+import asyncio
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from aiohttp import web
+from cogs.http import http
+from cogs.hashing import file_sha256
+
+# Where new reference images are stored: "imgbb" or "local"
+IMAGE_STORAGE_BACKEND = os.environ.get("FLOOF_IMAGE_STORAGE", "imgbb")
+
+IMGBB_UPLOAD_URL = 'https://api.imgbb.com/1/upload'
+
+# Local store: files live under LOCAL_IMAGE_DIR and are served over HTTP on
+# LOCAL_IMAGE_HOST:LOCAL_IMAGE_PORT, by default only to this machine so a reverse
+# proxy can publish them. Discord fetches them from LOCAL_IMAGE_BASE_URL, which has
+# to be set to that public address before the local backend can be used.
+LOCAL_IMAGE_DIR = "reference-images"
+LOCAL_IMAGE_HOST = os.environ.get("FLOOF_IMAGE_HOST", "127.0.0.1")
+LOCAL_IMAGE_PORT = int(os.environ.get("FLOOF_IMAGE_PORT", "8080"))
+LOCAL_IMAGE_BASE_URL = os.environ.get("FLOOF_IMAGE_BASE_URL")
+
+# Paths the local store hands out: <sha256[:2]>/<sha256><extension>
+LOCAL_KEY_PATTERN = re.compile(r'[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]{1,5}')
+
+# Prefix of the locators for images in the local store; anything else is a plain URL
+LOCAL_PREFIX = "local:"
+
+# Replace hardcoded API key with loading from local file
+try:
+    with open('imgbb.key', 'r') as f:
+        IMGBB_API_KEY = f.read().strip()
+except FileNotFoundError:
+    IMGBB_API_KEY = 'YOUR_IMGBB_API_KEY'  # Fallback if file not found
+
+class StorageBackend(ABC):
+    """Somewhere reference images can be stored.
+
+    `store` returns a locator that is saved with the reference; `url` turns a
+    locator back into a link Discord can show.
+    """
+
+    name = None
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def store(self, path, filename):
+        """Store the file at `path` and return its locator."""
+
+    def url(self, locator):
+        return locator
+
+class ImgbbBackend(StorageBackend):
+    """Uploads to imgbb; the locator is the image's imgbb URL."""
+
+    name = "imgbb"
+
+    def __init__(self, api_key=IMGBB_API_KEY, upload_url=IMGBB_UPLOAD_URL):
+        self.api_key = api_key
+        self.upload_url = upload_url
+
+    async def store(self, path, filename):
+        def upload_form():
+            # aiohttp closes the file once it is sent, so every attempt opens it again
+            form = aiohttp.FormData()
+            form.add_field('key', self.api_key)
+            form.add_field('image', open(path, 'rb'), filename=filename)
+            return form
+
+        result = await http.post_json(self.upload_url, upload_form)
+        return result['data']['url']
+
+class LocalBackend(StorageBackend):
+    """Content-addressed files on disk, served by a small built-in static file server.
+
+    A file is stored as <sha256[:2]>/<sha256><extension>, so storing the same
+    bytes twice keeps one copy and a stored file never changes.
+    """
+
+    name = "local"
+
+    def __init__(self, directory=LOCAL_IMAGE_DIR, base_url=LOCAL_IMAGE_BASE_URL or f"http://{LOCAL_IMAGE_HOST}:{LOCAL_IMAGE_PORT}", host=LOCAL_IMAGE_HOST, port=LOCAL_IMAGE_PORT):
+        self.directory = directory
+        self.base_url = base_url.rstrip('/')
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def start(self):
+        """Start serving the stored files."""
+        if self.runner:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app = web.Application()
+        app.router.add_get('/{key:.+}', self.serve)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.port = self.runner.addresses[0][1]  # The port picked, if asked for any free one
+        print(f"Serving reference images from {self.directory} on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def serve(self, request):
+        key = request.match_info['key']
+        path = os.path.join(self.directory, key)
+        # Only hand out files this store wrote, so nothing else in the directory leaks
+        if not LOCAL_KEY_PATTERN.fullmatch(key) or not os.path.isfile(path):
+            raise web.HTTPNotFound()
+        # Not every system's mime.types knows WebP, and Discord only embeds images served as images
+        content_type = "image/webp" if key.endswith(".webp") else mimetypes.guess_type(key)[0] or "application/octet-stream"
+        # Stored files never change, so clients can keep them forever
+        return web.FileResponse(path, headers={
+            "Content-Type": content_type,
+            "Cache-Control": "public, max-age=31536000, immutable",
+        })
+
+    def store_file(self, path, filename):
+        digest = file_sha256(path)
+        key = f"{digest[:2]}/{digest}{os.path.splitext(filename)[1].lower()}"
+        destination = os.path.join(self.directory, key)
+        if not os.path.exists(destination):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # Copy to a file of our own next to the destination first, so a half-written
+            # file is never served and two stores of the same image don't share one
+            fd, partial = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(destination))
+            try:
+                with os.fdopen(fd, 'wb') as target, open(path, 'rb') as source:
+                    shutil.copyfileobj(source, target)
+                os.replace(partial, destination)
+            except BaseException:
+                os.remove(partial)
+                raise
+        return LOCAL_PREFIX + key
+
+    async def store(self, path, filename):
+        return await asyncio.get_running_loop().run_in_executor(None, self.store_file, path, filename)
+
+    def url(self, locator):
+        return f"{self.base_url}/{locator[len(LOCAL_PREFIX):]}"
+
+backends = {backend.name: backend for backend in (ImgbbBackend(), LocalBackend())}
+
+def select_backend(name):
+    """The backend new images are stored with, falling back to imgbb if the configuration can't work."""
+    if name not in backends:
+        print(f"Unknown FLOOF_IMAGE_STORAGE {name!r}, expected one of: {', '.join(backends)}. Storing reference images on imgbb.")
+        return backends["imgbb"]
+    if name == "local" and not LOCAL_IMAGE_BASE_URL:
+        print("FLOOF_IMAGE_STORAGE is local but FLOOF_IMAGE_BASE_URL isn't set, so Discord couldn't load the images. Storing reference images on imgbb.")
+        return backends["imgbb"]
+    return backends[name]
+
+# Backend new reference images are stored with
+storage = select_backend(IMAGE_STORAGE_BACKEND)
+
+def resolve_url(locator):
+    """Link for a stored image, whichever backend holds it."""
+    if locator.startswith(LOCAL_PREFIX):
+        return backends["local"].url(locator)
+    return locator
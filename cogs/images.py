@@ -0,0 +1,107 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, features
+from cogs.hashing import file_sha256
+
+# Longest side of a stored reference image, in pixels
+MAX_IMAGE_DIMENSION = 4096
+
+# Bounding box of the thumbnails shown in embeds
+THUMBNAIL_SIZE = (320, 320)
+
+# Encoder quality for WebP and JPEG output
+IMAGE_QUALITY = 85
+
+# Refuse images with more pixels than this (decompression bombs)
+MAX_IMAGE_PIXELS = 100_000_000
+
+# Processes resizing and encoding images
+IMAGE_WORKERS = 2
+
+# How the workers are started. The bot process runs threads (the database worker,
+# yt-dlp, the event loop) and forking a threaded process can deadlock the child,
+# so workers come from a clean forkserver process instead (spawn where there is none)
+IMAGE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# WebP keeps transparency and is smaller; fall back to JPEG if Pillow was built without it
+OUTPUT_FORMAT = "WEBP" if features.check('webp') else "JPEG"
+OUTPUT_EXTENSION = ".webp" if OUTPUT_FORMAT == "WEBP" else ".jpg"
+
+def save_image(image, path):
+    if OUTPUT_FORMAT == "WEBP":
+        image.save(path, "WEBP", quality=IMAGE_QUALITY, method=4)
+        return
+    if image.mode in ("RGBA", "LA", "P"):
+        # JPEG has no alpha; flatten onto white like most viewers would show it
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    image.convert("RGB").save(path, "JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+
+def process_image(source_path, output_path, thumbnail_path):
+    """Cap an image's resolution, re-encode it and write a thumbnail. Runs in a worker process."""
+    start = time.perf_counter()
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        resized = max(image.size) > MAX_IMAGE_DIMENSION
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+        save_image(image, output_path)
+        width, height = image.size
+        image.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+        save_image(image, thumbnail_path)
+    return {
+        "resized": resized,
+        "width": width,
+        "height": height,
+        "ms": (time.perf_counter() - start) * 1000,
+    }
+
+class ImagePipeline:
+    """Hashes and processes images off the event loop, and keeps totals for /ref_stats."""
+
+    def __init__(self, workers=IMAGE_WORKERS):
+        self.workers = workers
+        self.pool = None
+        self.processed = 0
+        self.duplicates = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_ms = 0.0
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(IMAGE_START_METHOD))
+        return self.pool
+
+    async def hash_file(self, path):
+        # hashlib releases the GIL, so a thread is enough here
+        return await asyncio.get_running_loop().run_in_executor(None, file_sha256, path)
+
+    async def process(self, source_path, output_path, thumbnail_path):
+        return await asyncio.get_running_loop().run_in_executor(self.get_pool(), process_image, source_path, output_path, thumbnail_path)
+
+    def record(self, original_bytes, output_bytes, ms):
+        self.processed += 1
+        self.bytes_in += original_bytes
+        self.bytes_out += output_bytes
+        self.total_ms += ms
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+# Shared image pipeline
+image_pipeline = ImagePipeline()
@@ -0,0 +1,127 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import discord
+from discord.ext import commands, tasks
+import asyncio
+import time
+
+# Events waiting to be consumed before on_message starts waiting for room
+QUEUE_SIZE = 10000
+
+# Most events handed to the subscribers in one batch
+BATCH_SIZE = 256
+
+class MessageEvent:
+    """The parts of a guild message the consumers need, parsed once."""
+
+    __slots__ = ('guild_id', 'channel_id', 'user_id', 'timestamp')
+
+    def __init__(self, guild_id, channel_id, user_id, timestamp):
+        self.guild_id = guild_id  # str, as used for the data store keys
+        self.channel_id = channel_id  # int
+        self.user_id = user_id  # str, as used for the data store keys
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(str(message.guild.id), message.channel.id, str(message.author.id), message.created_at.timestamp())
+
+class MessageStream:
+    """Queue of message events handed to subscribers in micro-batches."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.subscribers = []
+        self.events_received = 0
+        self.backpressure_waits = 0
+        self.max_depth = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_batch_ms = 0.0
+        self.max_batch_ms = 0.0
+        self.total_batch_ms = 0.0
+        self.subscriber_errors = 0
+
+    def subscribe(self, callback):
+        """Register an `async def callback(events)` to receive every batch."""
+        if callback not in self.subscribers:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    async def publish(self, event):
+        if self.queue.full():
+            self.backpressure_waits += 1
+        await self.queue.put(event)
+        self.events_received += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def consume_batch(self):
+        """Wait for at least one event, then deliver everything queued (up to BATCH_SIZE)."""
+        batch = [await self.queue.get()]
+        while len(batch) < BATCH_SIZE and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+        start = time.perf_counter()
+        for callback in list(self.subscribers):
+            try:
+                await callback(batch)
+            except Exception as e:
+                self.subscriber_errors += 1
+                print(f"Error in message stream subscriber {callback.__qualname__}: {e}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.last_batch_ms = elapsed_ms
+        self.max_batch_ms = max(self.max_batch_ms, elapsed_ms)
+        self.total_batch_ms += elapsed_ms
+
+# Shared stream every message-driven cog subscribes to
+message_stream = MessageStream()
+
+class Ingest(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.consume_messages.start()
+
+    def cog_unload(self):
+        self.consume_messages.cancel()
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.author.bot or message.guild is None:
+            return
+        await message_stream.publish(MessageEvent.from_message(message))
+
+    @tasks.loop(seconds=0)
+    async def consume_messages(self):
+        await message_stream.consume_batch()
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def ingest_stats(self, ctx):
+        """Show message ingest queue and batch statistics."""
+        stream = message_stream
+        average_size = stream.events_received / stream.batches if stream.batches else 0.0
+        average_ms = stream.total_batch_ms / stream.batches if stream.batches else 0.0
+
+        embed = discord.Embed(title="Ingest Stats", color=discord.Color.blue())
+        embed.add_field(name="Queue Depth", value=f"{stream.queue.qsize()} (max {stream.max_depth}/{QUEUE_SIZE})", inline=False)
+        embed.add_field(name="Events", value=str(stream.events_received), inline=True)
+        embed.add_field(name="Batches", value=str(stream.batches), inline=True)
+        embed.add_field(name="Subscribers", value=str(len(stream.subscribers)), inline=True)
+        embed.add_field(name="Batch Size", value=f"last {stream.last_batch_size}, avg {average_size:.1f}, max {stream.max_batch_size}", inline=False)
+        embed.add_field(name="Batch Latency", value=f"last {stream.last_batch_ms:.2f} ms, avg {average_ms:.2f} ms, max {stream.max_batch_ms:.2f} ms", inline=False)
+        embed.add_field(name="Backpressure Waits", value=str(stream.backpressure_waits), inline=True)
+        embed.add_field(name="Subscriber Errors", value=str(stream.subscriber_errors), inline=True)
+        await ctx.respond(embed=embed, ephemeral=True)
+
+def setup(bot):
+    bot.add_cog(Ingest(bot))
@@ -4,20 +4,31 @@
 
 import discord
 from discord.ext import commands
-import json
-import os
+import asyncio
+from functools import partial
+from cogs.persistence import persistence
+from cogs.ranking import RankIndex
+from cogs.ingest import message_stream
+from cogs.rest import rest_scheduler, COSMETIC
 
 # Load or initialize user data
-if os.path.exists('levels.json'):
-    with open('levels.json', 'r') as f:
-        levels_data = json.load(f)
-else:
-    levels_data = {}
+levels_store = persistence.register('levels', depth=2, legacy_file='levels.json')
+levels_data = levels_store.data
 
-# Function to save levels data
-def save_levels():
-    with open('levels.json', 'w') as f:
-        json.dump(levels_data, f, indent=4)
+# Function to save a user's level data (written back by the persistence service)
+def save_levels(guild_id, user_id):
+    levels_store.mark_dirty(guild_id, user_id)
+
+# Roles awarded for reaching a level: level -> role name
+ROLE_REWARDS = {
+    5: "Verified Furry",
+}
+
+# Parallel add_roles calls made by /retroactive_roles
+ROLE_ASSIGN_CONCURRENCY = 5
+
+# Seconds between /retroactive_roles progress updates
+PROGRESS_INTERVAL = 10
 
 # Function to calculate XP needed for the next level
 def xp_needed(level):
@@ -26,59 +37,110 @@ def xp_needed(level):
 class Leveling(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.leaderboards = {}  # Guild ID -> RankIndex of (level, xp)
+        self.role_rewards = {}  # Guild ID -> [(level, role)] resolved from ROLE_REWARDS
+        self.announcements = set()  # Level-up announcements, held so they aren't garbage collected while running
+        message_stream.subscribe(self.ingest_batch)
+        levels_store.subscribe(self.leaderboards.clear)
+
+    def cog_unload(self):
+        message_stream.unsubscribe(self.ingest_batch)
+        levels_store.unsubscribe(self.leaderboards.clear)
+
+    def get_leaderboard(self, guild_id):
+        """Get the guild's leaderboard index, building it from the level data on first use."""
+        if guild_id not in self.leaderboards:
+            self.leaderboards[guild_id] = RankIndex(
+                (user_id, (data["level"], data["xp"])) for user_id, data in levels_data.get(guild_id, {}).items()
+            )
+        return self.leaderboards[guild_id]
+
+    def get_role_rewards(self, guild):
+        """Get the guild's (level, role) rewards, resolving the role names once."""
+        if guild.id not in self.role_rewards:
+            rewards = []
+            for level, role_name in sorted(ROLE_REWARDS.items()):
+                role = discord.utils.get(guild.roles, name=role_name)
+                if role:
+                    rewards.append((level, role))
+            self.role_rewards[guild.id] = rewards
+        return self.role_rewards[guild.id]
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.role_rewards.pop(role.guild.id, None)
 
     @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.author.bot:
+    async def on_guild_role_update(self, before, after):
+        self.role_rewards.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.role_rewards.pop(role.guild.id, None)
+
+    async def ingest_batch(self, events):
+        """Award XP for a batch of messages from the ingest stream."""
+        touched = set()
+        for event in events:
+            guild_id = event.guild_id
+            user_id = event.user_id
+
+            # Initialize the guild data if it doesn't exist
+            if guild_id not in levels_data:
+                levels_data[guild_id] = {}
+
+            # Initialize user data if it doesn't exist
+            if user_id not in levels_data[guild_id]:
+                levels_data[guild_id][user_id] = {"level": 1, "xp": 0}
+
+            # Award XP for sending a message
+            levels_data[guild_id][user_id]["xp"] += 10  # Example: 10 XP per message
+
+            # Check for level up
+            current_level = levels_data[guild_id][user_id]["level"]
+            if levels_data[guild_id][user_id]["xp"] >= xp_needed(current_level):
+                levels_data[guild_id][user_id]["level"] += 1
+                levels_data[guild_id][user_id]["xp"] = 0  # Reset XP or adjust as needed
+
+                # Announce in the background so a slow REST call doesn't hold up the batch
+                announcement = self.bot.loop.create_task(self.announce_level_up(event, levels_data[guild_id][user_id]["level"]))
+                self.announcements.add(announcement)
+                announcement.add_done_callback(self.announcements.discard)
+
+            touched.add((guild_id, user_id))
+
+        for guild_id, user_id in touched:
+            # Keep the leaderboard in rank order
+            self.get_leaderboard(guild_id).update(user_id, (levels_data[guild_id][user_id]["level"], levels_data[guild_id][user_id]["xp"]))
+
+            # Save levels data after each batch
+            save_levels(guild_id, user_id)
+
+    async def announce_level_up(self, event, level):
+        guild = self.bot.get_guild(int(event.guild_id))
+        if not guild:
+            return
+        member = guild.get_member(int(event.user_id))
+        channel = guild.get_channel_or_thread(event.channel_id)
+        if not member or not channel:
             return
 
-        guild_id = str(message.guild.id)
-        user_id = str(message.author.id)
+        # Create an embed for the level-up message
+        embed = discord.Embed(
+            title="Level Up!",
+            description=f"Congratulations {member.mention}, you've leveled up to level {level}!",
+            color=discord.Color.green()
+        )
+        embed.set_thumbnail(url=member.display_avatar.url)  # User's profile picture
+        embed.set_footer(text=f"Keep being active, {member.name}, to reach the next level!")  # User's name in footer
 
-        # Initialize the guild data if it doesn't exist
-        if guild_id not in levels_data:
-            levels_data[guild_id] = {}
-
-        # Initialize user data if it doesn't exist
-        if user_id not in levels_data[guild_id]:
-            levels_data[guild_id][user_id] = {"level": 1, "xp": 0}
-
-        # Award XP for sending a message
-        levels_data[guild_id][user_id]["xp"] += 10  # Example: 10 XP per message
-
-        # Check for level up
-        current_level = levels_data[guild_id][user_id]["level"]
-        if levels_data[guild_id][user_id]["xp"] >= xp_needed(current_level):
-            levels_data[guild_id][user_id]["level"] += 1
-            levels_data[guild_id][user_id]["xp"] = 0  # Reset XP or adjust as needed
-            
-            # Create an embed for the level-up message
-            embed = discord.Embed(
-                title="Level Up!",
-                description=f"Congratulations {message.author.mention}, you've leveled up to level {levels_data[guild_id][user_id]['level']}!",
-                color=discord.Color.green()
-            )
-            embed.set_thumbnail(url=message.author.avatar.url)  # User's profile picture
-            embed.set_footer(text=f"Keep being active, {message.author.name}, to reach the next level!")  # User's name in footer
-
-            await message.channel.send(embed=embed)
-
-            # Check if the user reached level 3 and assign the role
-            if levels_data[guild_id][user_id]["level"] >= 5:
-                role_name = "Verified Furry"
-                role = discord.utils.get(message.guild.roles, name=role_name)
-                if role and role not in message.author.roles:
-                    await message.author.add_roles(role)
-                    await message.channel.send(f"{message.author.mention}, you have been given the role **{role_name}** for reaching level 3!")
-
-            # Check if the user reached level 5 and assign the role
-            if levels_data[guild_id][user_id]["level"] >= 6:
-                role = discord.utils.get(message.guild.roles, name=role_name)
-                if role:
-                    await message.author.add_roles(role)
+        await channel.send(embed=embed)
 
-        # Save levels data after each message
-        save_levels()
+        # Assign any role rewards the user has reached
+        for reward_level, role in self.get_role_rewards(guild):
+            if level >= reward_level and role not in member.roles:
+                await rest_scheduler.submit(partial(member.add_roles, role, reason=f"Reached level {reward_level}"), "member_roles", guild.id, key=("roles", member.id, role.id))
+                await channel.send(f"{member.mention}, you have been given the role **{role.name}** for reaching level {reward_level}!")
 
     @commands.slash_command()
     async def level(self, ctx: discord.ApplicationContext):
@@ -98,41 +160,20 @@ class Leveling(commands.Cog):
         """Display the leaderboard of users by level with pagination."""
         guild_id = str(ctx.guild.id)  # Get the server (guild) ID
  
-        if guild_id not in levels_data or not levels_data[guild_id]:
+        leaderboard = self.get_leaderboard(guild_id)
+        if not leaderboard:
             await ctx.respond("No users have gained levels yet.")
             return
- 
-        # Create a list of users and their levels
-        leaderboard = []
-        for user_id, data in levels_data[guild_id].items():
-            leaderboard.append((user_id, data["level"], data["xp"]))
- 
-        # Sort the leaderboard by level and XP
-        leaderboard.sort(key=lambda x: (x[1], x[2]), reverse=True)
-
-        # Assign ranks
-        ranked_leaderboard = []
-        current_rank = 1
-        previous_level = None
-        previous_xp = None
-
-        for index, (user_id, level, xp) in enumerate(leaderboard):
-            if (level, xp) != (previous_level, previous_xp):
-                current_rank = index + 1  # Update rank only if the level and XP change
-            ranked_leaderboard.append((user_id, current_rank, level, xp))  # Store user_id, rank, level, and XP
-            previous_level, previous_xp = level, xp  # Update previous_level and previous_xp for the next iteration
 
         # Pagination logic
         page_size = 10
-        total_pages = (len(ranked_leaderboard) + page_size - 1) // page_size  # Calculate total pages
+        total_pages = (len(leaderboard) + page_size - 1) // page_size  # Calculate total pages
         current_page = 0
  
         # Function to create and send the embed for the current page
         async def send_leaderboard_page(page):
             embed = discord.Embed(title="Leaderboard", color=discord.Color.blue())
-            start_index = page * page_size
-            end_index = start_index + page_size
-            for index, (user_id, rank, level, xp) in enumerate(ranked_leaderboard[start_index:end_index], start=start_index + 1):
+            for user_id, rank, (level, xp) in leaderboard.page(page, page_size):
                 user = ctx.guild.get_member(int(user_id))
                 username = user.display_name if user else "Unknown User"
                 embed.add_field(name=f"{rank}. {username}", value=f"Level: {level}, XP: {xp}", inline=False)
@@ -157,40 +198,99 @@ class Leveling(commands.Cog):
                 reaction, user = await self.bot.wait_for("reaction_add", timeout=60.0, check=check)
                 if str(reaction.emoji) == "◀️" and current_page > 0:
                     current_page -= 1
-                    await message.edit(embed=await send_leaderboard_page(current_page))
+                    rest_scheduler.schedule(partial(message.edit, embed=await send_leaderboard_page(current_page)), "message_edit", message.channel.id, key=("edit", message.id), lane=COSMETIC)
                 elif str(reaction.emoji) == "▶️" and current_page < total_pages - 1:
                     current_page += 1
-                    await message.edit(embed=await send_leaderboard_page(current_page))
+                    rest_scheduler.schedule(partial(message.edit, embed=await send_leaderboard_page(current_page)), "message_edit", message.channel.id, key=("edit", message.id), lane=COSMETIC)
 
                 # Remove the user's reaction
-                await message.remove_reaction(reaction, user)
+                rest_scheduler.schedule(partial(message.remove_reaction, reaction, user), "reactions", message.channel.id, lane=COSMETIC)
 
             except Exception as e:
                 print(f"Error during reaction handling: {e}")
                 break  # Exit the loop on timeout or error
 
+    @commands.slash_command()
+    async def rank(self, ctx: discord.ApplicationContext):
+        """Show your leaderboard rank and the users around you."""
+        guild_id = str(ctx.guild.id)
+        user_id = str(ctx.author.id)
+        leaderboard = self.get_leaderboard(guild_id)
+
+        rank = leaderboard.rank(user_id)
+        if rank is None:
+            await ctx.respond(f"{ctx.author.mention}, you have not gained any XP yet.")
+            return
+
+        embed = discord.Embed(title="Your Rank", description=f"{ctx.author.mention} is rank **{rank}** of {len(leaderboard)}", color=discord.Color.blue())
+        for other_id, other_rank, (level, xp) in leaderboard.around(user_id):
+            user = ctx.guild.get_member(int(other_id))
+            username = user.display_name if user else "Unknown User"
+            marker = " (you)" if other_id == user_id else ""
+            embed.add_field(name=f"{other_rank}. {username}{marker}", value=f"Level: {level}, XP: {xp}", inline=False)
+        await ctx.respond(embed=embed)
+
     @commands.slash_command()
     @commands.has_role("STAFF")
     async def retroactive_roles(self, ctx: discord.ApplicationContext):
-        """Retroactively assign roles to users who are level 3 or higher."""
+        """Retroactively assign level reward roles to everyone who has earned them."""
         guild_id = str(ctx.guild.id)
-        role_name = "Verified Furry"
-        role = discord.utils.get(ctx.guild.roles, name=role_name)
-        
-        if not role:
-            await ctx.respond(f"Error: The role '{role_name}' does not exist.")
+        rewards = self.get_role_rewards(ctx.guild)
+
+        if not rewards:
+            await ctx.respond(f"Error: None of the reward roles ({', '.join(ROLE_REWARDS.values())}) exist.")
             return
-            
+
         if guild_id not in levels_data:
             await ctx.respond("No level data exists for this server.")
             return
-            
-        assigned_count = 0
+
+        # Work out every missing role up front so progress can be reported against a total
+        assignments = []
         for user_id, data in levels_data[guild_id].items():
-            if data["level"] >= 5:
-                member = ctx.guild.get_member(int(user_id))
-                if member and role not in member.roles:
-                    await member.add_roles(role)
-                    assigned_count += 1
-                    
-        await ctx.respond(f"Successfully assigned the {role_name} role to {assigned_count} members who are level 3 or higher.")
\ No newline at end of file
+            member = None
+            for reward_level, role in rewards:
+                if data["level"] < reward_level:
+                    break
+                member = member or ctx.guild.get_member(int(user_id))
+                if not member:
+                    break
+                if role not in member.roles:
+                    assignments.append((member, role))
+
+        if not assignments:
+            await ctx.respond("Everyone already has the roles for their level.")
+            return
+
+        await ctx.respond(f"Assigning {len(assignments)} reward roles, progress will be posted below.")
+        # Interaction tokens expire after 15 minutes, so progress goes in a normal message
+        progress = await ctx.channel.send(f"Assigned 0/{len(assignments)} roles...")
+        results = await self.assign_roles(ctx.guild, assignments, progress)
+        await rest_scheduler.submit(partial(progress.edit, content=f"Finished: assigned {results['assigned']}/{len(assignments)} reward roles ({results['failed']} failed)."), "message_edit", progress.channel.id, key=("edit", progress.id), lane=COSMETIC)
+
+    async def assign_roles(self, guild, assignments, progress):
+        """Add roles with bounded concurrency, paced by the scheduler's member roles bucket."""
+        pending = iter(assignments)
+        results = {"assigned": 0, "failed": 0}
+
+        async def worker():
+            for member, role in pending:
+                try:
+                    await rest_scheduler.submit(partial(member.add_roles, role, reason="Retroactive level reward"), "member_roles", guild.id, key=("roles", member.id, role.id))
+                    results["assigned"] += 1
+                except discord.HTTPException as e:
+                    print(f"Error assigning {role.name} to {member}: {e}")
+                    results["failed"] += 1
+
+        async def report():
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                done = results["assigned"] + results["failed"]
+                rest_scheduler.schedule(partial(progress.edit, content=f"Assigned {done}/{len(assignments)} roles..."), "message_edit", progress.channel.id, key=("edit", progress.id), lane=COSMETIC)
+
+        reporter = asyncio.create_task(report())
+        try:
+            await asyncio.gather(*(worker() for _ in range(ROLE_ASSIGN_CONCURRENCY)))
+        finally:
+            reporter.cancel()
+        return results
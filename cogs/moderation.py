@@ -9,6 +9,8 @@ from datetime import datetime
 from discord.ext import commands
 import aiohttp
 import io
+from functools import partial
+from cogs.rest import rest_scheduler, MODERATION
 
 class Moderation(commands.Cog):
 
@@ -56,7 +58,7 @@ class Moderation(commands.Cog):
             inline=False)
         embed.set_footer(text="Banned at {}".format(data))
         await user.send(embed=embed)
-        await ctx.guild.ban(user, reason=reason)
+        await rest_scheduler.submit(partial(ctx.guild.ban, user, reason=reason), "moderation", ctx.guild.id, lane=MODERATION)
     
     @commands.slash_command(pass_context=True)
     @commands.has_role("STAFF")
@@ -97,7 +99,7 @@ class Moderation(commands.Cog):
             inline=False)
         embed.set_footer(text="Kicked at {}".format(data))
         await user.send(embed=embed)
-        await ctx.guild.kick(user, reason=reason)
+        await rest_scheduler.submit(partial(ctx.guild.kick, user, reason=reason), "moderation", ctx.guild.id, lane=MODERATION)
 
     @commands.slash_command()
     @commands.has_role("STAFF")
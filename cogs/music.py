@@ -1,22 +1,125 @@
 import discord
-from discord.ext import commands
-import yt_dlp
+from discord.ext import commands, tasks
 import asyncio
-from collections import deque
+import aiohttp
+import os
+import shlex
+import time
+from cogs.audio_cache import audio_cache, ffmpeg_headers, AUDIO_CACHE_MAX_BYTES
+from cogs.http import http
+from cogs.extractor import extractor, EXTRACT_WORKERS, GUILD_EXTRACT_LIMIT
+from cogs.player import GuildPlayer, Track, PlayerStateError, format_duration, PLAYING, PAUSED, MAX_QUEUE_LENGTH
+
+# yt-dlp options for searches and stream lookups; Opus streams can be sent to Discord as-is
+YDL_OPTIONS = {
+    'format': 'bestaudio[acodec=opus]/bestaudio/best',
+}
+
+# Reconnect to the stream host if the connection drops instead of ending the track early
+FFMPEG_BEFORE_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+
+# Bitrate (kbps) for streams that have to be transcoded to Opus
+TRANSCODE_BITRATE = 128
+
+# Seconds between samples of each guild's FFmpeg CPU time
+CPU_SAMPLE_INTERVAL = 5
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Seconds a player may sit idle, paused or alone in its channel before it disconnects
+IDLE_TIMEOUT = 5 * 60
+
+# Seconds between checks for idle players
+REAP_INTERVAL = 30
+
+# Sockets held by a connected voice client: the voice websocket and the UDP audio socket
+VOICE_CLIENT_SOCKETS = 2
+
+# Upcoming tracks whose streams are resolved ahead of time
+PREFETCH_TRACKS = 2
+
+# Seconds before the current track ends that the upcoming streams are resolved
+PREFETCH_LEAD = 30
+
+# Seconds to wait for a prefetched stream URL to answer
+PROBE_TIMEOUT = 5
+
+def process_cpu_seconds(pid):
+    """CPU time (user + system) a process has used so far, read from /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name can contain spaces, so split after its closing parenthesis
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+def process_resources(pid):
+    """Open sockets and resident memory in bytes of a process, read from /proc."""
+    sockets = 0
+    try:
+        for fd in os.listdir(f"/proc/{pid}/fd"):
+            try:
+                if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                    sockets += 1
+            except OSError:
+                continue  # Closed while we were looking
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+    return sockets, rss
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.queues = {}  # Server ID -> Queue of songs
-        self.now_playing = {}  # Server ID -> Current song
-        self.voice_clients = {}  # Server ID -> Voice client
-        self.song_owners = {}  # Server ID -> User ID of who added the song
-        self.music_channels = {}  # Server ID -> Channel ID for music messages
-
-    def get_queue(self, guild_id):
-        if guild_id not in self.queues:
-            self.queues[guild_id] = deque()
-        return self.queues[guild_id]
+        self.players = {}  # Server ID -> GuildPlayer
+        self.cache_downloads = set()  # Cache downloads, held so they aren't garbage collected while running
+        self.transitions = 0
+        self.prefetch_hits = 0
+        self.probe_failures = 0
+        self.last_gap_ms = 0.0
+        self.max_gap_ms = 0.0
+        self.total_gap_ms = 0.0
+        self.passthrough_tracks = 0
+        self.transcoded_tracks = 0
+        self.reaped = 0
+        self.sample_cpu.start()
+        self.reap_idle_players.start()
+        self.prune_play_counts.start()
+
+    def cog_unload(self):
+        self.sample_cpu.cancel()
+        self.reap_idle_players.cancel()
+        self.prune_play_counts.cancel()
+        for player in self.players.values():
+            self.cancel_prefetch(player)
+
+    def get_player(self, guild_id):
+        if guild_id not in self.players:
+            self.players[guild_id] = GuildPlayer(guild_id)
+        return self.players[guild_id]
+
+    async def disconnect_player(self, guild_id):
+        """Stop a guild's music, leave its voice channel and forget its player."""
+        player = self.players.pop(guild_id, None)
+        if not player:
+            return None
+        player.clear()
+        self.cancel_prefetch(player)
+        if player.voice_client and player.voice_client.is_connected():
+            await player.voice_client.disconnect(force=True)
+        return player
+
+    async def connect_player(self, ctx):
+        """Get the guild's player, joining the author's voice channel if it isn't connected."""
+        player = self.get_player(ctx.guild.id)
+        # Store the channel where the command was used
+        player.channel_id = ctx.channel.id
+        if not player.voice_client or not player.voice_client.is_connected():
+            player.voice_client = await ctx.author.voice.channel.connect()
+        return player
 
     def has_dj_role(self, member):
         """Check if a member has the DJ role"""
@@ -30,33 +133,24 @@ class Music(commands.Cog):
             await ctx.respond(embed=embed)
             return
 
-        # Store the channel where the command was used
-        self.music_channels[ctx.guild.id] = ctx.channel.id
-
-        # Get or create voice client
-        if ctx.guild.id not in self.voice_clients:
-            self.voice_clients[ctx.guild.id] = await ctx.author.voice.channel.connect()
-        elif not self.voice_clients[ctx.guild.id].is_connected():
-            self.voice_clients[ctx.guild.id] = await ctx.author.voice.channel.connect()
-
-        # Configure yt-dlp options
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-        }
-
-        embed = discord.Embed(title="Searching", description="Looking for your song...", color=discord.Color.blue())
-        message = await ctx.respond(embed=embed)
+        player = self.get_player(ctx.guild.id)
+        if player.full():
+            embed = discord.Embed(title="Error", description=f"The queue is full! ({MAX_QUEUE_LENGTH} songs)", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
 
+        # Keep the reaper away from the player while the user searches and chooses
+        claimed = player
+        claimed.commands += 1
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            player = await self.connect_player(ctx)
+            embed = discord.Embed(title="Searching", description="Looking for your song...", color=discord.Color.blue())
+            message = await ctx.respond(embed=embed)
+
+            try:
                 # Search for videos
-                search_results = ydl.extract_info(f"ytsearch5:{query}", download=False)['entries']
-                
+                search_results = await extractor.search(ctx.guild.id, query, YDL_OPTIONS)
+
                 if not search_results:
                     embed = discord.Embed(title="Error", description="No results found!", color=discord.Color.red())
                     await message.edit_original_response(embed=embed)
@@ -65,16 +159,10 @@ class Music(commands.Cog):
                 # Create select menu options
                 options = []
                 for i, result in enumerate(search_results, 1):
-                    title = result['title']
-                    duration = result.get('duration', 'Unknown')
-                    if isinstance(duration, int):
-                        minutes = duration // 60
-                        seconds = duration % 60
-                        duration = f"{minutes}:{seconds:02d}"
                     options.append(discord.SelectOption(
-                        label=f"{i}. {title[:100]}",  # Discord has a 100 char limit for labels
+                        label=f"{i}. {result['title'][:96]}",  # Discord has a 100 char limit for labels
                         value=str(i-1),
-                        description=f"Duration: {duration}"
+                        description=f"Duration: {format_duration(result['duration'])}"
                     ))
 
                 # Create select menu
@@ -97,98 +185,290 @@ class Music(commands.Cog):
 
                 try:
                     interaction = await self.bot.wait_for("interaction", check=check, timeout=60.0)
-                    selected_index = int(interaction.data['values'][0])
-                    selected_video = search_results[selected_index]
-                    
-                    # Get the video URL
-                    info = ydl.extract_info(selected_video['id'], download=False)
-                    title = info['title']
-                    url2 = info['url']
-
-                    # Add to queue
-                    queue = self.get_queue(ctx.guild.id)
-                    queue.append((title, url2))
-                    # Store who added the song
-                    if ctx.guild.id not in self.song_owners:
-                        self.song_owners[ctx.guild.id] = []
-                    self.song_owners[ctx.guild.id].append(ctx.author.id)
-
-                    if len(queue) == 1:  # If this is the first song
-                        embed = discord.Embed(title="Added to Queue", description=f"Added {title} and starting playback!", color=discord.Color.green())
-                        await message.edit_original_response(embed=embed, view=None)
-                        await self.play_next(ctx.guild)
-                    else:
-                        embed = discord.Embed(title="Added to Queue", description=title, color=discord.Color.green())
-                        await message.edit_original_response(embed=embed, view=None)
-
                 except asyncio.TimeoutError:
                     embed = discord.Embed(title="Timeout", description="You took too long to select a song!", color=discord.Color.red())
                     await message.edit_original_response(embed=embed, view=None)
                     return
 
-        except Exception as e:
-            embed = discord.Embed(title="Error", description=str(e), color=discord.Color.red())
-            await message.edit_original_response(embed=embed, view=None)
+                selected = search_results[int(interaction.data['values'][0])]
+                track = Track(selected['id'], selected['title'], selected['duration'], ctx.author.id)
+
+                # The bot may have been kicked or told to /leave while the user was choosing
+                if not ctx.author.voice:
+                    embed = discord.Embed(title="Error", description="You need to be in a voice channel!", color=discord.Color.red())
+                    await message.edit_original_response(embed=embed, view=None)
+                    return
+                player = await self.connect_player(ctx)
+
+                # Add to queue; the stream is resolved just before the track plays
+                try:
+                    player.enqueue(track)
+                except PlayerStateError:
+                    embed = discord.Embed(title="Error", description=f"The queue is full! ({MAX_QUEUE_LENGTH} songs)", color=discord.Color.red())
+                    await message.edit_original_response(embed=embed, view=None)
+                    return
+
+                if not player.busy:
+                    # play_next claims the player before its first await, so a second /play can't start it too
+                    await self.play_next(ctx.guild)
+                    embed = discord.Embed(title="Added to Queue", description=f"Added {track.title} and starting playback!", color=discord.Color.green())
+                    await message.edit_original_response(embed=embed, view=None)
+                else:
+                    embed = discord.Embed(title="Added to Queue", description=track.title, color=discord.Color.green())
+                    await message.edit_original_response(embed=embed, view=None)
+                    if len(player.queue) <= PREFETCH_TRACKS:
+                        self.schedule_prefetch(player)
+
+            except asyncio.TimeoutError:
+                embed = discord.Embed(title="Error", description="YouTube took too long to respond, please try again!", color=discord.Color.red())
+                await message.edit_original_response(embed=embed, view=None)
+            except Exception as e:
+                embed = discord.Embed(title="Error", description=str(e), color=discord.Color.red())
+                await message.edit_original_response(embed=embed, view=None)
+        finally:
+            claimed.commands -= 1
+
+    async def send_update(self, guild, player, embed):
+        if player.channel_id:
+            channel = guild.get_channel(player.channel_id)
+            if channel:
+                await channel.send(embed=embed)
 
     async def play_next(self, guild):
-        queue = self.get_queue(guild.id)
-        if not queue:
+        player = self.players.get(guild.id)
+        if not player:
             return
+        while True:
+            track = player.start_next()
+            if not track:
+                player.track_ended = None
+                return
 
-        title, url = queue[0]
-        self.now_playing[guild.id] = title
+            try:
+                # Popular tracks play from the local cache without touching YouTube
+                stream = None
+                path = audio_cache.lookup(track.id)
+                if path:
+                    prefetched = True
+                    source = discord.FFmpegOpusAudio(path, codec='opus')
+                else:
+                    prefetched = extractor.has_stream(track.id)
+                    stream = await extractor.stream_info(guild.id, track.id, YDL_OPTIONS)
+                    source = await self.audio_source(stream)
+                player.voice_client.play(source, after=self.after_track(guild, player))
+                player.source = source
+                player.transition(PLAYING)
+                self.record_transition(player, prefetched)
+                player.track_ends = self.bot.loop.time() + ((stream['duration'] if stream else track.duration) or 0)
+                self.schedule_prefetch(player)
+                if audio_cache.record_play(track.id) and stream:
+                    download = asyncio.create_task(audio_cache.populate(track.id, stream))
+                    self.cache_downloads.add(download)
+                    download.add_done_callback(self.cache_downloads.discard)
+            except Exception as e:
+                embed = discord.Embed(title="Error", description=f"Error playing song: {str(e)}", color=discord.Color.red())
+                await self.send_update(guild, player, embed)
+                continue
+
+            embed = discord.Embed(title="Now Playing", description=track.title, color=discord.Color.blue())
+            await self.send_update(guild, player, embed)
+            return
 
+    async def audio_source(self, stream):
+        """Send Opus streams straight through; have FFmpeg transcode anything else to Opus."""
+        codec = stream['acodec']
+        if not codec or codec == 'none':
+            # yt-dlp didn't say what the stream holds, so let ffprobe decide
+            codec, _ = await discord.FFmpegOpusAudio.probe(stream['url'])
+        passthrough = codec == 'opus'
+        if passthrough:
+            self.passthrough_tracks += 1
+        else:
+            self.transcoded_tracks += 1
+        # FFmpegOpusAudio copies the stream when told its codec is already Opus
+        return discord.FFmpegOpusAudio(
+            stream['url'],
+            bitrate=TRANSCODE_BITRATE,
+            codec='opus' if passthrough else None,
+            before_options=shlex.join([*shlex.split(FFMPEG_BEFORE_OPTIONS), *ffmpeg_headers(stream)])
+        )
+
+    @tasks.loop(seconds=CPU_SAMPLE_INTERVAL)
+    async def sample_cpu(self):
+        """Add up the CPU time of every guild's FFmpeg process."""
+        for player in list(self.players.values()):
+            process = getattr(player.source, '_process', None)
+            if player.state != PLAYING or not process:
+                continue
+            seconds = process_cpu_seconds(process.pid)
+            if seconds is None:
+                continue
+            pid, last = player.cpu_last
+            player.cpu_seconds += seconds - last if pid == process.pid else seconds
+            player.play_seconds += CPU_SAMPLE_INTERVAL
+            player.cpu_last = (process.pid, seconds)
+
+    def after_track(self, guild, player):
+        def callback(error):
+            # Runs on the audio thread as soon as the track stops
+            player.track_ended = time.perf_counter()
+            asyncio.run_coroutine_threadsafe(self.play_next(guild), self.bot.loop)
+        return callback
+
+    def record_transition(self, player, prefetched):
+        """Time from the end of the last track until the next one started playing."""
+        ended = player.track_ended
+        player.track_ended = None
+        if ended is None:
+            return
+        gap_ms = (time.perf_counter() - ended) * 1000
+        self.transitions += 1
+        if prefetched:
+            self.prefetch_hits += 1
+        self.last_gap_ms = gap_ms
+        self.max_gap_ms = max(self.max_gap_ms, gap_ms)
+        self.total_gap_ms += gap_ms
+
+    def schedule_prefetch(self, player):
+        self.cancel_prefetch(player)
+        player.prefetch_task = asyncio.create_task(self.prefetch(player))
+
+    def cancel_prefetch(self, player):
+        if player.prefetch_task:
+            player.prefetch_task.cancel()
+            player.prefetch_task = None
+
+    async def prefetch(self, player):
+        """Resolve and check the upcoming tracks' streams shortly before the current track ends."""
+        if player.track_ends:
+            await asyncio.sleep(max(player.track_ends - PREFETCH_LEAD - self.bot.loop.time(), 0))
+        for track in player.upcoming(PREFETCH_TRACKS):
+            if track.id in audio_cache:
+                continue
+            try:
+                stream = await extractor.stream_info(player.guild_id, track.id, YDL_OPTIONS)
+                if not await self.probe(stream):
+                    # Resolved URLs can go stale before they expire; fetch a fresh one
+                    self.probe_failures += 1
+                    extractor.forget_stream(track.id)
+                    await extractor.stream_info(player.guild_id, track.id, YDL_OPTIONS)
+            except Exception as e:
+                print(f"Error prefetching {track.title}: {e}")
+
+    async def probe(self, stream):
+        """Check that a stream URL still answers."""
         try:
-            self.voice_clients[guild.id].play(
-                discord.FFmpegPCMAudio(url),
-                after=lambda e: asyncio.run_coroutine_threadsafe(
-                    self.play_next(guild), self.bot.loop
-                )
-            )
-            if guild.id in self.music_channels:
-                channel = guild.get_channel(self.music_channels[guild.id])
-                if channel:
-                    embed = discord.Embed(title="Now Playing", description=title, color=discord.Color.blue())
-                    await channel.send(embed=embed)
-            # Remove the current song from the queue
-            queue.popleft()
-            if guild.id in self.song_owners and self.song_owners[guild.id]:
-                self.song_owners[guild.id].pop(0)
-        except Exception as e:
-            if guild.id in self.music_channels:
-                channel = guild.get_channel(self.music_channels[guild.id])
-                if channel:
-                    embed = discord.Embed(title="Error", description=f"Error playing song: {str(e)}", color=discord.Color.red())
-                    await channel.send(embed=embed)
-            queue.popleft()
-            if guild.id in self.song_owners and self.song_owners[guild.id]:
-                self.song_owners[guild.id].pop(0)
-            await self.play_next(guild)
+            async with http.get_session().head(stream['url'], headers=stream['http_headers'], timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as response:
+                return response.status < 400
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        player = self.players.get(member.guild.id)
+        if not player or not player.voice_client:
+            return
+        if member.id == self.bot.user.id:
+            if after.channel is None:
+                # Kicked or disconnected from voice; nothing left to play to
+                await self.disconnect_player(member.guild.id)
+                return
+            if before.channel == after.channel:
+                return
+            # Moved to another channel, whose listeners are the ones that count now
+            channel = after.channel
+            player.alone_since = None
+        else:
+            channel = player.voice_client.channel
+            if channel is None or channel not in (before.channel, after.channel):
+                return
+        if any(not listener.bot for listener in channel.members):
+            player.alone_since = None
+        elif player.alone_since is None:
+            player.alone_since = time.monotonic()
+
+    @tasks.loop(seconds=REAP_INTERVAL)
+    async def reap_idle_players(self):
+        """Disconnect players that have been idle, paused or alone for longer than IDLE_TIMEOUT."""
+        now = time.monotonic()
+        for guild_id, player in list(self.players.items()):
+            if player.inactive_for(now) < IDLE_TIMEOUT:
+                continue
+            await self.disconnect_player(guild_id)
+            self.reaped += 1
+            guild = self.bot.get_guild(guild_id)
+            if guild and player.voice_client:
+                embed = discord.Embed(title="Left Channel", description=f"I've left the voice channel after {IDLE_TIMEOUT // 60} minutes without music or listeners.", color=discord.Color.blue())
+                await self.send_update(guild, player, embed)
+
+    @tasks.loop(hours=24)
+    async def prune_play_counts(self):
+        """Forget the play counts of tracks nobody has played in a while."""
+        dropped = audio_cache.prune()
+        if dropped:
+            print(f"Pruned play counts of {dropped} uncached tracks")
+
+    def guild_resources(self, player):
+        """FFmpeg processes, open sockets and FFmpeg memory in bytes used by a guild's player."""
+        processes = sockets = memory = 0
+        if player.voice_client and player.voice_client.is_connected():
+            sockets += VOICE_CLIENT_SOCKETS
+        process = getattr(player.source, '_process', None)
+        if process and process.poll() is None:
+            usage = process_resources(process.pid)
+            if usage:
+                processes += 1
+                sockets += usage[0]
+                memory += usage[1]
+        return processes, sockets, memory
 
     @commands.slash_command()
     async def skip(self, ctx):
         """Skip the current song"""
-        if not ctx.guild.id in self.voice_clients or not self.voice_clients[ctx.guild.id].is_playing():
+        player = self.players.get(ctx.guild.id)
+        if not player or player.state not in (PLAYING, PAUSED):
             embed = discord.Embed(title="Error", description="Nothing is playing!", color=discord.Color.red())
             await ctx.respond(embed=embed)
             return
 
         # Check if user has DJ role or is the song owner
-        if not self.has_dj_role(ctx.author):
-            if ctx.guild.id not in self.song_owners or not self.song_owners[ctx.guild.id]:
-                embed = discord.Embed(title="Permission Denied", description="You need the DJ role to skip songs!", color=discord.Color.red())
-                await ctx.respond(embed=embed)
-                return
-            if self.song_owners[ctx.guild.id][0] != ctx.author.id:
-                embed = discord.Embed(title="Permission Denied", description="You can only skip your own songs unless you have the DJ role!", color=discord.Color.red())
-                await ctx.respond(embed=embed)
-                return
+        if not self.has_dj_role(ctx.author) and player.current.requester != ctx.author.id:
+            embed = discord.Embed(title="Permission Denied", description="You can only skip your own songs unless you have the DJ role!", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
+
+        # Stopping the track hands over to the next one
+        player.voice_client.stop()
+        embed = discord.Embed(title="Skipped", description="Current song has been skipped!", color=discord.Color.green())
+        await ctx.respond(embed=embed)
 
-        self.voice_clients[ctx.guild.id].stop()
-        if ctx.guild.id in self.song_owners and self.song_owners[ctx.guild.id]:
-            self.song_owners[ctx.guild.id].pop(0)
-            embed = discord.Embed(title="Skipped", description="Current song has been skipped!", color=discord.Color.green())
+    @commands.slash_command()
+    async def pause(self, ctx):
+        """Pause the current song"""
+        player = self.players.get(ctx.guild.id)
+        if not player or player.state != PLAYING:
+            embed = discord.Embed(title="Error", description="Nothing is playing!", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
+
+        player.voice_client.pause()
+        player.transition(PAUSED)
+        embed = discord.Embed(title="Paused", description=player.current.title, color=discord.Color.green())
+        await ctx.respond(embed=embed)
+
+    @commands.slash_command()
+    async def resume(self, ctx):
+        """Resume the paused song"""
+        player = self.players.get(ctx.guild.id)
+        if not player or player.state != PAUSED:
+            embed = discord.Embed(title="Error", description="Nothing is paused!", color=discord.Color.red())
             await ctx.respond(embed=embed)
+            return
+
+        player.voice_client.resume()
+        player.transition(PLAYING)
+        embed = discord.Embed(title="Resumed", description=player.current.title, color=discord.Color.green())
+        await ctx.respond(embed=embed)
 
     @commands.slash_command()
     async def stop(self, ctx):
@@ -198,10 +478,12 @@ class Music(commands.Cog):
             await ctx.respond(embed=embed)
             return
 
-        if ctx.guild.id in self.voice_clients:
-            self.voice_clients[ctx.guild.id].stop()
-            self.queues[ctx.guild.id] = deque()
-            self.song_owners[ctx.guild.id] = []
+        player = self.players.get(ctx.guild.id)
+        if player and player.voice_client:
+            player.clear()
+            self.cancel_prefetch(player)
+            # With the queue empty, the finished track leaves the player idle
+            player.voice_client.stop()
             embed = discord.Embed(title="Stopped", description="Playback stopped and queue cleared!", color=discord.Color.green())
             await ctx.respond(embed=embed)
         else:
@@ -209,18 +491,63 @@ class Music(commands.Cog):
             await ctx.respond(embed=embed)
 
     @commands.slash_command()
-    async def queue(self, ctx):
+    async def queue(self, ctx, page: int = 1):
         """Show the current queue"""
-        queue = self.get_queue(ctx.guild.id)
-        if not queue:
+        player = self.players.get(ctx.guild.id)
+        if not player or (not player.queue and not player.current):
             embed = discord.Embed(title="Queue", description="The queue is empty!", color=discord.Color.blue())
             await ctx.respond(embed=embed)
             return
 
-        embed = discord.Embed(title="Music Queue", color=discord.Color.blue())
-        for i, (title, _) in enumerate(queue, 1):
-            embed.add_field(name=f"{i}.", value=title, inline=False)
+        page = min(max(page, 1), player.page_count())
+        lines = []
+        if player.current:
+            lines.append(f"**Now {player.state}:** {player.current.title} [{format_duration(player.current.duration)}] (<@{player.current.requester}>)\n")
+        for entry, track in player.page(page - 1):
+            lines.append(f"`#{entry}` {track.title} [{format_duration(track.duration)}] (<@{track.requester}>)")
+        if not player.queue:
+            lines.append("Nothing queued after this song.")
+
+        embed = discord.Embed(title="Music Queue", description="\n".join(lines), color=discord.Color.blue())
+        embed.set_footer(text=f"Page {page}/{player.page_count()} • {len(player.queue)}/{MAX_QUEUE_LENGTH} songs • Use the # number with /remove or /move")
+        await ctx.respond(embed=embed)
 
+    @commands.slash_command()
+    async def remove(self, ctx, number: int):
+        """Remove a song from the queue by its # number"""
+        player = self.players.get(ctx.guild.id)
+        track = player.queue.get(number) if player else None
+        if not track:
+            embed = discord.Embed(title="Error", description=f"There's no #{number} in the queue!", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
+        if not self.has_dj_role(ctx.author) and track.requester != ctx.author.id:
+            embed = discord.Embed(title="Permission Denied", description="You can only remove your own songs unless you have the DJ role!", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
+
+        player.remove(number)
+        embed = discord.Embed(title="Removed", description=track.title, color=discord.Color.green())
+        await ctx.respond(embed=embed)
+
+    @commands.slash_command()
+    async def move(self, ctx, number: int):
+        """Move a song to the front of the queue by its # number"""
+        if not self.has_dj_role(ctx.author):
+            embed = discord.Embed(title="Permission Denied", description="You need the DJ role to reorder the queue!", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
+
+        player = self.players.get(ctx.guild.id)
+        track = player.move_to_front(number) if player else None
+        if not track:
+            embed = discord.Embed(title="Error", description=f"There's no #{number} in the queue!", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
+
+        if player.busy:
+            self.schedule_prefetch(player)
+        embed = discord.Embed(title="Moved", description=f"{track.title} will play next!", color=discord.Color.green())
         await ctx.respond(embed=embed)
 
     @commands.slash_command()
@@ -231,16 +558,85 @@ class Music(commands.Cog):
             await ctx.respond(embed=embed)
             return
 
-        if ctx.guild.id in self.voice_clients:
-            await self.voice_clients[ctx.guild.id].disconnect()
-            del self.voice_clients[ctx.guild.id]
-            if ctx.guild.id in self.song_owners:
-                del self.song_owners[ctx.guild.id]
+        player = await self.disconnect_player(ctx.guild.id)
+        if player and player.voice_client:
             embed = discord.Embed(title="Left Channel", description="I've left the voice channel!", color=discord.Color.green())
             await ctx.respond(embed=embed)
         else:
             embed = discord.Embed(title="Error", description="I'm not in a voice channel!", color=discord.Color.red())
             await ctx.respond(embed=embed)
 
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def voice_sessions(self, ctx):
+        """Show every guild's voice session and the resources it holds."""
+        now = time.monotonic()
+        totals = [0, 0, 0]
+        lines = []
+        for player in sorted(self.players.values(), key=lambda player: player.inactive_for(now)):
+            processes, sockets, memory = self.guild_resources(player)
+            totals[0] += processes
+            totals[1] += sockets
+            totals[2] += memory
+            guild = self.bot.get_guild(player.guild_id)
+            inactive = player.inactive_for(now)
+            status = f"{player.state}, inactive {inactive:.0f}s" if inactive else player.state
+            lines.append(f"**{guild.name if guild else player.guild_id}**: {status} • {processes} ffmpeg, {sockets} sockets, {memory / 1024 ** 2:.1f} MB")
+
+        embed = discord.Embed(title="Voice Sessions", description="\n".join(lines[:20]) or "No voice sessions.", color=discord.Color.blue())
+        embed.add_field(name="Sessions", value=str(len(self.players)), inline=True)
+        embed.add_field(name="FFmpeg Processes", value=str(totals[0] + len(audio_cache.downloads)), inline=True)
+        embed.add_field(name="Sockets", value=str(totals[1]), inline=True)
+        embed.add_field(name="FFmpeg Memory", value=f"{totals[2] / 1024 ** 2:.1f} MB", inline=True)
+        embed.add_field(name="Idle Disconnects", value=f"{self.reaped} (after {IDLE_TIMEOUT}s)", inline=True)
+        await ctx.respond(embed=embed, ephemeral=True)
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def music_stats(self, ctx):
+        """Show music extraction pool statistics."""
+        average_ms = extractor.total_ms / extractor.completed if extractor.completed else 0.0
+
+        embed = discord.Embed(title="Music Stats", color=discord.Color.blue())
+        embed.add_field(name="Extractions", value=f"{extractor.active}/{EXTRACT_WORKERS} running, {extractor.queued()} queued (max {extractor.max_pending} pending)", inline=False)
+        embed.add_field(name="Completed", value=str(extractor.completed), inline=True)
+        embed.add_field(name="Failed", value=str(extractor.failed), inline=True)
+        embed.add_field(name="Timed Out", value=str(extractor.timeouts), inline=True)
+        embed.add_field(name="Cancelled", value=str(extractor.cancelled), inline=True)
+        embed.add_field(name="Latency", value=f"avg {average_ms:.0f} ms, max {extractor.max_ms:.0f} ms", inline=True)
+        embed.add_field(name="Per-Guild Limit", value=str(GUILD_EXTRACT_LIMIT), inline=True)
+        average_gap = self.total_gap_ms / self.transitions if self.transitions else 0.0
+        embed.add_field(
+            name="Track Transitions",
+            value=f"{self.transitions} transitions, {self.prefetch_hits} prefetched, {self.probe_failures} stale streams re-resolved\nGap last {self.last_gap_ms:.0f} ms, avg {average_gap:.0f} ms, max {self.max_gap_ms:.0f} ms",
+            inline=False
+        )
+        embed.add_field(name="Players", value=f"{sum(1 for player in self.players.values() if player.busy)} active of {len(self.players)}", inline=False)
+        cpu_total = sum(player.cpu_seconds for player in self.players.values())
+        play_total = sum(player.play_seconds for player in self.players.values())
+        audio = f"{self.passthrough_tracks} passthrough, {self.transcoded_tracks} transcoded tracks"
+        if cpu_total:
+            audio += f"\nFFmpeg used {cpu_total / play_total:.1%} of a core per playing guild (~{play_total / cpu_total:.0f} guilds per core)"
+        busiest = sorted(self.players.values(), key=lambda player: player.cpu_seconds, reverse=True)[:5]
+        for player in busiest:
+            if not player.cpu_seconds:
+                break
+            guild = self.bot.get_guild(player.guild_id)
+            audio += f"\n{guild.name if guild else player.guild_id}: {player.cpu_seconds:.1f}s CPU over {player.play_seconds:.0f}s played"
+        embed.add_field(name="Audio", value=audio, inline=False)
+        if audio_cache.enabled:
+            embed.add_field(
+                name="Audio Cache",
+                value=f"{len(audio_cache.lru)} tracks, {audio_cache.total_bytes / 1024 ** 2:.0f}/{AUDIO_CACHE_MAX_BYTES / 1024 ** 2:.0f} MB, {audio_cache.hits} hits, {audio_cache.misses} misses\n{audio_cache.downloaded} downloaded ({len(audio_cache.downloads)} in progress, {audio_cache.download_failures} failed), {audio_cache.evictions} evicted, {audio_cache.pruned} play counts pruned",
+                inline=False
+            )
+        for name, cache in (("Search Cache", extractor.searches), ("Stream Cache", extractor.streams)):
+            embed.add_field(
+                name=name,
+                value=f"{len(cache)}/{cache.maxsize} entries, {cache.hits} hits, {cache.misses} misses ({cache.hit_rate():.0%}), {cache.expired} expired, {cache.evictions} evicted",
+                inline=False
+            )
+        await ctx.respond(embed=embed, ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(Music(bot)) 
\ No newline at end of file
@@ -0,0 +1,282 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import discord
+from discord.ext import commands, tasks
+import asyncio
+import atexit
+import json
+import os
+import time
+from cogs.database import database
+
+# How often dirty rows are written to the database
+FLUSH_INTERVAL_SECONDS = 30
+
+def load_json_file(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+class Store:
+    """A table of JSON rows mirrored in memory and written back a row at a time.
+
+    `depth` is how many levels of nested dict keys identify a row, e.g. 2 for
+    levels_data[guild_id][user_id].
+    """
+
+    def __init__(self, name, depth=1, legacy_file=None, encode=None, decode=None):
+        self.table = name
+        self.depth = depth
+        self.legacy_file = legacy_file  # JSON file this store used to live in
+        self.encode = encode  # Optional json.dumps default= hook for non-JSON values
+        self.decode = decode  # Optional hook applied to every loaded row
+        self.data = {}
+        self.dirty_keys = set()
+        self.dirty_all = False
+        self.marks = 0  # Number of mark_dirty() calls since startup
+        self.subscribers = []  # Called after an import replaces the data
+
+    @property
+    def dirty(self):
+        return self.dirty_all or bool(self.dirty_keys)
+
+    def mark_dirty(self, *key):
+        """Schedule one row (or, without a full key, the whole store) for the next flush."""
+        if len(key) == self.depth:
+            self.dirty_keys.add(tuple(str(part) for part in key))
+        else:
+            self.dirty_all = True
+        self.marks += 1
+
+    def load(self):
+        database.execute_sync(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
+        rows = database.execute_sync(f"SELECT key, value FROM {self.table}")
+        if rows:
+            for key, value in rows:
+                self.set_row(key.split('/'), json.loads(value))
+        elif self.legacy_file and os.path.exists(self.legacy_file):
+            # First start on SQLite: pull the data over from the old JSON file
+            count = self.import_json(load_json_file(self.legacy_file))
+            print(f"Imported {count} rows from {self.legacy_file} into {self.table}")
+
+    def subscribe(self, callback):
+        """Register a `callback()` to rebuild whatever is derived from the data after an import."""
+        if callback not in self.subscribers:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def import_json(self, document):
+        """Replace the in-memory data with a legacy JSON document and mark everything dirty."""
+        self.data.clear()
+        count = 0
+        for key, value in self.iter_rows(document):
+            self.set_row(key, value)
+            count += 1
+        self.dirty_all = True
+        for callback in self.subscribers:
+            callback()
+        return count
+
+    def set_row(self, key, value):
+        node = self.data
+        for part in key[:-1]:
+            node = node.setdefault(part, {})
+        node[key[-1]] = self.decode(value) if self.decode else value
+
+    def get_row(self, key):
+        node = self.data
+        for part in key:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def iter_rows(self, node=None, depth=None, prefix=()):
+        node = self.data if node is None else node
+        depth = self.depth if depth is None else depth
+        for key, value in node.items():
+            if depth == 1:
+                yield prefix + (key,), value
+            else:
+                yield from self.iter_rows(value, depth - 1, prefix + (key,))
+
+    def encode_row(self, value):
+        return json.dumps(value, separators=(',', ':'), default=self.encode)
+
+    def collect(self):
+        """Serialize the dirty rows into SQL statements and clear the dirty state.
+
+        The dirty state is handed back with the statements so it can be restored
+        if the transaction they go into fails.
+        """
+        statements = []
+        upsert = f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)"
+        if self.dirty_all:
+            rows = [('/'.join(key), self.encode_row(value)) for key, value in self.iter_rows()]
+            statements.append((f"DELETE FROM {self.table}", [()]))
+            statements.append((upsert, rows))
+        else:
+            rows = []
+            deletes = []
+            for key in self.dirty_keys:
+                value = self.get_row(key)
+                if value is None:
+                    deletes.append(('/'.join(key),))
+                else:
+                    rows.append(('/'.join(key), self.encode_row(value)))
+            if deletes:
+                statements.append((f"DELETE FROM {self.table} WHERE key = ?", deletes))
+            if rows:
+                statements.append((upsert, rows))
+        taken = (self.dirty_keys, self.dirty_all)
+        self.dirty_keys = set()
+        self.dirty_all = False
+        return statements, taken
+
+    def restore(self, taken):
+        """Mark rows dirty again after the flush that was writing them failed."""
+        dirty_keys, dirty_all = taken
+        self.dirty_keys |= dirty_keys
+        self.dirty_all = self.dirty_all or dirty_all
+
+class PersistenceService:
+    """Tracks dirty rows and coalesces them into periodic background transactions."""
+
+    def __init__(self):
+        self.stores = {}
+        self.flush_count = 0
+        self.rows_written = 0
+        self.rows_deleted = 0
+        self.bytes_written = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.flush_failures = 0
+
+    def register(self, name, depth=1, legacy_file=None, encode=None, decode=None):
+        """Load the store called name (or reuse it if already registered) and track it for flushing."""
+        if name not in self.stores:
+            store = Store(name, depth, legacy_file, encode, decode)
+            store.load()
+            self.stores[name] = store
+        return self.stores[name]
+
+    def collect_dirty(self):
+        # Serialize on the calling (event loop) thread so the cogs can keep mutating
+        # their dicts without locking; only the SQLite work is handed to the worker.
+        statements = []
+        taken = []
+        for store in self.stores.values():
+            if store.dirty:
+                store_statements, store_taken = store.collect()
+                statements.extend(store_statements)
+                taken.append((store, store_taken))
+        return statements, taken
+
+    def restore(self, taken):
+        self.flush_failures += 1
+        for store, store_taken in taken:
+            store.restore(store_taken)
+
+    def write_statements(self, statements):
+        start = time.perf_counter()
+        database.transaction_sync(statements)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for sql, rows in statements:
+            if sql.startswith("DELETE"):
+                if "WHERE" in sql:
+                    self.rows_deleted += len(rows)
+            else:
+                self.rows_written += len(rows)
+                self.bytes_written += sum(len(key) + len(value) for key, value in rows)
+        self.flush_count += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+
+    async def flush(self):
+        """Write every dirty row on the database thread."""
+        statements, taken = self.collect_dirty()
+        if statements:
+            try:
+                await database.run(self.write_statements, statements)
+            except BaseException:
+                # Nothing was committed; keep the rows dirty for the next flush
+                self.restore(taken)
+                raise
+
+    def flush_now(self):
+        """Synchronously write every dirty row. Used at shutdown."""
+        statements, taken = self.collect_dirty()
+        if statements:
+            try:
+                self.write_statements(statements)
+            except BaseException:
+                self.restore(taken)
+                raise
+
+# Shared service every cog registers its stores with
+persistence = PersistenceService()
+
+# Make sure nothing marked dirty since the last interval is lost when the bot exits
+atexit.register(persistence.flush_now)
+
+class Persistence(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.flush_stores.start()
+
+    def cog_unload(self):
+        self.flush_stores.cancel()
+        persistence.flush_now()
+
+    @tasks.loop(seconds=FLUSH_INTERVAL_SECONDS)
+    async def flush_stores(self):
+        # An exception escaping a tasks.loop stops it for good, so log it and try again next interval
+        try:
+            await persistence.flush()
+        except Exception as e:
+            print(f"Error flushing stores: {e}")
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def persistence_stats(self, ctx):
+        """Show write-behind flush statistics."""
+        marks = sum(store.marks for store in persistence.stores.values())
+        dirty = sum(1 for store in persistence.stores.values() if store.dirty)
+        average_ms = persistence.total_flush_ms / persistence.flush_count if persistence.flush_count else 0.0
+
+        embed = discord.Embed(title="Persistence Stats", color=discord.Color.blue())
+        embed.add_field(name="Stores", value=f"{len(persistence.stores)} ({dirty} dirty)", inline=False)
+        embed.add_field(name="Flushes", value=f"{persistence.flush_count} ({persistence.flush_failures} failed)", inline=True)
+        embed.add_field(name="Rows Written", value=str(persistence.rows_written), inline=True)
+        embed.add_field(name="Rows Deleted", value=str(persistence.rows_deleted), inline=True)
+        embed.add_field(name="Writes Coalesced", value=str(max(marks - persistence.rows_written - persistence.rows_deleted, 0)), inline=True)
+        embed.add_field(name="Bytes Written", value=f"{persistence.bytes_written:,}", inline=True)
+        embed.add_field(name="Flush Latency", value=f"last {persistence.last_flush_ms:.1f} ms, avg {average_ms:.1f} ms, max {persistence.max_flush_ms:.1f} ms", inline=False)
+        await ctx.respond(embed=embed, ephemeral=True)
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def migrate_json(self, ctx, overwrite: bool = False):
+        """Import the legacy JSON data files into the database."""
+        await ctx.defer(ephemeral=True)
+        results = []
+        for store in persistence.stores.values():
+            if not store.legacy_file or not os.path.exists(store.legacy_file):
+                continue
+            if store.data and not overwrite:
+                results.append(f"{store.legacy_file}: skipped (already has data)")
+                continue
+            document = await asyncio.to_thread(load_json_file, store.legacy_file)
+            count = store.import_json(document)
+            results.append(f"{store.legacy_file}: imported {count} rows")
+        await persistence.flush()
+        await ctx.respond("\n".join(results) or "No JSON files to import.", ephemeral=True)
+
+def setup(bot):
+    bot.add_cog(Persistence(bot))
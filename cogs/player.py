@@ -0,0 +1,146 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import time
+from collections import OrderedDict
+from itertools import islice
+
+# Tracks one guild can have waiting in its queue
+MAX_QUEUE_LENGTH = 100
+
+# Tracks shown per page of /queue
+QUEUE_PAGE_SIZE = 10
+
+# Player states
+IDLE = "idle"
+STARTING = "starting"  # Resolving the next track's stream
+PLAYING = "playing"
+PAUSED = "paused"
+
+# State -> states it may move to
+TRANSITIONS = {
+    IDLE: {STARTING},
+    STARTING: {PLAYING, STARTING, IDLE},  # STARTING again when a track fails and the next one is tried
+    PLAYING: {PAUSED, STARTING, IDLE},
+    PAUSED: {PLAYING, STARTING, IDLE},
+}
+
+class PlayerStateError(Exception):
+    pass
+
+def format_duration(seconds):
+    if not isinstance(seconds, (int, float)):
+        return "Unknown"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+class Track:
+    __slots__ = ('id', 'title', 'duration', 'requester')
+
+    def __init__(self, id, title, duration, requester):
+        self.id = id  # Video ID; the stream is resolved when the track is about to play
+        self.title = title
+        self.duration = duration
+        self.requester = requester  # User ID
+
+class GuildPlayer:
+    """One guild's voice connection, queue and playback state.
+
+    Queue entries get a number when they are added that stays the same while the
+    tracks ahead of them play, so removing or moving an entry is a dict operation.
+    """
+
+    def __init__(self, guild_id, max_queue=MAX_QUEUE_LENGTH):
+        self.guild_id = guild_id
+        self.max_queue = max_queue
+        self.state = IDLE
+        self.queue = OrderedDict()  # Entry number -> Track, in play order
+        self.next_entry = 1
+        self.current = None
+        self.voice_client = None
+        self.channel_id = None  # Channel for Now Playing messages
+        self.source = None  # FFmpeg source of the current track
+        self.track_ends = None  # Event loop time the current track should end
+        self.track_ended = None  # perf_counter() when the last track finished
+        self.prefetch_task = None
+        self.cpu_last = (None, 0.0)  # (FFmpeg PID, CPU seconds at the last sample)
+        self.cpu_seconds = 0.0
+        self.play_seconds = 0.0
+        self.idle_since = time.monotonic()  # When the player stopped or paused, None while it plays
+        self.alone_since = None  # When the last listener left the voice channel
+        self.commands = 0  # Commands part way through setting up playback, e.g. /play waiting for a selection
+
+    def transition(self, state):
+        if state not in TRANSITIONS[self.state]:
+            raise PlayerStateError(f"Player can't go from {self.state} to {state}")
+        self.state = state
+        if state in (IDLE, PAUSED):
+            self.idle_since = self.idle_since or time.monotonic()
+        else:
+            self.idle_since = None
+
+    def inactive_for(self, now=None):
+        """Seconds the player has been idle, paused or alone in its channel (0 if it is in use)."""
+        if self.commands:
+            return 0.0
+        now = now if now is not None else time.monotonic()
+        since = [moment for moment in (self.idle_since, self.alone_since) if moment is not None]
+        return now - min(since) if since else 0.0
+
+    @property
+    def busy(self):
+        """Whether a track is playing, paused or about to start."""
+        return self.state != IDLE
+
+    def full(self):
+        return len(self.queue) >= self.max_queue
+
+    def enqueue(self, track):
+        """Add a track to the end of the queue and return its entry number."""
+        if self.full():
+            raise PlayerStateError("The queue is full")
+        entry = self.next_entry
+        self.next_entry += 1
+        self.queue[entry] = track
+        return entry
+
+    def remove(self, entry):
+        """Take an entry out of the queue, returning its track (or None if there is no such entry)."""
+        return self.queue.pop(entry, None)
+
+    def move_to_front(self, entry):
+        if entry not in self.queue:
+            return None
+        self.queue.move_to_end(entry, last=False)
+        return self.queue[entry]
+
+    def upcoming(self, count):
+        return list(islice(self.queue.values(), count))
+
+    def start_next(self):
+        """Take the next track off the queue and move to STARTING, or go IDLE if there is none."""
+        if not self.queue:
+            self.stop()
+            return None
+        _, self.current = self.queue.popitem(last=False)
+        self.transition(STARTING)
+        return self.current
+
+    def stop(self):
+        if self.state != IDLE:
+            self.transition(IDLE)
+        self.current = None
+        self.source = None
+        self.track_ends = None
+
+    def clear(self):
+        self.queue.clear()
+
+    def page(self, page, page_size=QUEUE_PAGE_SIZE):
+        """(entry number, track) pairs on a 0-based page of the queue."""
+        start = page * page_size
+        return list(islice(self.queue.items(), start, start + page_size))
+
+    def page_count(self, page_size=QUEUE_PAGE_SIZE):
+        return max((len(self.queue) + page_size - 1) // page_size, 1)
@@ -0,0 +1,192 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+from bisect import bisect_left, insort
+
+class SortedList:
+    """Sorted sequence split into bounded sublists.
+
+    A Fenwick tree over the sublist lengths makes positional lookups O(log n);
+    inserts and removals only shift one sublist of at most 2 * LOAD items.
+    """
+
+    LOAD = 500
+
+    def __init__(self, values=()):
+        values = sorted(values)
+        self.lists = [values[i:i + self.LOAD] for i in range(0, len(values), self.LOAD)]
+        self.maxes = [sublist[-1] for sublist in self.lists]
+        self.size = len(values)
+        self.rebuild_tree()
+
+    def __len__(self):
+        return self.size
+
+    def rebuild_tree(self):
+        self.tree = [len(sublist) for sublist in self.lists]
+        for i in range(len(self.tree)):
+            parent = i | (i + 1)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def tree_add(self, index, delta):
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index |= index + 1
+
+    def tree_prefix(self, index):
+        """Number of values stored in the sublists before `index`."""
+        total = 0
+        while index > 0:
+            total += self.tree[index - 1]
+            index &= index - 1
+        return total
+
+    def tree_find(self, position):
+        """Sublist index and offset of the value at `position`."""
+        index = 0
+        bit = 1 << len(self.tree).bit_length()
+        while bit:
+            nxt = index + bit
+            if nxt <= len(self.tree) and self.tree[nxt - 1] <= position:
+                index = nxt
+                position -= self.tree[nxt - 1]
+            bit >>= 1
+        return index, position
+
+    def add(self, value):
+        if not self.lists:
+            self.lists.append([value])
+            self.maxes.append(value)
+            self.size = 1
+            self.rebuild_tree()
+            return
+        i = bisect_left(self.maxes, value)
+        if i == len(self.lists):
+            i -= 1
+        sublist = self.lists[i]
+        insort(sublist, value)
+        self.maxes[i] = sublist[-1]
+        self.size += 1
+        if len(sublist) > 2 * self.LOAD:
+            self.lists[i:i + 1] = [sublist[:self.LOAD], sublist[self.LOAD:]]
+            self.maxes[i:i + 1] = [self.lists[i][-1], self.lists[i + 1][-1]]
+            self.rebuild_tree()
+        else:
+            self.tree_add(i, 1)
+
+    def remove(self, value):
+        i = bisect_left(self.maxes, value)
+        if i == len(self.lists):
+            raise ValueError(f"{value!r} not in list")
+        sublist = self.lists[i]
+        j = bisect_left(sublist, value)
+        if j == len(sublist) or sublist[j] != value:
+            raise ValueError(f"{value!r} not in list")
+        del sublist[j]
+        self.size -= 1
+        if sublist:
+            self.maxes[i] = sublist[-1]
+            self.tree_add(i, -1)
+        else:
+            del self.lists[i]
+            del self.maxes[i]
+            self.rebuild_tree()
+
+    def bisect_left(self, value):
+        """Position of the first stored value >= value."""
+        i = bisect_left(self.maxes, value)
+        if i == len(self.lists):
+            return self.size
+        return self.tree_prefix(i) + bisect_left(self.lists[i], value)
+
+    def islice(self, start, stop):
+        """Yield the values at positions start..stop-1."""
+        start = max(start, 0)
+        stop = min(stop, self.size)
+        if start >= stop:
+            return
+        i, j = self.tree_find(start)
+        remaining = stop - start
+        while remaining > 0:
+            sublist = self.lists[i]
+            chunk = sublist[j:j + remaining]
+            yield from chunk
+            remaining -= len(chunk)
+            i, j = i + 1, 0
+
+class RankIndex:
+    """Leaderboard kept in rank order as scores change.
+
+    Scores are tuples compared highest-first (e.g. (level, xp)); users with equal
+    scores share a rank, like the ranking the leaderboards have always shown.
+    """
+
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})
+        self.entries = SortedList(self.entry(user_id, score) for user_id, score in self.scores.items())
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def entry(user_id, score):
+        return (tuple(-value for value in score), user_id)
+
+    def update(self, user_id, score):
+        old_score = self.scores.get(user_id)
+        if old_score == score:
+            return
+        if old_score is not None:
+            self.entries.remove(self.entry(user_id, old_score))
+        self.scores[user_id] = score
+        self.entries.add(self.entry(user_id, score))
+
+    def discard(self, user_id):
+        old_score = self.scores.pop(user_id, None)
+        if old_score is not None:
+            self.entries.remove(self.entry(user_id, old_score))
+
+    def rank_of_score(self, score):
+        return self.entries.bisect_left((tuple(-value for value in score),)) + 1
+
+    def rank(self, user_id):
+        """1-based rank of a user, or None if they are not ranked."""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.rank_of_score(score)
+
+    def position(self, user_id):
+        """0-based position of a user in leaderboard order, or None if they are not ranked."""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.entries.bisect_left(self.entry(user_id, score))
+
+    def slice(self, start, stop):
+        """(user_id, rank, score) for the leaderboard positions start..stop-1."""
+        start = max(start, 0)
+        results = []
+        previous = None
+        rank = None
+        for index, (negated, user_id) in enumerate(self.entries.islice(start, stop), start=start):
+            score = tuple(-value for value in negated)
+            if previous is None:
+                rank = self.rank_of_score(score)
+            elif score != previous:
+                rank = index + 1
+            results.append((user_id, rank, score))
+            previous = score
+        return results
+
+    def page(self, page, page_size=10):
+        return self.slice(page * page_size, (page + 1) * page_size)
+
+    def around(self, user_id, radius=2):
+        """The user's entry plus up to `radius` neighbours on each side."""
+        position = self.position(user_id)
+        if position is None:
+            return []
+        return self.slice(position - radius, position + radius + 1)
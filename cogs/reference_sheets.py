@@ -4,37 +4,72 @@
 
 import discord
 from discord.ext import commands
-import json
-import os
 from datetime import datetime
-import requests
-import io
+import aiohttp
+import asyncio
+import os
+import tempfile
+from cogs.http import http, HttpError
+from cogs.image_storage import storage, backends, resolve_url, LOCAL_PREFIX
+from cogs.images import image_pipeline, OUTPUT_EXTENSION
+from cogs.persistence import persistence
 
 # File to store reference image data
 REFERENCE_FILE = 'reference_images.json'
 
 # Load or initialize reference image data
-if os.path.exists(REFERENCE_FILE):
-    with open(REFERENCE_FILE, 'r') as f:
-        reference_data = json.load(f)
-else:
-    reference_data = {}
-
-# Function to save reference image data
-def save_references():
-    with open(REFERENCE_FILE, 'w') as f:
-        json.dump(reference_data, f, indent=4)
-
-# Replace hardcoded API key with loading from local file
-try:
-    with open('imgbb.key', 'r') as f:
-        IMGBB_API_KEY = f.read().strip()
-except FileNotFoundError:
-    IMGBB_API_KEY = 'YOUR_IMGBB_API_KEY'  # Fallback if file not found
+reference_store = persistence.register('reference_images', legacy_file=REFERENCE_FILE)
+reference_data = reference_store.data
+
+# Function to save a user's reference images (written back by the persistence service)
+def save_references(user_id):
+    reference_store.mark_dirty(user_id)
+
+# Images already stored: SHA-256 of the original file -> {"url", "thumbnail"} locators
+image_store = persistence.register('reference_hashes')
+image_hashes = image_store.data
+
+# Largest image imgbb accepts
+MAX_IMAGE_BYTES = 32 * 1024 * 1024
+
+def megabytes(size):
+    return f"{size / (1024 * 1024):.2f} MB"
+
+def uses_local_storage():
+    """Whether any reference is in the local store, or new ones will be."""
+    return storage.name == "local" or any(
+        locator.startswith(LOCAL_PREFIX)
+        for references in reference_data.values()
+        for locator in references.values()
+    )
 
 class ReferenceImages(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.storage_started = False
+        self.build_index()
+        reference_store.subscribe(self.build_index)
+
+    def build_index(self):
+        # (user ID, character) -> image URL, so /ref never has to resolve a locator
+        self.ref_index = {
+            (user_id, character): resolve_url(locator)
+            for user_id, references in reference_data.items()
+            for character, locator in references.items()
+        }
+
+    def cog_unload(self):
+        image_pipeline.shutdown()
+        reference_store.unsubscribe(self.build_index)
+        if self.storage_started:
+            asyncio.ensure_future(backends["local"].stop())
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready fires again after reconnects; only start serving once
+        if not self.storage_started and uses_local_storage():
+            await backends["local"].start()
+            self.storage_started = True
 
     @commands.slash_command()
     async def set_ref(self, ctx, character_name: str = "default"):
@@ -44,28 +79,83 @@ class ReferenceImages(commands.Cog):
             return message.author == ctx.author and message.channel == ctx.author.dm_channel and len(message.attachments) > 0
         try:
             message = await self.bot.wait_for("message", check=check, timeout=60.0)
-            image_url = message.attachments[0].url
-            # Download the image
-            response = requests.get(image_url)
-            if response.status_code != 200:
-                await ctx.author.send("Failed to download the image.")
+            attachment = message.attachments[0]
+            if attachment.size > MAX_IMAGE_BYTES:
+                await ctx.author.send(f"That image is too big! The limit is {MAX_IMAGE_BYTES // (1024 * 1024)} MB.")
                 return
-            image_data = response.content
-            # Upload to imgbb
-            files = {'image': ('image.png', io.BytesIO(image_data))}
-            payload = {'key': IMGBB_API_KEY}
-            r = requests.post('https://api.imgbb.com/1/upload', files=files, data=payload)
-            if r.status_code != 200:
-                await ctx.author.send("Failed to upload the image to imgbb.")
-                return
-            imgbb_url = r.json()['data']['url']
-            # Store the URL in the JSON file
+
+            # Download the image once to a temporary file and work on it from there,
+            # so it is never held in memory
+            with tempfile.NamedTemporaryFile(prefix='ref-', delete=False) as image:
+                path = image.name
+            output_path = path + OUTPUT_EXTENSION
+            thumbnail_path = path + ".thumb" + OUTPUT_EXTENSION
+            try:
+                try:
+                    with open(path, 'wb') as image:
+                        await http.download(attachment.url, image)
+                except (aiohttp.ClientError, asyncio.TimeoutError, HttpError):
+                    await ctx.author.send("Failed to download the image.")
+                    return
+
+                original_size = os.path.getsize(path)
+                digest = await image_pipeline.hash_file(path)
+                stored = image_hashes.get(digest)
+                if stored:
+                    # Same file as an earlier upload; reuse it
+                    image_pipeline.duplicates += 1
+                    report = "You've uploaded this image before, so I reused the stored copy."
+                else:
+                    try:
+                        result = await image_pipeline.process(path, output_path, thumbnail_path)
+                    except Exception as e:
+                        image_pipeline.failures += 1
+                        print(f"Error processing reference image: {e}")
+                        await ctx.author.send("I couldn't read that file as an image.")
+                        return
+
+                    # Keep the original if it is already small and re-encoding didn't help
+                    name, extension = os.path.splitext(attachment.filename or 'image.png')
+                    upload_path = output_path
+                    if result["resized"] or os.path.getsize(output_path) < original_size:
+                        extension = OUTPUT_EXTENSION
+                    else:
+                        upload_path = path
+                    upload_size = os.path.getsize(upload_path)
+                    try:
+                        url, thumbnail = await asyncio.gather(
+                            storage.store(upload_path, name + extension),
+                            storage.store(thumbnail_path, name + "-thumb" + OUTPUT_EXTENSION),
+                        )
+                    except (aiohttp.ClientError, asyncio.TimeoutError, HttpError, OSError) as e:
+                        print(f"Error storing reference image with {storage.name}: {e}")
+                        await ctx.author.send("Failed to store the image.")
+                        return
+
+                    stored = {"url": url, "thumbnail": thumbnail}
+                    image_hashes[digest] = stored
+                    image_store.mark_dirty(digest)
+                    image_pipeline.record(original_size, upload_size, result["ms"])
+                    saved = original_size - upload_size
+                    report = f"{megabytes(original_size)} → {megabytes(upload_size)} ({saved / original_size:.0%} smaller), processed in {result['ms']:.0f} ms."
+                    print(f"Reference image {digest[:12]}: {original_size} -> {upload_size} bytes in {result['ms']:.0f} ms")
+            finally:
+                for temporary in (path, output_path, thumbnail_path):
+                    if os.path.exists(temporary):
+                        os.remove(temporary)
+
+            # Store the locator, and index its URL for /ref
             user_id = str(ctx.author.id)
             if user_id not in reference_data:
                 reference_data[user_id] = {}
-            reference_data[user_id][character_name] = imgbb_url
-            save_references()
-            await ctx.author.send(f"Reference image for {character_name} has been set!")
+            reference_data[user_id][character_name] = stored["url"]
+            save_references(user_id)
+            self.ref_index[(user_id, character_name)] = resolve_url(stored["url"])
+
+            embed = discord.Embed(title="Reference Set", description=f"Reference image for {character_name} has been set!", color=discord.Color.green())
+            embed.set_thumbnail(url=resolve_url(stored["thumbnail"]))
+            embed.set_footer(text=report)
+            await ctx.author.send(embed=embed)
         except Exception as e:
             await ctx.author.send(f"An error occurred: {e}")
 
@@ -73,14 +163,32 @@ class ReferenceImages(commands.Cog):
     async def ref(self, ctx, character_name: str = "default"):
         """Retrieve the reference image for a character."""
         user_id = str(ctx.author.id)
-        if user_id in reference_data and character_name in reference_data[user_id]:
-            img_url = reference_data[user_id][character_name]
+        img_url = self.ref_index.get((user_id, character_name))
+        if img_url:
             embed = discord.Embed(title=f"Reference for {character_name}", color=discord.Color.blue())
             embed.set_image(url=img_url)
             await ctx.respond(embed=embed)
         else:
             await ctx.respond(f"No reference image found for {character_name}.")
 
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def ref_stats(self, ctx):
+        """Show reference image processing statistics."""
+        pipeline = image_pipeline
+        saved = pipeline.bytes_in - pipeline.bytes_out
+        average_ms = pipeline.total_ms / pipeline.processed if pipeline.processed else 0.0
+
+        embed = discord.Embed(title="Reference Image Stats", color=discord.Color.blue())
+        embed.add_field(name="Processed", value=str(pipeline.processed), inline=True)
+        embed.add_field(name="Duplicates Reused", value=str(pipeline.duplicates), inline=True)
+        embed.add_field(name="Failed", value=str(pipeline.failures), inline=True)
+        embed.add_field(name="Bytes", value=f"{megabytes(pipeline.bytes_in)} in, {megabytes(pipeline.bytes_out)} stored ({megabytes(saved)} saved)", inline=False)
+        embed.add_field(name="Processing Time", value=f"avg {average_ms:.0f} ms", inline=True)
+        embed.add_field(name="Known Images", value=str(len(image_hashes)), inline=True)
+        embed.add_field(name="Storage", value=storage.name, inline=True)
+        await ctx.respond(embed=embed, ephemeral=True)
+
 # Add the cog to the bot
 async def setup(bot):
     await bot.add_cog(ReferenceImages(bot))
\ No newline at end of file
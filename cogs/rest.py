@@ -0,0 +1,204 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import discord
+from discord.ext import commands
+import asyncio
+import time
+from collections import deque
+
+# Requests allowed per route: route -> (requests, per seconds). Buckets are kept
+# per route and major ID (guild or channel), like Discord's own rate limits.
+ROUTE_LIMITS = {
+    "member_roles": (10, 1.0),
+    "moderation": (5, 1.0),
+    "channel_rename": (2, 600.0),  # Discord only allows 2 renames per channel every 10 minutes
+    "message_edit": (5, 5.0),
+    "reactions": (4, 1.0),
+}
+DEFAULT_ROUTE_LIMIT = (5, 1.0)
+
+# Priority lanes, served in this order
+MODERATION = 0
+NORMAL = 1
+COSMETIC = 2
+LANE_NAMES = {MODERATION: "moderation", NORMAL: "normal", COSMETIC: "cosmetic"}
+
+# Concurrent REST calls made by the write scheduler
+SCHEDULER_WORKERS = 4
+
+# Queued jobs per lane looked at when the head of the lane is rate limited
+SCAN_DEPTH = 32
+
+class TokenBucket:
+    """Allows `rate` requests every `per` seconds, with bursts of up to `rate`."""
+
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available."""
+        self.refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.fill_rate
+
+    def try_take(self):
+        if self.delay():
+            return False
+        self.tokens -= 1
+        return True
+
+# Route, major ID -> TokenBucket
+route_buckets = {}
+
+def route_bucket(route, major_id=None):
+    key = (route, major_id)
+    if key not in route_buckets:
+        route_buckets[key] = TokenBucket(*ROUTE_LIMITS.get(route, DEFAULT_ROUTE_LIMIT))
+    return route_buckets[key]
+
+def retrieve_exception(future):
+    # Callers may schedule a write and never await it; don't warn about unretrieved errors
+    if not future.cancelled():
+        future.exception()
+
+class WriteJob:
+    __slots__ = ('key', 'bucket', 'lane', 'factory', 'futures', 'delayed')
+
+    def __init__(self, key, bucket, lane, factory):
+        self.key = key
+        self.bucket = bucket
+        self.lane = lane
+        self.factory = factory  # Zero-argument callable returning the REST coroutine
+        self.futures = []
+        self.delayed = False
+
+class WriteScheduler:
+    """Central queue for REST writes with per-route token buckets and priority lanes.
+
+    Writes sharing a key (e.g. renames of one channel) are merged while they wait:
+    only the newest one is sent and every caller gets its result.
+    """
+
+    def __init__(self):
+        self.lanes = {lane: deque() for lane in LANE_NAMES}
+        self.pending = {}  # Key -> job that has not been sent yet
+        self.wakeup = asyncio.Event()
+        self.workers = []
+        self.issued = 0
+        self.merged = 0
+        self.delayed = 0
+        self.failed = 0
+
+    def schedule(self, factory, route, major_id=None, key=None, lane=NORMAL):
+        """Queue a write and return a future for its result without waiting for it."""
+        self.start_workers()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(retrieve_exception)
+
+        job = self.pending.get(key) if key is not None else None
+        if job:
+            job.factory = factory
+            self.merged += 1
+        else:
+            job = WriteJob(key, route_bucket(route, major_id), lane, factory)
+            if key is not None:
+                self.pending[key] = job
+            self.lanes[lane].append(job)
+            self.wakeup.set()
+        job.futures.append(future)
+        return future
+
+    async def submit(self, factory, route, major_id=None, key=None, lane=NORMAL):
+        """Queue a write and wait for its result."""
+        return await self.schedule(factory, route, major_id, key, lane)
+
+    def start_workers(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self.worker()) for _ in range(SCHEDULER_WORKERS)]
+
+    def stop_workers(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+    def queued(self):
+        return sum(len(jobs) for jobs in self.lanes.values())
+
+    def next_job(self):
+        """Take the first sendable job from the highest priority lane, or return how long to wait."""
+        wait = None
+        for lane in LANE_NAMES:
+            jobs = self.lanes[lane]
+            for index in range(min(len(jobs), SCAN_DEPTH)):
+                job = jobs[index]
+                if job.bucket.try_take():
+                    del jobs[index]
+                    if self.pending.get(job.key) is job:
+                        del self.pending[job.key]
+                    return job, None
+                if not job.delayed:
+                    job.delayed = True
+                    self.delayed += 1
+                delay = job.bucket.delay()
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    async def worker(self):
+        while True:
+            job, wait = self.next_job()
+            if not job:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.issued += 1
+            try:
+                result = await job.factory()
+            except Exception as e:
+                self.failed += 1
+                print(f"Error in scheduled REST write: {e}")
+                for future in job.futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in job.futures:
+                    if not future.done():
+                        future.set_result(result)
+
+# Shared scheduler every cog sends its REST writes through
+rest_scheduler = WriteScheduler()
+
+class Rest(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    def cog_unload(self):
+        rest_scheduler.stop_workers()
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def rest_stats(self, ctx):
+        """Show REST write scheduler statistics."""
+        embed = discord.Embed(title="REST Write Stats", color=discord.Color.blue())
+        embed.add_field(name="Issued", value=str(rest_scheduler.issued), inline=True)
+        embed.add_field(name="Merged", value=str(rest_scheduler.merged), inline=True)
+        embed.add_field(name="Delayed", value=str(rest_scheduler.delayed), inline=True)
+        embed.add_field(name="Failed", value=str(rest_scheduler.failed), inline=True)
+        queued = ", ".join(f"{name} {len(rest_scheduler.lanes[lane])}" for lane, name in LANE_NAMES.items())
+        embed.add_field(name="Queued", value=queued, inline=False)
+        await ctx.respond(embed=embed, ephemeral=True)
+
+def setup(bot):
+    bot.add_cog(Rest(bot))
@@ -1,51 +1,115 @@
 import discord
-from discord.ext import commands, tasks
-import asyncio
+from discord.ext import commands
+from functools import partial
+from cogs.persistence import persistence
+from cogs.rest import rest_scheduler, COSMETIC
 
 MEMBER_COUNT_CHANNEL_ID = 1361718381069205752
-BOT_COUNT_CHANNEL_ID = 1361717535938052176 
+BOT_COUNT_CHANNEL_ID = 1361717535938052176
 BOOSTS_COUNT_CHANNEL_ID = 1361718731495178431
 
+# Channel names for each stat
+STAT_NAMES = {
+    "members": "𝗠𝗘𝗠𝗕𝗘𝗥 𝗖𝗢𝗨𝗡𝗧 - {}",
+    "bots": "𝗕𝗢𝗧 𝗖𝗢𝗨𝗡𝗧 - {}",
+    "boosts": "𝗦𝗘𝗥𝗩𝗘𝗥 𝗕𝗢𝗢𝗦𝗧𝗦 - {}",
+}
+
+# Per-guild stats channel configuration: guild ID -> {stat: channel ID}
+stats_store = persistence.register('stats_channels')
+stats_config = stats_store.data
+if not stats_config:
+    # Start out with the channels this bot has always used
+    stats_config["1349813029809688616"] = {
+        "members": MEMBER_COUNT_CHANNEL_ID,
+        "bots": BOT_COUNT_CHANNEL_ID,
+        "boosts": BOOSTS_COUNT_CHANNEL_ID,
+    }
+    stats_store.mark_dirty("1349813029809688616")
+
 class StatsChannels(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.update_stats.start()  # Start the birthday check task
+        self.counts = {}  # Guild ID -> {stat: value}
+        self.published = {}  # Channel ID -> last name sent
 
-    @commands.slash_command()
-    @commands.has_role("STAFF")
-    async def force_reload_stats(self, ctx):
-        """Force reload all stats channels immediately"""
-        await ctx.defer()
-        await self.update_stats()
-        await ctx.respond("Stats channels have been force reloaded!", ephemeral=True)
+    def count_guild(self, guild):
+        """Count everything from scratch. Only needed on startup; events keep it current after that."""
+        self.counts[guild.id] = {
+            "members": guild.member_count or len(guild.members),
+            "bots": sum(1 for member in guild.members if member.bot),
+            "boosts": guild.premium_subscription_count,
+        }
+
+    def publish(self, guild):
+        """Rename the guild's stats channels whose value has changed."""
+        config = stats_config.get(str(guild.id))
+        counts = self.counts.get(guild.id)
+        if not config or not counts:
+            return
+        for stat, channel_id in config.items():
+            channel = guild.get_channel(channel_id)
+            if not channel:
+                continue
+            name = STAT_NAMES[stat].format(counts[stat])
+            if self.published.get(channel_id, channel.name) == name:
+                continue
+            self.published[channel_id] = name
+            # Renames of the same channel still waiting for their rate limit are merged
+            rest_scheduler.schedule(partial(channel.edit, name=name), "channel_rename", channel.id, key=("rename", channel.id), lane=COSMETIC)
 
-    @tasks.loop(minutes=5)  # Update every 5 minutes
-    async def update_stats(self):
-        # Get the guild (server) - adjust the guild ID if needed
-        guild = self.bot.get_guild(1349813029809688616)  # Replace with your guild ID
-        if not guild:
+    def adjust(self, guild, stat, delta):
+        if str(guild.id) not in stats_config or guild.id not in self.counts:
             return
+        self.counts[guild.id][stat] += delta
+        self.publish(guild)
 
-        # Update member count
-        member_count_channel = guild.get_channel(MEMBER_COUNT_CHANNEL_ID)
-        if member_count_channel:
-            await member_count_channel.edit(name=f"𝗠𝗘𝗠𝗕𝗘𝗥 𝗖𝗢𝗨𝗡𝗧 - {guild.member_count}")
+    @commands.Cog.listener()
+    async def on_ready(self):
+        for guild_id in stats_config:
+            guild = self.bot.get_guild(int(guild_id))
+            if guild:
+                self.count_guild(guild)
+                self.publish(guild)
 
-        # Update bot count
-        bot_count = sum(1 for member in guild.members if member.bot)
-        bot_count_channel = guild.get_channel(BOT_COUNT_CHANNEL_ID)
-        if bot_count_channel:
-            await bot_count_channel.edit(name=f"𝗕𝗢𝗧 𝗖𝗢𝗨𝗡𝗧 - {bot_count}")
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.adjust(member.guild, "members", 1)
+        if member.bot:
+            self.adjust(member.guild, "bots", 1)
 
-        # Update boosts count
-        boosts_count = guild.premium_subscription_count
-        boosts_count_channel = guild.get_channel(BOOSTS_COUNT_CHANNEL_ID)
-        if boosts_count_channel:
-            await boosts_count_channel.edit(name=f"𝗦𝗘𝗥𝗩𝗘𝗥 𝗕𝗢𝗢𝗦𝗧𝗦 - {boosts_count}")
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.adjust(member.guild, "members", -1)
+        if member.bot:
+            self.adjust(member.guild, "bots", -1)
 
-    @update_stats.before_loop
-    async def before_update_stats(self):
-        await self.bot.wait_until_ready()
+    @commands.Cog.listener()
+    async def on_guild_update(self, before, after):
+        if before.premium_subscription_count != after.premium_subscription_count and after.id in self.counts:
+            self.counts[after.id]["boosts"] = after.premium_subscription_count
+            self.publish(after)
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def stats_channel(self, ctx, stat: discord.Option(str, "Stat to show", choices=list(STAT_NAMES)), channel: discord.abc.GuildChannel):
+        """Choose the channel that shows one of this server's stats"""
+        guild_id = str(ctx.guild.id)
+        stats_config.setdefault(guild_id, {})[stat] = channel.id
+        stats_store.mark_dirty(guild_id)
+        if ctx.guild.id not in self.counts:
+            self.count_guild(ctx.guild)
+        self.publish(ctx.guild)
+        await ctx.respond(f"{channel.mention} will now show the {stat} count.", ephemeral=True)
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def force_reload_stats(self, ctx):
+        """Force reload all stats channels immediately"""
+        await ctx.defer()
+        self.count_guild(ctx.guild)
+        self.publish(ctx.guild)
+        await ctx.respond("Stats channels have been force reloaded!", ephemeral=True)
 
 def setup(bot):
-    bot.add_cog(StatsChannels(bot))
\ No newline at end of file
+    bot.add_cog(StatsChannels(bot))
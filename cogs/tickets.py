@@ -1,11 +1,11 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import os
-import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
-import html
-import re
+import time
+from cogs.persistence import persistence
+from cogs.transcripts import write_transcript, ArchiveWriter, ARCHIVE_DIR, index_ticket, search_tickets
 
 # Configuration
 TICKET_CATEGORY_ID = 1367688975828914236
@@ -15,12 +15,111 @@ TICKET_LOG_CHANNEL = 1361718840488104157
 TICKET_CHANNEL_ID = 1361717310166929640
 STAFF_NOTIFICATION_CHANNEL = 1361694388346163360
 
+# Closed tickets are dropped from the live store after this long; the archive keeps them searchable
+CLOSED_TICKET_RETENTION_DAYS = 90
+
+class TicketStore:
+    """Tickets keyed by ticket ID, with indexes for the lookups the cog makes.
+
+    A ticket's ID is its channel ID, so finding the ticket for a channel is a
+    single dict lookup. Open tickets are indexed by user, and every user keeps
+    a history of their tickets until the closed ones age out.
+    """
+
+    def __init__(self):
+        self.store = persistence.register('tickets', legacy_file='tickets.json')
+        self.tickets = self.store.data
+        self.reload()
+        self.store.subscribe(self.reload)
+
+    def reload(self):
+        """Rebuild the indexes from the stored tickets, migrating any legacy entries first."""
+        self.open_by_user = {}  # User ID -> ticket ID of their open ticket
+        self.history = {}  # User ID -> ticket IDs, oldest first
+        self.migrate_legacy()
+        for ticket_id, ticket in self.tickets.items():
+            self.index(ticket_id, ticket)
+
+    def migrate_legacy(self):
+        """Re-key tickets saved as user ID -> ticket (one ticket per user) by ticket ID."""
+        legacy = [(user_id, ticket) for user_id, ticket in self.tickets.items() if "user_id" not in ticket]
+        for user_id, ticket in legacy:
+            del self.tickets[user_id]
+            self.store.mark_dirty(user_id)
+            ticket_id = str(ticket["channel_id"])
+            self.tickets[ticket_id] = {**ticket, "user_id": user_id, "closed_at": None}
+            self.store.mark_dirty(ticket_id)
+        if legacy:
+            print(f"Migrated {len(legacy)} tickets to the indexed ticket store")
+
+    def index(self, ticket_id, ticket):
+        self.history.setdefault(ticket["user_id"], []).append(ticket_id)
+        if ticket["open"]:
+            self.open_by_user[ticket["user_id"]] = ticket_id
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def get(self, channel_id):
+        """The ticket for a channel, or None."""
+        return self.tickets.get(str(channel_id))
+
+    def open_ticket(self, user_id):
+        """The user's open ticket, or None."""
+        ticket_id = self.open_by_user.get(user_id)
+        return self.tickets[ticket_id] if ticket_id else None
+
+    def open_tickets(self):
+        return [self.tickets[ticket_id] for ticket_id in self.open_by_user.values()]
+
+    def user_history(self, user_id):
+        return [self.tickets[ticket_id] for ticket_id in self.history.get(user_id, ())]
+
+    def create(self, user_id, channel_id, reason):
+        ticket_id = str(channel_id)
+        ticket = {
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "open": True,
+            "created_at": datetime.now().isoformat(),
+            "closed_at": None,
+            "reason": reason
+        }
+        self.tickets[ticket_id] = ticket
+        self.index(ticket_id, ticket)
+        self.store.mark_dirty(ticket_id)
+        return ticket
+
+    def close(self, ticket, closed_at=None):
+        ticket["open"] = False
+        ticket["closed_at"] = closed_at or datetime.now().isoformat()
+        if self.open_by_user.get(ticket["user_id"]) == str(ticket["channel_id"]):
+            del self.open_by_user[ticket["user_id"]]
+        self.store.mark_dirty(str(ticket["channel_id"]))
+
+    def compact(self, now=None):
+        """Drop closed tickets older than the retention period. Returns how many were dropped."""
+        cutoff = ((now or datetime.now()) - timedelta(days=CLOSED_TICKET_RETENTION_DAYS)).isoformat()
+        expired = [
+            ticket_id for ticket_id, ticket in self.tickets.items()
+            if not ticket["open"] and (ticket["closed_at"] or ticket["created_at"]) < cutoff
+        ]
+        for ticket_id in expired:
+            ticket = self.tickets.pop(ticket_id)
+            history = self.history[ticket["user_id"]]
+            history.remove(ticket_id)
+            if not history:
+                del self.history[ticket["user_id"]]
+            self.store.mark_dirty(ticket_id)
+        return len(expired)
+
 class TicketButton(discord.ui.Button):
     def __init__(self):
         super().__init__(
             label="Create Ticket",
             style=discord.ButtonStyle.green,
-            emoji="🎫"
+            emoji="🎫",
+            custom_id="create_ticket_button"
         )
 
     async def callback(self, interaction: discord.Interaction):
@@ -32,18 +131,16 @@ class TicketButton(discord.ui.Button):
 
         # Check if user already has an open ticket
         user_id = str(interaction.user.id)
-        if user_id in cog.ticket_data:
-            ticket = cog.ticket_data[user_id]
-            if ticket.get("open", False):
-                # Verify the channel still exists
-                channel = interaction.guild.get_channel(ticket["channel_id"])
-                if channel:
-                    await interaction.response.send_message("You already have an open ticket!", ephemeral=True)
-                    return
-                else:
-                    # Channel doesn't exist, clean up the data
-                    del cog.ticket_data[user_id]
-                    cog.save_ticket_data()
+        ticket = cog.tickets.open_ticket(user_id)
+        if ticket:
+            # Verify the channel still exists
+            channel = interaction.guild.get_channel(ticket["channel_id"])
+            if channel:
+                await interaction.response.send_message("You already have an open ticket!", ephemeral=True)
+                return
+            else:
+                # Channel doesn't exist, close the stale ticket
+                cog.tickets.close(ticket)
 
         # Create ticket channel
         category = interaction.guild.get_channel(TICKET_CATEGORY_ID)
@@ -72,13 +169,7 @@ class TicketButton(discord.ui.Button):
         )
 
         # Store ticket data
-        cog.ticket_data[user_id] = {
-            "channel_id": ticket_channel.id,
-            "open": True,
-            "created_at": datetime.now().isoformat(),
-            "reason": "Created via button"
-        }
-        cog.save_ticket_data()
+        cog.tickets.create(user_id, ticket_channel.id, "Created via button")
 
         # Send initial message with delete button
         embed = discord.Embed(
@@ -90,10 +181,7 @@ class TicketButton(discord.ui.Button):
         embed.add_field(name="Created At", value=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         embed.set_footer(text="Click the button below to close this ticket")
 
-        view = discord.ui.View()
-        view.add_item(DeleteTicketButton())
-
-        await ticket_channel.send(embed=embed, view=view)
+        await ticket_channel.send(embed=embed, view=TicketView())
         await interaction.response.send_message(f"Ticket created! {ticket_channel.mention}", ephemeral=True)
 
         # Ping staff in notification channel
@@ -131,87 +219,91 @@ class TicketView(discord.ui.View):
         super().__init__(timeout=None)
         self.add_item(DeleteTicketButton())
 
+class TicketPanelView(discord.ui.View):
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(TicketButton())
+
 class Tickets(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.ticket_data = {}
-        self.load_ticket_data()
+        self.tickets = TicketStore()
+        self.panel_store = persistence.register('ticket_panel')
+        self.closing = set()  # Channel IDs of tickets whose transcript is being written
         self.setup_done = False
         
         # Create logs directory if it doesn't exist
         os.makedirs(TICKET_LOGS_DIR, exist_ok=True)
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
         print("Tickets cog initialized!")
 
+    def cog_unload(self):
+        self.compact_tickets.cancel()
+        self.tickets.store.unsubscribe(self.tickets.reload)
+
     @commands.Cog.listener()
     async def on_ready(self):
         """Called when the bot is ready"""
         if not self.setup_done:
             print("Bot is ready, setting up ticket system...")
+            start = time.perf_counter()
+            # Persistent views keep the buttons on existing messages working across restarts
             self.bot.add_view(TicketView())
+            self.bot.add_view(TicketPanelView())
             await self.cleanup_stale_tickets()
+            if not self.compact_tickets.is_running():
+                self.compact_tickets.start()
             await self.setup_ticket_channel()
             self.setup_done = True
+            print(f"Ticket system ready in {(time.perf_counter() - start) * 1000:.0f} ms")
 
     async def cleanup_stale_tickets(self):
-        """Clean up any stale ticket data where channels no longer exist"""
-        stale_tickets = []
-        for user_id, data in self.ticket_data.items():
-            if data.get("open", False):
-                # Get the guild and channel
-                for guild in self.bot.guilds:
-                    channel = guild.get_channel(data["channel_id"])
-                    if not channel:
-                        stale_tickets.append(user_id)
-                        break
-
-        # Remove stale tickets
-        for user_id in stale_tickets:
-            del self.ticket_data[user_id]
-        
+        """Close any open tickets whose channels no longer exist"""
+        stale_tickets = [ticket for ticket in self.tickets.open_tickets() if not self.bot.get_channel(ticket["channel_id"])]
+        for ticket in stale_tickets:
+            self.tickets.close(ticket)
+
         if stale_tickets:
-            self.save_ticket_data()
             print(f"Cleaned up {len(stale_tickets)} stale tickets")
 
-    def load_ticket_data(self):
-        try:
-            with open('tickets.json', 'r') as f:
-                self.ticket_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.ticket_data = {}
-            self.save_ticket_data()  # Create the file if it doesn't exist
-
-    def save_ticket_data(self):
-        with open('tickets.json', 'w') as f:
-            json.dump(self.ticket_data, f, indent=4)
+    @tasks.loop(hours=24)
+    async def compact_tickets(self):
+        """Drop closed tickets past the retention period from the live store"""
+        dropped = self.tickets.compact()
+        if dropped:
+            print(f"Compacted {dropped} closed tickets older than {CLOSED_TICKET_RETENTION_DAYS} days")
 
     async def setup_ticket_channel(self):
-        """Set up the ticket creation embed in the ticket channel"""
-        print(f"Attempting to setup ticket channel with ID: {TICKET_CHANNEL_ID}")
+        """Make sure the ticket creation embed is in the ticket channel, posting it only if it's missing"""
         channel = self.bot.get_channel(TICKET_CHANNEL_ID)
         if not channel:
             print(f"Ticket channel not found! ID: {TICKET_CHANNEL_ID}")
             return
-        print(f"Found ticket channel: {channel.name}")
 
-        # Delete any existing messages in the channel
-        try:
-            messages = [message async for message in channel.history(limit=None)]
-            if messages:  # Only try to delete if there are messages
-                print(f"Found {len(messages)} messages to clear")
+        panel_id = self.panel_store.data.get(str(channel.id))
+        if panel_id:
+            try:
+                await channel.fetch_message(panel_id)
+                print("Ticket creation embed already posted")
+                return
+            except discord.NotFound:
+                print("Ticket creation embed is missing, reposting it")
+            except discord.HTTPException as e:
+                print(f"Error checking ticket creation embed: {e}")
+                return
+        else:
+            # No panel on record yet: clear out the ones earlier versions posted on every boot
+            try:
                 await channel.purge(limit=None)
-                print(f"Cleared {len(messages)} messages from application channel")
-            else:
-                print("No messages to clear in application channel")
-        except discord.Forbidden:
-            print("No permission to delete messages in application channel!")
-            return
-        except Exception as e:
-            print(f"Error clearing messages: {e}")
-            # Continue anyway, we'll try to post the embed
+            except discord.Forbidden:
+                print("No permission to delete messages in ticket channel!")
+                return
+            except Exception as e:
+                print(f"Error clearing messages: {e}")
+                # Continue anyway, we'll try to post the embed
 
         # Create and send the ticket creation embed
         try:
-            print("Creating ticket creation embed...")
             embed = discord.Embed(
                 title="🎫 Support Tickets",
                 description="Is some fur is ruining your party? Need help with something?\nClick the button below to create a support ticket!",
@@ -224,16 +316,12 @@ class Tickets(commands.Cog):
             )
             embed.set_footer(text="We'll get back to you as soon as we can!")
 
-            view = discord.ui.View(timeout=None)
-            view.add_item(TicketButton())
-
-            print("Sending ticket creation embed...")
-            await channel.send(embed=embed, view=view)
+            message = await channel.send(embed=embed, view=TicketPanelView())
+            self.panel_store.data[str(channel.id)] = message.id
+            self.panel_store.mark_dirty(str(channel.id))
             print("Ticket creation embed posted successfully!")
         except Exception as e:
             print(f"Error posting ticket embed: {e}")
-            print(f"Error type: {type(e)}")
-            print(f"Error details: {str(e)}")
 
     @commands.command()
     @commands.has_role("STAFF")
@@ -250,23 +338,29 @@ class Tickets(commands.Cog):
             send_message = ctx_or_interaction.send
 
         # Find the ticket
-        ticket = None
-        for user_id, data in self.ticket_data.items():
-            if data["channel_id"] == channel.id and data["open"]:
-                ticket = data
-                ticket_user_id = user_id
-                break
-
-        if not ticket:
+        ticket = self.tickets.get(channel.id)
+        if not ticket or not ticket["open"]:
             await send_message("This is not a valid ticket channel!", ephemeral=True)
             return
+        if channel.id in self.closing:
+            await send_message("This ticket is already being closed.", ephemeral=True)
+            return
+        ticket_user_id = ticket["user_id"]
 
-        # Create transcript
-        transcript_path = await self.create_transcript(channel, ticket_user_id, ticket["reason"])
+        # Create transcript, and only close the ticket once it is saved so a failure can be retried
+        closed_at = datetime.now().isoformat()
+        self.closing.add(channel.id)
+        try:
+            transcript_path = await self.create_transcript(channel, ticket, closed_at)
+        except Exception as e:
+            print(f"Error creating transcript for {channel.name}: {e}")
+            await send_message("Couldn't save the transcript, so the ticket is still open. Please try again.", ephemeral=True)
+            return
+        finally:
+            self.closing.discard(channel.id)
 
         # Close the ticket
-        self.ticket_data[ticket_user_id]["open"] = False
-        self.save_ticket_data()
+        self.tickets.close(ticket, closed_at)
 
         # Send closing message
         await send_message("Ticket closed! Creating transcript...")
@@ -295,88 +389,60 @@ class Tickets(commands.Cog):
         await asyncio.sleep(2)
         await channel.delete()
 
-    async def create_transcript(self, channel, user_id, reason):
-        # Get all messages
-        messages = []
-        async for message in channel.history(limit=None, oldest_first=True):
-            messages.append(message)
-
-        # Create HTML transcript
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Ticket Transcript - {channel.name}</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                .message {{ margin: 10px 0; padding: 10px; border-radius: 5px; }}
-                .user {{ font-weight: bold; }}
-                .timestamp {{ color: #666; font-size: 0.8em; }}
-                .content {{ margin-top: 5px; }}
-                .embed {{ background: #2f3136; padding: 10px; border-radius: 5px; margin: 5px 0; }}
-                .embed-title {{ color: #fff; font-weight: bold; }}
-                .embed-description {{ color: #dcddde; }}
-                .embed-field {{ margin: 5px 0; }}
-                .embed-field-name {{ color: #fff; font-weight: bold; }}
-                .embed-field-value {{ color: #dcddde; }}
-            </style>
-        </head>
-        <body>
-            <h1>Ticket Transcript</h1>
-            <p><strong>Channel:</strong> {channel.name}</p>
-            <p><strong>User ID:</strong> {user_id}</p>
-            <p><strong>Reason:</strong> {reason}</p>
-            <p><strong>Created:</strong> {self.ticket_data[user_id]['created_at']}</p>
-            <hr>
-        """
-
-        for message in messages:
-            # Escape HTML in content
-            content = html.escape(message.content)
-            
-            # Convert mentions to readable text
-            content = re.sub(r'<@!?(\d+)>', lambda m: f'@{self.bot.get_user(int(m.group(1))).name}', content)
-            content = re.sub(r'<#(\d+)>', lambda m: f'#{self.bot.get_channel(int(m.group(1))).name}', content)
-            content = re.sub(r'<@&(\d+)>', lambda m: f'@{message.guild.get_role(int(m.group(1))).name}', content)
-
-            html_content += f"""
-            <div class="message">
-                <div class="user">{message.author.name}</div>
-                <div class="timestamp">{message.created_at.strftime('%Y-%m-%d %H:%M:%S')}</div>
-                <div class="content">{content}</div>
-            """
-
-            # Handle embeds
-            for embed in message.embeds:
-                html_content += '<div class="embed">'
-                if embed.title:
-                    html_content += f'<div class="embed-title">{html.escape(embed.title)}</div>'
-                if embed.description:
-                    html_content += f'<div class="embed-description">{html.escape(embed.description)}</div>'
-                for field in embed.fields:
-                    html_content += f'''
-                    <div class="embed-field">
-                        <div class="embed-field-name">{html.escape(field.name)}</div>
-                        <div class="embed-field-value">{html.escape(field.value)}</div>
-                    </div>
-                    '''
-                html_content += '</div>'
-
-            # Handle attachments
-            for attachment in message.attachments:
-                html_content += f'<div class="attachment"><a href="{attachment.url}">{attachment.filename}</a></div>'
-
-            html_content += '</div>'
-
-        html_content += """
-        </body>
-        </html>
-        """
-
-        # Save transcript
+    async def create_transcript(self, channel, ticket, closed_at):
+        # Save transcript, archiving a compressed copy in the same pass
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{TICKET_LOGS_DIR}/ticket_{channel.name}_{timestamp}.html"
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        user_id = ticket["user_id"]
+        reason = ticket["reason"]
+        created_at = ticket["created_at"]
+        archive = ArchiveWriter(f"{ARCHIVE_DIR}/ticket_{channel.id}.jsonl.gz", {
+            "channel": channel.name,
+            "user_id": user_id,
+            "reason": reason,
+            "created_at": created_at,
+            "closed_at": closed_at,
+        })
+        try:
+            await write_transcript(self.bot, channel, filename, user_id, reason, created_at, archive)
+        finally:
+            archive.close()
+        await index_ticket(channel.id, archive)
+        return filename
+
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def ticket_history(self, ctx, user: discord.User):
+        """Show the tickets a user has opened"""
+        history = self.tickets.user_history(str(user.id))
+        if not history:
+            await ctx.respond(f"{user.mention} has no tickets on record.", ephemeral=True)
+            return
+
+        embed = discord.Embed(title=f"Tickets for {user.name}", color=discord.Color.blue())
+        for ticket in history[-10:]:
+            status = "Open" if ticket["open"] else f"Closed {(ticket['closed_at'] or ticket['created_at'])[:10]}"
+            embed.add_field(
+                name=f"Opened {ticket['created_at'][:10]}",
+                value=f"{status} • <#{ticket['channel_id']}>\n{ticket['reason']}",
+                inline=False
+            )
+        await ctx.respond(embed=embed, ephemeral=True)
 
-        return filename
\ No newline at end of file
+    @commands.slash_command()
+    @commands.has_role("STAFF")
+    async def ticket_search(self, ctx, text: str = None, user: discord.User = None, date: discord.Option(str, "Day a message was sent (YYYY-MM-DD)", required=False, default=None) = None):
+        """Search archived tickets by words, participant and date"""
+        results = await search_tickets(text, user.id if user else None, date)
+        if not results:
+            await ctx.respond("No archived tickets match that search.", ephemeral=True)
+            return
+
+        embed = discord.Embed(title="Ticket Search", color=discord.Color.blue())
+        for ticket_id, channel_name, ticket_user_id, closed_at, message_count, path in results:
+            embed.add_field(
+                name=f"{channel_name} (closed {closed_at[:10]})",
+                value=f"Opened by <@{ticket_user_id}> • {message_count} messages\n`{path}`",
+                inline=False
+            )
+        await ctx.respond(embed=embed, ephemeral=True)
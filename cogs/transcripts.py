@@ -0,0 +1,280 @@
+#***************************************************************************#
+# FloofBot
+#***************************************************************************#
+
+import asyncio
+import gzip
+import html
+import json
+import re
+from cogs.database import database
+
+# Messages rendered before they are handed to a worker thread to be written
+WRITE_BATCH_MESSAGES = 1000
+
+HEADER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Ticket Transcript - {channel}</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; margin: 20px; }}
+        .message {{ margin: 10px 0; padding: 10px; border-radius: 5px; }}
+        .user {{ font-weight: bold; }}
+        .timestamp {{ color: #666; font-size: 0.8em; }}
+        .content {{ margin-top: 5px; }}
+        .embed {{ background: #2f3136; padding: 10px; border-radius: 5px; margin: 5px 0; }}
+        .embed-title {{ color: #fff; font-weight: bold; }}
+        .embed-description {{ color: #dcddde; }}
+        .embed-field {{ margin: 5px 0; }}
+        .embed-field-name {{ color: #fff; font-weight: bold; }}
+        .embed-field-value {{ color: #dcddde; }}
+    </style>
+</head>
+<body>
+    <h1>Ticket Transcript</h1>
+    <p><strong>Channel:</strong> {channel}</p>
+    <p><strong>User ID:</strong> {user_id}</p>
+    <p><strong>Reason:</strong> {reason}</p>
+    <p><strong>Created:</strong> {created_at}</p>
+    <hr>
+"""
+MESSAGE_TEMPLATE = """    <div class="message">
+        <div class="user">{author}</div>
+        <div class="timestamp">{timestamp}</div>
+        <div class="content">{content}</div>
+"""
+EMBED_TITLE_TEMPLATE = '        <div class="embed-title">{}</div>\n'
+EMBED_DESCRIPTION_TEMPLATE = '        <div class="embed-description">{}</div>\n'
+EMBED_FIELD_TEMPLATE = """        <div class="embed-field">
+            <div class="embed-field-name">{}</div>
+            <div class="embed-field-value">{}</div>
+        </div>
+"""
+ATTACHMENT_TEMPLATE = '        <div class="attachment"><a href="{}">{}</a></div>\n'
+FOOTER = """</body>
+</html>
+"""
+
+# Compressed JSONL copies of closed tickets
+ARCHIVE_DIR = "staff-logs/archive"
+
+# Words that go into the search index
+WORD_PATTERN = re.compile(r"\w{2,}")
+
+# Tickets returned by a search
+SEARCH_LIMIT = 10
+
+# Archived tickets and the inverted index over their words ("w:"), authors ("u:") and dates ("d:")
+database.executescript_sync("""
+CREATE TABLE IF NOT EXISTS ticket_archive (
+    ticket_id INTEGER PRIMARY KEY,
+    channel_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    reason TEXT,
+    created_at TEXT,
+    closed_at TEXT NOT NULL,
+    path TEXT NOT NULL,
+    message_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ticket_terms (
+    term TEXT NOT NULL,
+    ticket_id INTEGER NOT NULL,
+    PRIMARY KEY (term, ticket_id)
+) WITHOUT ROWID;
+""")
+
+def word_terms(text):
+    return {f"w:{word.lower()}" for word in WORD_PATTERN.findall(text or "")}
+
+# User, channel and role mentions, matched after the content has been HTML-escaped
+MENTION_PATTERN = re.compile(r'&lt;(@!?|@&amp;|#)(\d+)&gt;')
+
+class MentionResolver:
+    """Turns mentions into readable names, looking each entity up once per transcript."""
+
+    def __init__(self, bot, guild):
+        self.bot = bot
+        self.guild = guild
+        self.cache = {}  # Escaped mention -> replacement
+        self.authors = {}  # Author ID -> escaped name
+
+    def lookup(self, kind, entity_id):
+        if kind == '#':
+            channel = self.guild.get_channel(entity_id) or self.bot.get_channel(entity_id)
+            return f"#{channel.name}" if channel else "#deleted-channel"
+        if kind == '@&amp;':
+            role = self.guild.get_role(entity_id)
+            return f"@{role.name}" if role else "@deleted-role"
+        user = self.guild.get_member(entity_id) or self.bot.get_user(entity_id)
+        return f"@{user.name}" if user else "@unknown-user"
+
+    def replace(self, match):
+        mention = match.group()
+        replacement = self.cache.get(mention)
+        if replacement is None:
+            replacement = self.cache[mention] = html.escape(self.lookup(match.group(1), int(match.group(2))))
+        return replacement
+
+    def render(self, content):
+        content = html.escape(content)
+        return MENTION_PATTERN.sub(self.replace, content) if '&lt;' in content else content
+
+    def author(self, user):
+        name = self.authors.get(user.id)
+        if name is None:
+            name = self.authors[user.id] = html.escape(user.name)
+        return name
+
+def render_message(message, resolver):
+    parts = [MESSAGE_TEMPLATE.format(
+        author=resolver.author(message.author),
+        # Same text as strftime('%Y-%m-%d %H:%M:%S'), without its per-call cost
+        timestamp=message.created_at.isoformat(' ', 'seconds')[:19],
+        content=resolver.render(message.content),
+    )]
+
+    # Handle embeds
+    for embed in message.embeds:
+        parts.append('        <div class="embed">\n')
+        if embed.title:
+            parts.append(EMBED_TITLE_TEMPLATE.format(html.escape(embed.title)))
+        if embed.description:
+            parts.append(EMBED_DESCRIPTION_TEMPLATE.format(html.escape(embed.description)))
+        for field in embed.fields:
+            parts.append(EMBED_FIELD_TEMPLATE.format(html.escape(field.name), html.escape(field.value)))
+        parts.append('        </div>\n')
+
+    # Handle attachments
+    for attachment in message.attachments:
+        parts.append(ATTACHMENT_TEMPLATE.format(html.escape(attachment.url), html.escape(attachment.filename)))
+
+    parts.append('    </div>\n')
+    return ''.join(parts)
+
+class ArchiveWriter:
+    """Writes a ticket as gzipped JSONL (metadata line, then one line per message) and collects its search terms.
+
+    write_message only encodes the line; `take` hands the pending lines to
+    whoever writes them, so the compression can run off the event loop.
+    """
+
+    def __init__(self, path, metadata):
+        self.path = path
+        self.metadata = metadata
+        self.terms = word_terms(metadata.get("reason")) | {f"u:{metadata['user_id']}"}
+        self.message_count = 0
+        self.pending = []
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self.file.write(json.dumps({"type": "ticket", **metadata}) + "\n")
+
+    def write_message(self, message):
+        record = {
+            "type": "message",
+            "id": message.id,
+            "author_id": message.author.id,
+            "author": message.author.name,
+            "created_at": message.created_at.isoformat(),
+            "content": message.content,
+            "embeds": [{"title": embed.title, "description": embed.description, "fields": [[field.name, field.value] for field in embed.fields]} for embed in message.embeds],
+            "attachments": [attachment.url for attachment in message.attachments],
+        }
+        self.pending.append(json.dumps(record) + "\n")
+        self.message_count += 1
+
+        self.terms |= word_terms(message.content)
+        for embed in message.embeds:
+            self.terms |= word_terms(embed.title) | word_terms(embed.description)
+        self.terms.add(f"u:{message.author.id}")
+        self.terms.add(f"d:{message.created_at.date().isoformat()}")
+
+    def take(self):
+        """The lines encoded since the last call, joined."""
+        lines = ''.join(self.pending)
+        self.pending = []
+        return lines
+
+    def write(self, lines):
+        self.file.write(lines)
+
+    def close(self):
+        self.write(self.take())
+        self.file.close()
+
+async def index_ticket(ticket_id, archive):
+    """Add a closed ticket to the archive table and the search index."""
+    metadata = archive.metadata
+    await database.transaction([
+        ("INSERT OR REPLACE INTO ticket_archive (ticket_id, channel_name, user_id, reason, created_at, closed_at, path, message_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+         [(ticket_id, metadata["channel"], metadata["user_id"], metadata.get("reason"), metadata.get("created_at"), metadata["closed_at"], archive.path, archive.message_count)]),
+        ("INSERT OR IGNORE INTO ticket_terms (term, ticket_id) VALUES (?, ?)", [(term, ticket_id) for term in archive.terms]),
+    ])
+
+async def search_tickets(text=None, user_id=None, day=None, limit=SEARCH_LIMIT):
+    """Archived tickets matching every given word, user and date, newest first."""
+    terms = word_terms(text)
+    if user_id:
+        terms.add(f"u:{user_id}")
+    if day:
+        terms.add(f"d:{day}")
+    if not terms:
+        return []
+    placeholders = ", ".join("?" for _ in terms)
+    return await database.execute(
+        f"""SELECT a.ticket_id, a.channel_name, a.user_id, a.closed_at, a.message_count, a.path
+        FROM ticket_archive a JOIN (
+            SELECT ticket_id FROM ticket_terms WHERE term IN ({placeholders})
+            GROUP BY ticket_id HAVING COUNT(*) = ?
+        ) m ON m.ticket_id = a.ticket_id
+        ORDER BY a.closed_at DESC LIMIT ?""",
+        (*terms, len(terms), limit),
+    )
+
+async def write_transcript(bot, channel, path, user_id, reason, created_at, archive=None):
+    """Stream a channel's history into an HTML transcript, WRITE_BATCH_MESSAGES at a time.
+
+    Messages are rendered as channel.history yields them, so memory use does not
+    grow with the length of the ticket. Each batch is written, and compressed into
+    `archive` if one is given, on a worker thread while the next one renders.
+    Returns the number of messages written.
+    """
+    loop = asyncio.get_running_loop()
+    resolver = MentionResolver(bot, channel.guild)
+    count = 0
+    batch = []
+    writing = None  # The previous batch's write
+
+    with open(path, 'w', encoding='utf-8') as f:
+        def write_batch(rendered, archived):
+            f.write(rendered)
+            if archive:
+                archive.write(archived)
+
+        async def flush(final=False):
+            nonlocal batch, writing
+            if writing:
+                await writing
+            rendered = ''.join(batch) + (FOOTER if final else '')
+            writing = loop.run_in_executor(None, write_batch, rendered, archive.take() if archive else '')
+            batch = []
+
+        f.write(HEADER_TEMPLATE.format(
+            channel=html.escape(channel.name),
+            user_id=html.escape(str(user_id)),
+            reason=html.escape(str(reason)),
+            created_at=html.escape(str(created_at)),
+        ))
+        try:
+            async for message in channel.history(limit=None, oldest_first=True):
+                batch.append(render_message(message, resolver))
+                if archive:
+                    archive.write_message(message)
+                count += 1
+                if len(batch) >= WRITE_BATCH_MESSAGES:
+                    await flush()
+            await flush(final=True)
+            await writing
+        finally:
+            # The file closes when this block exits, so no write may still be running
+            if writing and not writing.done():
+                await asyncio.wait([writing])
+    return count
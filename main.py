@@ -7,57 +7,68 @@ import os
 import platform
 import discord
 
-from cogs.base import Base
-from cogs.fun import Fun
-from cogs.moderation import Moderation
-from cogs.leveling import Leveling
-from cogs.activity import Activity
-from cogs.birthday import Birthday
-from cogs.reference_sheets import ReferenceImages
-from cogs.music import Music
-from cogs.stats_channels import StatsChannels
-from cogs.tickets import Tickets
-from cogs.crowd_control import CrowdControl
-
 from discord.ext import tasks
 from discord.ext import commands
 
-#Intents
-intents = discord.Intents.all()
+# Image worker processes import this file as well; only the bot process imports
+# the cogs (which open the database and load their data) and connects to Discord
+if __name__ == "__main__":
+  from cogs.persistence import Persistence
+  from cogs.ingest import Ingest
+  from cogs.rest import Rest
+  from cogs.http import Http
+  from cogs.base import Base
+  from cogs.fun import Fun
+  from cogs.moderation import Moderation
+  from cogs.leveling import Leveling
+  from cogs.activity import Activity
+  from cogs.birthday import Birthday
+  from cogs.reference_sheets import ReferenceImages
+  from cogs.music import Music
+  from cogs.stats_channels import StatsChannels
+  from cogs.tickets import Tickets
+  from cogs.crowd_control import CrowdControl
+
+  #Intents
+  intents = discord.Intents.all()
 
-#Define Client
-bot = commands.Bot(description="FloofBot", command_prefix=commands.when_mentioned_or("/"), intents=intents, activity=discord.Game(name='Fursuit Games'))
+  #Define Client
+  bot = commands.Bot(description="FloofBot", command_prefix=commands.when_mentioned_or("/"), intents=intents, activity=discord.Game(name='Fursuit Games'))
 
-@bot.event
-async def on_ready():
-  memberCount = len(set(bot.get_all_members()))
-  serverCount = len(bot.guilds)
+  @bot.event
+  async def on_ready():
+    memberCount = len(set(bot.get_all_members()))
+    serverCount = len(bot.guilds)
   
 
-  print("                                                                ")
-  print("################################################################") 
-  print(f"Floof Bot                                                      ")
-  print("################################################################") 
-  print("Running as: " + bot.user.name + "#" + bot.user.discriminator)
-  print(f'With Client ID: {bot.user.id}')
-  print("\nBuilt With:")
-  print("Python " + platform.python_version())
-  print("Py-Cord " + discord.__version__)
-
-
-#Boot Cogs
-bot.add_cog(Base(bot))
-bot.add_cog(Fun(bot))
-bot.add_cog(Moderation(bot))
-bot.add_cog(Leveling(bot))
-bot.add_cog(Activity(bot))
-bot.add_cog(Birthday(bot))
-bot.add_cog(ReferenceImages(bot))
-bot.add_cog(Music(bot))
-bot.add_cog(StatsChannels(bot))
-bot.add_cog(Tickets(bot))
-bot.add_cog(CrowdControl(bot)) 
-
-#Run Bot
-TOKEN = os.environ.get("FLOOF_TOKEN")
-bot.run(TOKEN)
\ No newline at end of file
+    print("                                                                ")
+    print("################################################################") 
+    print(f"Floof Bot                                                      ")
+    print("################################################################") 
+    print("Running as: " + bot.user.name + "#" + bot.user.discriminator)
+    print(f'With Client ID: {bot.user.id}')
+    print("\nBuilt With:")
+    print("Python " + platform.python_version())
+    print("Py-Cord " + discord.__version__)
+
+
+  #Boot Cogs
+  bot.add_cog(Persistence(bot))
+  bot.add_cog(Ingest(bot))
+  bot.add_cog(Rest(bot))
+  bot.add_cog(Http(bot))
+  bot.add_cog(Base(bot))
+  bot.add_cog(Fun(bot))
+  bot.add_cog(Moderation(bot))
+  bot.add_cog(Leveling(bot))
+  bot.add_cog(Activity(bot))
+  bot.add_cog(Birthday(bot))
+  bot.add_cog(ReferenceImages(bot))
+  bot.add_cog(Music(bot))
+  bot.add_cog(StatsChannels(bot))
+  bot.add_cog(Tickets(bot))
+  bot.add_cog(CrowdControl(bot)) 
+
+  #Run Bot
+  TOKEN = os.environ.get("FLOOF_TOKEN")
+  bot.run(TOKEN)
\ No newline at end of file
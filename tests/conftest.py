@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The cogs open floofbot.db and create their data folders in the working
+# directory when they are imported; keep the test run's copies out of the checkout
+os.chdir(tempfile.mkdtemp(prefix="floofbot-tests-"))
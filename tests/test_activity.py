@@ -0,0 +1,33 @@
+import asyncio
+
+import cogs.activity as activity
+from cogs.activity import Activity, ActivityCounter, activity_data
+
+
+class Bot:
+    async def wait_until_ready(self):
+        await asyncio.Event().wait()
+
+
+def test_cleanup_removes_expired_users_from_rankings(monkeypatch):
+    async def run():
+        cog = Activity(Bot())
+        try:
+            guild = activity_data.setdefault("cleanup-guild", {})
+            guild["u"] = ActivityCounter(100)
+            guild["u"].record(100)
+            guild["v"] = ActivityCounter(129)
+            guild["v"].record(129)
+            windows = cog.get_windows("cleanup-guild", 129)
+
+            monkeypatch.setattr(activity, "day_number", lambda timestamp=None: 130)
+            await cog.cleanup_activity()
+            windows.roll(130)
+
+            assert set(guild) == {"v"}
+            assert windows.rankings[30].scores == {"v": (1,)}
+            assert all("u" not in users for users in windows.active_users.values())
+        finally:
+            cog.cog_unload()
+
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import cogs.audio_cache
+from cogs.audio_cache import AudioCache, PLAY_COUNT_RETENTION_DAYS
+
+
+def test_prune_drops_stale_and_excess_play_counts(tmp_path, monkeypatch):
+    cache = AudioCache(directory=str(tmp_path))
+    cache.entries.clear()
+    now = time.time()
+    old = now - (PLAY_COUNT_RETENTION_DAYS + 1) * 86400
+    cache.entries.update({
+        "stale": {"plays": 2, "file": None, "last_played": old},
+        "cached": {"plays": 9, "file": "cached.abc.opus", "last_played": old},
+        "recent1": {"plays": 1, "file": None, "last_played": now - 30},
+        "recent2": {"plays": 1, "file": None, "last_played": now - 20},
+        "recent3": {"plays": 1, "file": None, "last_played": now - 10},
+    })
+    monkeypatch.setattr(cogs.audio_cache, "MAX_PLAY_COUNTS", 2)
+
+    assert cache.prune(now) == 2
+    # Cached tracks keep their counts; of the rest only the two most recently played stay
+    assert set(cache.entries) == {"cached", "recent2", "recent3"}
+    assert cache.pruned == 2
+
+
+def test_populate_sends_the_stream_headers_to_ffmpeg(tmp_path, monkeypatch):
+    calls = []
+
+    class Process:
+        returncode = 1
+
+        async def communicate(self):
+            return b"", b"stopped by the test"
+
+    async def create_subprocess_exec(*args, **kwargs):
+        calls.append(args)
+        return Process()
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", create_subprocess_exec)
+    cogs.audio_cache.audio_cache.entries.clear()  # The store is shared by every AudioCache
+    cache = AudioCache(directory=str(tmp_path))
+    stream = {"url": "https://example.com/a", "acodec": "opus", "http_headers": {"User-Agent": "Mozilla/5.0", "Referer": "https://example.com"}}
+    asyncio.run(cache.populate("a", stream))
+
+    args = calls[0]
+    assert args[args.index("-headers") + 1] == "User-Agent: Mozilla/5.0\r\nReferer: https://example.com\r\n"
+    assert args.index("-headers") < args.index("-i")
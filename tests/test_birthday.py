@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import discord
+import pytz
+
+from cogs.birthday import Birthday, BIRTHDAY_CHANNEL_ID, birthday_data, birthday_state
+
+NEW_YORK = pytz.timezone('America/New_York')
+
+
+class Channel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append(content)
+
+
+class Bot:
+    def __init__(self):
+        self.channel = Channel()
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_user(self, user_id):
+        return SimpleNamespace(mention=f"<@{user_id}>")
+
+    def get_channel(self, channel_id):
+        return self.channel if channel_id == BIRTHDAY_CHANNEL_ID else None
+
+
+class Clock:
+    """Simulated clock: every sleep the scheduler asks for waits until the test advances time."""
+
+    def __init__(self, start):
+        self.time = start
+        self.sleeps = asyncio.Queue()
+
+    def now(self):
+        return self.time
+
+    async def sleep(self, seconds):
+        done = asyncio.get_running_loop().create_future()
+        await self.sleeps.put((seconds, done))
+        await done
+
+    async def next_sleep(self):
+        """Seconds the scheduler went to sleep for, once it has."""
+        seconds, self.pending = await asyncio.wait_for(self.sleeps.get(), 1)
+        return seconds
+
+    def advance(self, seconds):
+        self.time += timedelta(seconds=seconds)
+        self.pending.set_result(None)
+
+
+def run_scheduler(birthdays, start, scenario, state=None, send=None):
+    """Run the scheduler on a simulated clock, handing `scenario(clock, channel)` control."""
+    birthday_data.clear()
+    birthday_data.update(birthdays)
+    birthday_state.clear()
+    birthday_state.update(state or {})
+
+    async def run():
+        clock = Clock(start)
+        bot = Bot()
+        if send:
+            bot.channel.send = send
+        cog = Birthday(bot, now=clock.now, sleep=clock.sleep)
+        try:
+            await scenario(clock, bot.channel.sent)
+        finally:
+            cog.cog_unload()
+
+    asyncio.run(run())
+
+
+def test_announces_at_local_midnight():
+    async def scenario(clock, sent):
+        # 8 PM the evening before, so midnight is four hours away
+        assert await clock.next_sleep() == 4 * 3600
+        assert sent == []
+        clock.advance(4 * 3600)
+        next_year = await clock.next_sleep()
+        assert sent == ["🎉 Happy Birthday <@1>! 🎉"]
+        assert next_year == 366 * 86400  # 2024 is a leap year
+
+    start = NEW_YORK.localize(datetime(2023, 3, 14, 20, 0))
+    run_scheduler({"1": {"date": "03-15", "timezone": "America/New_York"}}, start, scenario)
+
+
+def test_catches_up_after_restart():
+    async def scenario(clock, sent):
+        await clock.next_sleep()
+        # Missed while offline, so belated; 2 was announced before the bot went down
+        assert sent == ["🎉 Happy belated Birthday <@1>! 🎉"]
+
+    last_checked = NEW_YORK.localize(datetime(2023, 3, 15, 0, 30)).timestamp()
+    start = NEW_YORK.localize(datetime(2023, 3, 17, 12, 0))
+    birthdays = {
+        "1": {"date": "03-16", "timezone": "America/New_York"},
+        "2": {"date": "03-15", "timezone": "America/New_York"},
+    }
+    run_scheduler(birthdays, start, scenario, state={"last_checked": last_checked})
+
+
+def test_leap_day_birthday_on_feb_28_in_other_years():
+    async def scenario(clock, sent):
+        assert await clock.next_sleep() == 12 * 3600
+        clock.advance(12 * 3600)
+        # Feb 28 2025 -> Feb 28 2026
+        assert await clock.next_sleep() == 365 * 86400
+        assert sent == ["🎉 Happy Birthday <@1>! 🎉"]
+        clock.advance(365 * 86400)
+        # Feb 28 2026 -> Feb 28 2027 -> Feb 29 2028
+        await clock.next_sleep()
+        clock.advance(365 * 86400)
+        assert await clock.next_sleep() == 366 * 86400
+        assert len(sent) == 3
+
+    start = datetime(2025, 2, 27, 12, 0, tzinfo=pytz.utc)
+    run_scheduler({"1": {"date": "02-29", "timezone": "UTC"}}, start, scenario)
+
+
+def test_failed_announcement_keeps_the_schedule():
+    async def scenario(clock, sent):
+        await clock.next_sleep()
+        clock.advance(86400)
+        # The send failed, but the user is still scheduled for next year
+        assert await clock.next_sleep() == 365 * 86400
+        assert sent == []
+
+    async def forbidden(content):
+        raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Permissions")
+
+    start = datetime(2025, 6, 1, 0, 0, tzinfo=pytz.utc)
+    run_scheduler({"1": {"date": "06-02", "timezone": "UTC"}}, start, scenario, send=forbidden)
+
+
+def test_legacy_rows_with_impossible_days_are_skipped():
+    async def scenario(clock, sent):
+        await clock.next_sleep()
+        clock.advance(86400)
+        await clock.next_sleep()
+        # The Feb 30 and Apr 31 rows are skipped; everyone else is still announced
+        assert sent == ["🎉 Happy Birthday <@1>! 🎉"]
+
+    start = datetime(2025, 6, 1, 0, 0, tzinfo=pytz.utc)
+    birthdays = {
+        "1": {"date": "06-02", "timezone": "UTC"},
+        "2": "2023-02-30",
+        "3": "2023-04-31",
+    }
+    run_scheduler(birthdays, start, scenario)
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from cogs.http import HttpClient, HttpError, HTTP_MAX_RETRY_AFTER
+
+
+async def serve(replies):
+    """Local server answering each request with the next (status, headers) in `replies`."""
+    requests = []
+
+    async def handle(request):
+        requests.append(time.perf_counter())
+        status, headers = replies[min(len(requests), len(replies)) - 1]
+        return web.Response(status=status, headers=headers, text="ok")
+
+    app = web.Application()
+    app.router.add_get('/', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/", requests
+
+
+async def get(client, url):
+    async def handle(response):
+        return await response.text()
+
+    return await client.request('GET', url, handle)
+
+
+def test_retry_after_is_honoured():
+    async def run():
+        runner, url, requests = await serve([(429, {"Retry-After": "0.3"}), (200, {})])
+        client = HttpClient()
+        try:
+            assert await get(client, url) == "ok"
+        finally:
+            await client.close()
+            await runner.cleanup()
+        assert len(requests) == 2
+        assert requests[1] - requests[0] >= 0.3
+        assert client.retries == 1
+
+    asyncio.run(run())
+
+
+def test_retry_after_too_long_fails_at_once():
+    async def run():
+        runner, url, requests = await serve([(429, {"Retry-After": str(HTTP_MAX_RETRY_AFTER + 1)})])
+        client = HttpClient()
+        try:
+            with pytest.raises(HttpError) as error:
+                await get(client, url)
+        finally:
+            await client.close()
+            await runner.cleanup()
+        assert error.value.status == 429
+        assert error.value.retry_after == HTTP_MAX_RETRY_AFTER + 1
+        assert len(requests) == 1
+
+    asyncio.run(run())
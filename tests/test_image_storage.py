@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+import aiohttp
+from PIL import Image
+
+from cogs import image_storage
+from cogs.image_storage import LocalBackend, LOCAL_PREFIX, select_backend
+
+def write_image(tmp_path):
+    path = tmp_path / "upload.webp"
+    Image.new("RGB", (4, 4), "blue").save(path, "WEBP")
+    return str(path)
+
+
+def served_files(directory):
+    return sorted(os.path.relpath(os.path.join(root, name), directory)
+                  for root, _, names in os.walk(directory) for name in names)
+
+
+async def serve(tmp_path, scenario):
+    """Run `scenario(backend, session)` against a local backend on a free port."""
+    backend = LocalBackend(directory=str(tmp_path / "store"), base_url="http://unused", host="127.0.0.1", port=0)
+    await backend.start()
+    backend.base_url = f"http://127.0.0.1:{backend.port}"
+    try:
+        async with aiohttp.ClientSession() as session:
+            await scenario(backend, session)
+    finally:
+        await backend.stop()
+
+
+def test_stored_file_is_served_back(tmp_path):
+    source = write_image(tmp_path)
+
+    async def scenario(backend, session):
+        locator = await backend.store(source, "Ref Sheet.WEBP")
+        assert locator.startswith(LOCAL_PREFIX) and locator.endswith(".webp")
+        async with session.get(backend.url(locator)) as response:
+            assert response.status == 200
+            assert response.headers["Content-Type"] == "image/webp"
+            assert "immutable" in response.headers["Cache-Control"]
+            assert await response.read() == open(source, "rb").read()
+
+    asyncio.run(serve(tmp_path, scenario))
+
+
+def test_keys_outside_the_layout_are_not_found(tmp_path):
+    async def scenario(backend, session):
+        with open(os.path.join(backend.directory, "secret.txt"), "w") as f:
+            f.write("not an image")
+        for key in ("secret.txt", "../upload.webp", "ab/not-a-digest.webp", f"ab/{'a' * 64}.webp"):
+            async with session.get(f"{backend.base_url}/{key}") as response:
+                assert response.status == 404, key
+
+    write_image(tmp_path)
+    asyncio.run(serve(tmp_path, scenario))
+
+
+def test_concurrent_stores_of_one_image_keep_one_copy(tmp_path):
+    source = write_image(tmp_path)
+
+    async def scenario(backend, session):
+        locators = await asyncio.gather(*(backend.store(source, "ref.webp") for _ in range(8)))
+        assert len(set(locators)) == 1
+        # No partial files left behind by the stores that lost the race
+        assert served_files(backend.directory) == [locators[0][len(LOCAL_PREFIX):]]
+
+    asyncio.run(serve(tmp_path, scenario))
+
+
+def test_unusable_backend_settings_fall_back_to_imgbb(monkeypatch):
+    assert select_backend("lcoal").name == "imgbb"
+
+    monkeypatch.setattr(image_storage, "LOCAL_IMAGE_BASE_URL", None)
+    assert select_backend("local").name == "imgbb"
+
+    monkeypatch.setattr(image_storage, "LOCAL_IMAGE_BASE_URL", "https://images.example.com")
+    assert select_backend("local").name == "local"
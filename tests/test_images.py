@@ -0,0 +1,24 @@
+import asyncio
+
+from PIL import Image
+
+from cogs.images import ImagePipeline, MAX_IMAGE_DIMENSION, THUMBNAIL_SIZE, IMAGE_START_METHOD, OUTPUT_EXTENSION
+
+
+def test_pipeline_downscales_in_worker_processes(tmp_path):
+    source = tmp_path / "sheet.png"
+    Image.new("RGBA", (MAX_IMAGE_DIMENSION * 2, MAX_IMAGE_DIMENSION), (200, 120, 40, 255)).save(source)
+    output = tmp_path / f"sheet{OUTPUT_EXTENSION}"
+    thumbnail = tmp_path / f"sheet.thumb{OUTPUT_EXTENSION}"
+
+    pipeline = ImagePipeline(workers=1)
+    try:
+        result = asyncio.run(pipeline.process(str(source), str(output), str(thumbnail)))
+        assert pipeline.pool._mp_context.get_start_method() == IMAGE_START_METHOD != "fork"
+    finally:
+        pipeline.shutdown()
+
+    assert result["resized"]
+    assert (result["width"], result["height"]) == (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION // 2)
+    with Image.open(thumbnail) as image:
+        assert max(image.size) == max(THUMBNAIL_SIZE)
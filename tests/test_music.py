@@ -0,0 +1,217 @@
+import asyncio
+import shlex
+import time
+from types import SimpleNamespace
+
+import cogs.music as music
+from cogs.music import Music, IDLE_TIMEOUT
+from cogs.player import Track
+
+# How long resolving a stream that isn't cached yet takes
+EXTRACT_DELAY = 0.2
+
+
+class Extractor:
+    """Stands in for yt-dlp: slow the first time a stream is looked up, instant after that."""
+
+    def __init__(self):
+        self.streams = {}
+
+    async def search(self, guild_id, query, options, limit=5):
+        return [{"id": query, "title": query, "duration": 1}]
+
+    def has_stream(self, video_id):
+        return video_id in self.streams
+
+    async def stream_info(self, guild_id, video_id, options):
+        if video_id not in self.streams:
+            await asyncio.sleep(EXTRACT_DELAY)
+            self.streams[video_id] = {"id": video_id, "url": f"https://example.com/{video_id}", "duration": 1, "acodec": "opus", "http_headers": {}}
+        return self.streams[video_id]
+
+    def forget_stream(self, video_id):
+        self.streams.pop(video_id, None)
+
+
+class VoiceClient:
+    def __init__(self):
+        self.playing = asyncio.Queue()
+        self.after = None
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    async def disconnect(self, force=False):
+        self.connected = False
+
+    def play(self, source, after=None):
+        self.after = after
+        self.playing.put_nowait(source)
+
+    def finish(self):
+        """End the current track the way the audio thread does."""
+        self.after(None)
+
+
+def patch_music(monkeypatch):
+    monkeypatch.setattr(music, "extractor", Extractor())
+    monkeypatch.setattr(music.audio_cache, "max_bytes", 0)
+
+    async def probe(self, stream):
+        return True
+
+    async def audio_source(self, stream):
+        return SimpleNamespace(url=stream["url"])
+
+    monkeypatch.setattr(Music, "probe", probe)
+    monkeypatch.setattr(Music, "audio_source", audio_source)
+
+
+async def play_through(monkeypatch, prefetch_tracks):
+    """Play three queued tracks back to back and return the cog."""
+    patch_music(monkeypatch)
+    monkeypatch.setattr(music, "PREFETCH_TRACKS", prefetch_tracks)
+
+    bot = SimpleNamespace(loop=asyncio.get_running_loop())
+    cog = Music(bot)
+    try:
+        guild = SimpleNamespace(id=1, get_channel=lambda channel_id: None)
+        player = cog.get_player(guild.id)
+        player.voice_client = VoiceClient()
+        for video_id in ("a", "b", "c"):
+            player.enqueue(Track(video_id, video_id, 1, 42))
+
+        await cog.play_next(guild)
+        for _ in range(2):
+            await player.voice_client.playing.get()
+            # Let the prefetch run while the track plays
+            await asyncio.sleep(2 * EXTRACT_DELAY)
+            player.voice_client.finish()
+        await asyncio.wait_for(player.voice_client.playing.get(), 1)
+        return cog
+    finally:
+        cog.cog_unload()
+
+
+def test_prefetch_makes_transitions_gapless(monkeypatch):
+    cog = asyncio.run(play_through(monkeypatch, prefetch_tracks=2))
+    assert cog.transitions == 2
+    assert cog.prefetch_hits == 2
+    assert cog.max_gap_ms < EXTRACT_DELAY * 1000 / 4
+
+
+def test_gap_without_prefetch_is_the_extraction_time(monkeypatch):
+    cog = asyncio.run(play_through(monkeypatch, prefetch_tracks=0))
+    assert cog.transitions == 2
+    assert cog.prefetch_hits == 0
+    assert cog.max_gap_ms >= EXTRACT_DELAY * 1000
+
+
+class Response:
+    def __init__(self):
+        self.embeds = []
+
+    async def edit_original_response(self, embed=None, view=None):
+        self.embeds.append(embed)
+
+
+async def play_command(monkeypatch, while_choosing):
+    """Run /play on a guild whose player has been idle past the timeout, calling `while_choosing(cog)` during the selection."""
+    patch_music(monkeypatch)
+    connections = []
+
+    async def connect():
+        connections.append(VoiceClient())
+        return connections[-1]
+
+    author = SimpleNamespace(id=42, voice=SimpleNamespace(channel=SimpleNamespace(connect=connect)))
+
+    async def wait_for(event, check=None, timeout=None):
+        await while_choosing(cog)
+        return SimpleNamespace(user=author, data={"component_type": 3, "values": ["0"]})
+
+    response = Response()
+
+    async def respond(embed=None):
+        return response
+
+    bot = SimpleNamespace(loop=asyncio.get_running_loop(), wait_for=wait_for, get_guild=lambda guild_id: None)
+    cog = Music(bot)
+    try:
+        guild = SimpleNamespace(id=1, get_channel=lambda channel_id: None)
+        player = cog.get_player(guild.id)
+        player.voice_client = await connect()
+        player.idle_since = time.monotonic() - IDLE_TIMEOUT - 1
+
+        ctx = SimpleNamespace(author=author, guild=guild, channel=SimpleNamespace(id=5), respond=respond)
+        await Music.play.callback(cog, ctx, "a")
+        return cog, connections, response
+    finally:
+        cog.cog_unload()
+
+
+def test_reaper_leaves_a_player_alone_during_play(monkeypatch):
+    async def reap(cog):
+        await cog.reap_idle_players()
+
+    cog, connections, response = asyncio.run(play_command(monkeypatch, reap))
+    assert cog.reaped == 0
+    assert len(connections) == 1 and connections[0].connected
+    assert connections[0].playing.qsize() == 1
+    assert cog.players[1].commands == 0
+    assert "starting playback" in response.embeds[-1].description
+
+
+def test_play_reconnects_after_a_disconnect_during_selection(monkeypatch):
+    async def disconnect(cog):
+        await cog.disconnect_player(1)
+
+    cog, connections, response = asyncio.run(play_command(monkeypatch, disconnect))
+    assert len(connections) == 2 and not connections[0].connected
+    assert connections[1].playing.qsize() == 1
+    assert cog.players[1].voice_client is connections[1]
+    assert "starting playback" in response.embeds[-1].description
+
+
+def test_audio_source_sends_the_stream_headers_to_ffmpeg(monkeypatch):
+    created = []
+    monkeypatch.setattr(music.discord, "FFmpegOpusAudio", lambda url, **kwargs: created.append(kwargs))
+
+    cog = Music.__new__(Music)
+    cog.passthrough_tracks = cog.transcoded_tracks = 0
+    stream = {"url": "https://example.com/a", "acodec": "opus", "http_headers": {"User-Agent": "Mozilla/5.0 (X11)"}}
+    asyncio.run(cog.audio_source(stream))
+
+    options = shlex.split(created[0]["before_options"])
+    assert options[options.index("-headers") + 1] == "User-Agent: Mozilla/5.0 (X11)\r\n"
+    assert "-reconnect" in options
+
+
+def voice_update(cog, member, before, after):
+    asyncio.run(Music.on_voice_state_update(cog, member, SimpleNamespace(channel=before), SimpleNamespace(channel=after)))
+
+
+def test_moving_the_bot_recounts_listeners_in_the_new_channel():
+    bot_user = SimpleNamespace(id=99, bot=True)
+    listener = SimpleNamespace(id=42, bot=False)
+    empty = SimpleNamespace(members=[bot_user])
+    busy = SimpleNamespace(members=[bot_user, listener])
+    guild = SimpleNamespace(id=1)
+
+    cog = Music.__new__(Music)
+    cog.bot = SimpleNamespace(user=bot_user)
+    cog.players = {}
+    player = cog.get_player(guild.id)
+    player.voice_client = SimpleNamespace(channel=empty)
+    player.alone_since = time.monotonic() - IDLE_TIMEOUT
+
+    # Moved in with a listener: no longer alone
+    member = SimpleNamespace(id=bot_user.id, guild=guild)
+    voice_update(cog, member, empty, busy)
+    assert player.alone_since is None
+
+    # Moved into an empty channel: alone from now, not from before
+    player.voice_client.channel = busy
+    voice_update(cog, member, busy, empty)
+    assert player.alone_since is not None and time.monotonic() - player.alone_since < 1
@@ -0,0 +1,26 @@
+import sqlite3
+
+import pytest
+
+from cogs.database import database
+from cogs.persistence import persistence
+
+
+def test_failed_flush_keeps_rows_dirty(monkeypatch):
+    store = persistence.register('test_failed_flush')
+    store.data['a'] = {'n': 1}
+    store.mark_dirty('a')
+
+    def locked(statements):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(database, 'transaction_sync', locked)
+    with pytest.raises(sqlite3.OperationalError):
+        persistence.flush_now()
+    assert store.dirty_keys == {('a',)}
+    assert persistence.flush_failures == 1
+
+    monkeypatch.undo()
+    persistence.flush_now()
+    assert not store.dirty
+    assert database.execute_sync("SELECT key, value FROM test_failed_flush") == [('a', '{"n":1}')]
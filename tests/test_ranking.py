@@ -0,0 +1,12 @@
+from cogs.ranking import RankIndex
+
+
+def test_around_the_top_of_the_leaderboard():
+    index = RankIndex({"a": (5, 0), "b": (4, 0), "c": (3, 0), "d": (2, 0)})
+    assert [(user_id, rank) for user_id, rank, _ in index.around("a", 2)] == [("a", 1), ("b", 2), ("c", 3)]
+    assert [(user_id, rank) for user_id, rank, _ in index.around("b", 2)] == [("a", 1), ("b", 2), ("c", 3), ("d", 4)]
+
+
+def test_around_keeps_tied_ranks():
+    index = RankIndex({"a": (5, 0), "b": (5, 0), "c": (3, 0)})
+    assert [rank for _, rank, _ in index.around("b", 1)] == [1, 1, 3]
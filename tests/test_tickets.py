@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+from cogs.tickets import Tickets, TicketStore
+
+
+def test_import_rebuilds_ticket_indexes():
+    tickets = TicketStore()
+    tickets.create("1", 100, "before the import")
+
+    # A user-keyed tickets.json from before the indexed store
+    tickets.store.import_json({
+        "2": {"channel_id": 200, "open": True, "created_at": "2024-01-01T00:00:00", "reason": "legacy"},
+    })
+
+    assert tickets.open_ticket("1") is None
+    assert tickets.open_ticket("2")["channel_id"] == 200
+    assert tickets.get(200)["user_id"] == "2"
+    assert tickets.get(200)["closed_at"] is None
+    assert tickets.compact() == 0
+    tickets.store.unsubscribe(tickets.reload)
+
+
+class FailingChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.name = f"ticket-{channel_id}"
+        self.guild = SimpleNamespace()
+        self.reads = 0
+
+    async def history(self, limit=None, oldest_first=True):
+        self.reads += 1
+        raise OSError("No space left on device")
+        yield
+
+
+def test_failed_transcript_leaves_ticket_open():
+    cog = Tickets(SimpleNamespace())
+    ticket = cog.tickets.create("3", 300, "disk full")
+    channel = FailingChannel(300)
+    replies = []
+
+    async def send(content, ephemeral=False):
+        replies.append(content)
+
+    ctx = SimpleNamespace(channel=channel, author=SimpleNamespace(), send=send)
+    for _ in range(2):
+        asyncio.run(cog.close.callback(cog, ctx))
+
+    # Both attempts got as far as the transcript, and neither closed the ticket
+    assert channel.reads == 2
+    assert ticket["open"] and ticket["closed_at"] is None
+    assert cog.tickets.open_ticket("3") is ticket
+    assert cog.closing == set()
+    assert replies == ["Couldn't save the transcript, so the ticket is still open. Please try again."] * 2
+    cog.tickets.store.unsubscribe(cog.tickets.reload)